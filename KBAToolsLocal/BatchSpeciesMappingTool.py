@@ -0,0 +1,310 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      BatchSpeciesMappingTool.py
+# Tool Location:    KBAToolsLocal Toolbox
+# Tool Name:        "Mapping Tool - Batch Species" [SINGLE GROUP LAYER PER SPECIES]
+#
+# Script Created:   2026-10-17
+# Last Updated:     2026-10-17
+# Script Author:    Meg Southee
+# Credits:          © WCS Canada / Meg Southee 2026
+#
+# Purpose:          Runs the "Mapping Tool - Species" logic for a list of species in a single tool invocation.
+#                   Species are selected from the dropdown and/or read from a CSV file of national scientific names
+#                   or speciesid values (first column of the file).
+#                   The map is validated once for the batch, the group layers are added from the empty SpeciesData
+#                   template cached by KBATemplates (shared with the other tools and later batches), and the species
+#                   and their infraspecies are resolved from the taxon hierarchy held by KBAIndexes.
+#                   Each species is added to the map in its own group layer, named as in FullSpeciesMappingTool. The
+#                   group layers are compiled from a plan request for each species by the output plan engine shared
+#                   with the mapping tools (KBAEngine).
+#                   The group layers for the whole batch are planned first (KBAPlanner.OutputPlan) and added to the map
+#                   in a single pass by KBAMapBuilder.
+#                   The output layers are planned from the plan cache (KBAPlanCache) shared with the mapping tool,
+#                   so only the species that haven't been mapped with the current data are counted.
+#                   The species are read as a stream of records (KBAUtils.streamSpeciesRecords) and counted and planned
+#                   a buffer at a time, so the record counts for very long lists of species are never all held at once.
+#                   The map can be zoomed to all the species added in the batch, using the extents in the species
+#                   summary table (KBASummary) so the features behind the definition queries are not read again.
+#                   Each run is timed by KBAProfiler (phases, map builder functions and arcpy calls) and writes a JSON
+#                   timing report to the scratch folder.
+#                   The output layers of the filtered datasets are drawn from the generalized polygons built by the
+#                   "Build Generalized Polygons" tool (KBAGeneralize) at overview scales, and from the original polygons
+#                   at detail scales, unless the full resolution parameter is checked.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import csv
+import itertools
+import sys
+import traceback
+import KBAEngine
+import KBAExceptions
+import KBAGeneralize
+import KBAMapBuilder
+import KBAPlanner
+import KBAProfiler
+import KBATemplates
+import KBAUtils
+
+
+# Define class called Tool
+class Tool:
+    """Create output layers in a single group for each full species (and its infraspecies) in a list of species."""
+
+    # Instantiate the class
+    def __init__(self):
+        pass
+
+    """These functions are called from within the run_tool function."""
+
+    # Define a function to read the species names / speciesid values from the first column of a CSV file
+    # The values are yielded one row at a time, so the file is never held in memory
+    def read_species_csv(csv_file):
+        with open(csv_file, "r", encoding="utf-8-sig", newline="") as species_csv:
+            first_value = True
+
+            for csv_row in csv.reader(species_csv):
+                # Skip empty rows and empty first columns
+                if not csv_row or not csv_row[0].strip():
+                    continue
+
+                # Skip the header row if the file has one
+                if first_value and csv_row[0].strip().lower() in ("speciesid", "national_scientific_name", "species"):
+                    first_value = False
+                    continue
+
+                first_value = False
+                yield csv_row[0].strip()
+
+    # Define a function to warn about a species value that will not be processed (see KBAUtils.fullSpeciesRecords)
+    def skip_species(value, row):
+        if row is None:
+            arcpy.AddWarning("{} is not in the Biotics table and will not be processed.".format(value))
+
+        else:
+            arcpy.AddWarning("{} is not a full species and will not be processed. "
+                             "Use the Infraspecies Mapping Tool instead.".format(row.sci_name))
+
+    # Define a function to run the tool
+    def run_tool(self, parameters, messages):
+
+        # Time the phases of the run, the map builder functions and the arcpy calls (see KBAProfiler)
+        KBAProfiler.startRun("Mapping Tool - Batch Species", arcpy)
+        KBAProfiler.startPhase("setup")
+
+        # # SET VARIABLES FOR THE SCRIPT ...............................................................................
+
+        # Make variables from input parameters defined in .pyt (the last parameter is the search string, which only
+        # fills the species dropdown)
+        # Multivalue list of species from the dropdown menu in tool dialog
+        param_species = parameters[0].values or []
+        arcpy.AddMessage("Species: {}".format("; ".join(param_species)))
+
+        # CSV file of species names or speciesid values
+        param_species_csv = parameters[1].valueAsText
+        arcpy.AddMessage("Species CSV: {}".format(param_species_csv))
+
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_french_name = parameters[2].value
+        arcpy.AddMessage("Use French Name: {}".format(param_french_name))
+
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_zoom = parameters[3].value
+        arcpy.AddMessage("Zoom To Result: {}".format(param_zoom))
+
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_full_resolution = parameters[4].value
+        arcpy.AddMessage("Full Resolution Range Maps: {}".format(param_full_resolution))
+
+        try:
+            # Current ArcPro Project
+            aprx = arcpy.mp.ArcGISProject("CURRENT")
+
+            # Current Active Map in ArcPro Project
+            m = aprx.activeMap
+
+            # clear all selections in the map
+            m.clearSelection()
+
+            # # START ERROR HANDLING TO CHECK THAT THE MAP CONTAINS THE NECESSARY TABLES AND DATA LAYERS ...............
+            # These checks are only done once for the whole batch of species
+            KBAProfiler.startPhase("validation")
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Error Handling Processes...")
+
+            # Check that the map contains the SpeciesData group layer and the required data layers and tables without
+            # active definition queries
+            species_group_lyr = KBAMapBuilder.validateMap(m)
+
+            # Empty copy of the SpeciesData group layer, written to the KBAToolsCache folder the first time it is
+            # used and reused until the SpeciesData layer definitions change
+            new_group_lyr = KBATemplates.readGroupTemplate(species_group_lyr)
+
+            # # END ERROR HANDLING .....................................................................................
+
+            # # START DATA PROCESSING ..................................................................................
+            KBAProfiler.startPhase("species resolution")
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Geoprocessing...")
+
+            # Stream the species from the dropdown and the CSV file as a single sequence of names / speciesid values
+            if not param_species and not param_species_csv:
+                raise KBAExceptions.BatchInputError
+
+            species_values = [value.strip() for value in param_species if value.strip()]
+            requested_count = len(species_values)
+            if param_species_csv:
+                requested_count += sum(1 for value in Tool.read_species_csv(param_species_csv))
+                species_values = itertools.chain(species_values, Tool.read_species_csv(param_species_csv))
+
+            # Show the overall progress of the batch in the tool dialog, first while the species are planned. The
+            # species that are skipped (see Tool.skip_species) are not counted, so the last steps may be skipped
+            arcpy.SetProgressor("step", "Planning species...", 0, requested_count, 1)
+
+            # Look up the Biotics records for the species in the taxon hierarchy as they are read, and keep the full
+            # species records in the order they were requested, without duplicates
+            biotics_records = KBAUtils.fullSpeciesRecords(KBAUtils.streamSpeciesRecords(species_values),
+                                                          Tool.skip_species)
+
+            KBAProfiler.startPhase("output plan")
+            # All the group layers and output layers in the batch are planned first, then added to the TOC in a
+            # single pass
+            output_plan = KBAPlanner.OutputPlan()
+
+            # # PLAN THE OUTPUT GROUP LAYER FOR EACH SPECIES ...........................................................
+            # The species are planned a buffer at a time (KBAUtils.species_buffer_size), so the infraspecies and
+            # record counts are only held for the species in the buffer
+            species_count = 0
+            for record_buffer in KBAUtils.bufferSpeciesRecords(biotics_records):
+                species_count += len(record_buffer)
+
+                # Request a single group layer for each species and its infraspecies (see KBAEngine), using the
+                # naming convention from the single species mapping tool. The infraspecies are read from the taxon
+                # hierarchy for the species in the buffer
+                plan_requests = KBAEngine.resolveRequests([KBAEngine.PlanRequest(row, "single", False,
+                                                                                 param_french_name)
+                                                           for row in record_buffer])
+
+                for plan_request in plan_requests:
+                    arcpy.AddMessage("Species ID: {} ({}).".format(plan_request.record.speciesid,
+                                                                   plan_request.record.sci_name))
+
+                    if plan_request.infraspeciesids:
+                        arcpy.AddMessage("This species has {} infraspecies.".format(len(plan_request.infraspeciesids)))
+
+                # Compile the requests into the output plan, with the point, lines, EO, filtered range / aoo / habitat &
+                # InputPolygon layers that have records. The species that aren't in the plan cache (KBAPlanCache) are
+                # counted in one grouped query per feature class
+                with KBAProfiler.section("record counts"):
+                    KBAEngine.compilePlan(plan_requests, output_plan)
+
+                arcpy.SetProgressorLabel("Planned {} of {} species...".format(species_count, requested_count))
+                arcpy.SetProgressorPosition(min(species_count, requested_count))
+
+            arcpy.AddMessage("Number of species to process: {}".format(species_count))
+
+            # Add a layer of the generalized polygons, at a tolerance that suits the extent of each group layer, next to
+            # the output layers of the filtered datasets for the overview scales (KBAGeneralize), unless only full
+            # resolution is requested
+            if not param_full_resolution:
+                KBAProfiler.startPhase("generalized polygons")
+                generalized_lyrs = KBAGeneralize.generalizePlan(output_plan)
+
+                if generalized_lyrs is None:
+                    arcpy.AddMessage("The generalized polygons have not been built for the current data. "
+                                     "Range maps are drawn at full resolution.")
+                else:
+                    arcpy.AddMessage("{} range map layers are drawn from generalized polygons at overview "
+                                     "scales.".format(len(generalized_lyrs)))
+
+            # # ADD THE PLANNED GROUP LAYERS AND OUTPUT LAYERS TO THE TOC IN A SINGLE PASS ...........................
+            KBAProfiler.startPhase("output layers")
+            group_count = len(output_plan.groups) - len(output_plan.emptyGroups())
+            arcpy.SetProgressor("step", "Adding {} output layers to the map...".format(output_plan.layerCount()), 0,
+                                group_count, 1)
+
+            # Keep processing the rest of the batch if a geoprocessing tool fails for one of the species, and move the
+            # progressor forward as each species is added
+            failed_groups = KBAMapBuilder.applyOutputPlan(m, new_group_lyr, output_plan, True,
+                                                          lambda output_group: arcpy.SetProgressorPosition())
+
+            for output_group in output_plan.emptyGroups():
+                arcpy.AddWarning(output_group.empty_warning)
+
+            for output_group, error_messages in failed_groups:
+                arcpy.AddWarning("{} was not processed.\n{}".format(output_group.name, error_messages))
+
+            mapped_count = len(output_plan.groups) - len(output_plan.emptyGroups()) - len(failed_groups)
+
+            arcpy.ResetProgressor()
+
+            m.clearSelection()  # clear all selections
+
+            # Zoom to the output layers, using the extents in the species summary table instead of reading the features
+            if param_zoom:
+                KBAProfiler.startPhase("zoom")
+                KBAMapBuilder.zoomToPlan(aprx, m, output_plan)
+
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("{} of {} species added to the map.".format(mapped_count, species_count))
+            arcpy.AddMessage("End of script.")
+
+        # Error handling for custom error related to required data layers in the map
+        except KBAExceptions.NoDataError as error:
+            arcpy.AddError("{} Layer does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to required data tables in the map
+        except KBAExceptions.NoTableError as error:
+            arcpy.AddError("{} Table does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to active definition queries on required layers
+        except KBAExceptions.DefQueryError as error:
+            arcpy.AddError("{} has an active definition query. "
+                           "Turn off all active definition queries on {} to run the tool.".format(error.args[0],
+                                                                                                  error.args[0]))
+
+        # Error handling for custom error related to SpeciesData group layer not existing
+        except KBAExceptions.SpeciesDataError:
+            arcpy.AddError("SpeciesData (Group Layer) does not exist. "
+                           "Re-load original SpeciesData from WCSC-KBA Map Template.")
+
+        # Error handling for custom error related to no species being given to the tool
+        except KBAExceptions.BatchInputError:
+            arcpy.AddError("No species to process. "
+                           "Select species from the dropdown or provide a CSV file of species names or speciesids.")
+
+        # Error handling if an error occurs while using a Geoprocessing Tool in the script
+        except arcpy.ExecuteError:
+            # Get the tool error messages
+            msgs = arcpy.GetMessages(2)
+
+            # Return tool error messages for use with a script tool
+            arcpy.AddError(msgs)
+
+            # Print tool error messages for use in Python
+            print(msgs)
+
+        # Error handling if the script fails for other unexplained reasons
+        except:
+            # Get the traceback object
+            tb = sys.exc_info()[2]
+            tbinfo = traceback.format_tb(tb)[0]
+
+            # Concatenate information together concerning the error into a message string
+            pymsg = "PYTHON ERRORS:\nTraceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+            msgs = "ArcPy ERRORS:\n" + arcpy.GetMessages(2) + "\n"
+
+            # Return Python error messages for use in script tool or Python window
+            arcpy.AddError(pymsg)
+            arcpy.AddError(msgs)
+
+        finally:
+            # Print the timing summary and write the timing report to the scratch folder
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            for timing_message in KBAProfiler.endRun(arcpy.env.scratchFolder):
+                arcpy.AddMessage(timing_message)
+
+# End of script
@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      BuildSpeciesIndexTool.py
+# Tool Location:    KBAToolsLocal Toolbox
+# Tool Name:        "Build Species Index"
+#
+# Script Created:   2026-10-17
+# Last Updated:     2026-10-17
+# Script Author:    Meg Southee
+# Credits:          © WCS Canada / Meg Southee 2026
+#
+# Purpose:          Builds or refreshes the species summary table (KBASummary) that holds the number of features and
+#                   the extent for each speciesid and inputdatasetid in InputPoint, InputLine, InputPolygon and
+#                   EO_Polygon. The mapping, scoping and infraspecies tools read their record counts from the summary
+#                   instead of querying the feature classes.
+#                   The first run summarizes every feature class. Later runs only summarize the inputdatasetid values
+#                   that are given to the tool, or whose number of features has changed, unless a rebuild is requested.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import sys
+import traceback
+import KBAExceptions
+import KBASummary
+
+
+# Define class called Tool
+class Tool:
+    """Build or refresh the species summary table for the KBA tools."""
+
+    # Instantiate the class
+    def __init__(self):
+        pass
+
+    # Define a function to run the tool
+    def run_tool(self, parameters, messages):
+
+        # # SET VARIABLES FOR THE SCRIPT ...............................................................................
+
+        # Make variables from input parameters defined in .pyt
+        # Multivalue list of inputdatasetid values that have been edited since the summary was built
+        param_inputdatasetids = parameters[0].values or []
+        arcpy.AddMessage("InputDatasetIDs: {}".format(", ".join(str(i) for i in param_inputdatasetids)))
+
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_rebuild = parameters[1].value
+        arcpy.AddMessage("Rebuild Species Index: {}".format(param_rebuild))
+
+        # Datasets and tables that need to exist in the map and not have active definition query
+        dataset_list = ["InputPoint", "InputLine", "InputPolygon", "EO_Polygon"]
+        table_list = ["InputDataset"]
+
+        try:
+            # Current ArcPro Project
+            aprx = arcpy.mp.ArcGISProject("CURRENT")
+
+            # Current Active Map in ArcPro Project
+            m = aprx.activeMap
+
+            # # START ERROR HANDLING TO CHECK THAT THE MAP CONTAINS THE NECESSARY TABLES AND DATA LAYERS ...............
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Error Handling Processes...")
+
+            """Error handling to check for existence of required data layers in the current map."""
+            # Iterate through the list of dataset names (layers)
+            for dataset in dataset_list:
+                # Check to see if a dataset layer with that name exists in the map
+                if arcpy.Exists("SpeciesData\\{}".format(dataset)):
+                    arcpy.AddMessage("{} data layer exists.".format(dataset))
+
+                    # Create a layer variable out of the current dataset
+                    lyr = m.listLayers(dataset)[0]
+
+                    # The summary must hold all the features, so there can't be a definition query on the layers
+                    if lyr.supports("DEFINITIONQUERY") and lyr.definitionQuery != '':
+                        # Raise custom DefQueryError if there is a definition query
+                        raise KBAExceptions.DefQueryError
+
+                else:
+                    # Raise the custom NoDataError if the dataset doesn't exist
+                    raise KBAExceptions.NoDataError
+
+            """ Error handling to check for existence of required data tables in the current map."""
+            # Iterate through the list of table names (tables)
+            for table in table_list:
+                # Error handling to ensure that the required tables exists in the map
+                if arcpy.Exists(table):
+                    arcpy.AddMessage("{} table exists.".format(table))
+
+                    # Create a layer variable out of the current table
+                    lyr = m.listTables(table)[0]
+
+                    # Check if there is an active definition query on any of the tables
+                    if lyr.definitionQuery != '':
+                        # Raise custom DefQueryError if there is a definition query
+                        raise KBAExceptions.DefQueryError
+
+                else:
+                    raise KBAExceptions.NoTableError
+
+            # # END ERROR HANDLING .....................................................................................
+
+            # # START DATA PROCESSING ..................................................................................
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Geoprocessing...")
+            arcpy.AddMessage("Species index: {}".format(KBASummary.summaryPath()))
+
+            # Build or refresh the summary table, one feature class at a time
+            refresh_results = KBASummary.refreshSummary(param_inputdatasetids, param_rebuild)
+
+            for ft_type in refresh_results:
+                if refresh_results[ft_type] == "rebuilt":
+                    arcpy.AddMessage("{}: summary rebuilt.".format(ft_type))
+
+                elif refresh_results[ft_type] == "current":
+                    arcpy.AddMessage("{}: summary is up to date.".format(ft_type))
+
+                else:
+                    arcpy.AddMessage("{}: summary refreshed for {} inputdatasetid values.".format(
+                        ft_type, refresh_results[ft_type]))
+
+            arcpy.AddMessage("End of script.")
+
+        # Error handling for custom error related to required data layers in the map
+        except KBAExceptions.NoDataError:
+            arcpy.AddError("{} Layer does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(dataset, dataset))
+
+        # Error handling for custom error related to required data tables in the map
+        except KBAExceptions.NoTableError:
+            arcpy.AddError("{} Table does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(table, table))
+
+        # Error handling for custom error related to active definition queries on required layers
+        except KBAExceptions.DefQueryError:
+            arcpy.AddError("{} has an active definition query. "
+                           "Turn off all active definition queries on {} to run the tool.".format(lyr.name, lyr.name))
+
+        # Error handling if an error occurs while using a Geoprocessing Tool in the script
+        except arcpy.ExecuteError:
+            # Get the tool error messages
+            msgs = arcpy.GetMessages(2)
+
+            # Return tool error messages for use with a script tool
+            arcpy.AddError(msgs)
+
+            # Print tool error messages for use in Python
+            print(msgs)
+
+        # Error handling if the script fails for other unexplained reasons
+        except:
+            # Get the traceback object
+            tb = sys.exc_info()[2]
+            tbinfo = traceback.format_tb(tb)[0]
+
+            # Concatenate information together concerning the error into a message string
+            pymsg = "PYTHON ERRORS:\nTraceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+            msgs = "ArcPy ERRORS:\n" + arcpy.GetMessages(2) + "\n"
+
+            # Return Python error messages for use in script tool or Python window
+            arcpy.AddError(pymsg)
+            arcpy.AddError(msgs)
+
+# End of script
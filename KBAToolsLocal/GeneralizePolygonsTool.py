@@ -0,0 +1,145 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      GeneralizePolygonsTool.py
+# Tool Location:    KBAToolsLocal Toolbox
+# Tool Name:        "Build Generalized Polygons"
+#
+# Script Created:   2026-10-17
+# Last Updated:     2026-10-17
+# Script Author:    Meg Southee
+# Credits:          © WCS Canada / Meg Southee 2026
+#
+# Purpose:          Writes simplified copies of the InputPolygon features of the filtered datasets (the ECCC, IUCN,
+#                   WCSC and COSEWIC range, AOO and EOO maps and the critical habitat) at several tolerances in metres
+#                   to a file geodatabase in the KBAToolsCache folder (KBAGeneralize). InputPolygon needs a projected
+#                   coordinate system. Unless their "Full resolution range maps?"
+#                   box is checked, the mapping tools add a layer made from the copy whose tolerance suits the extent
+#                   of each species group next to the output layers of these datasets, which is drawn instead of them
+#                   at overview scales, so they draw much faster when zoomed out.
+#                   The copies are only used while InputPolygon and InputDataset haven't changed, so the tool needs to
+#                   be run again after the data is updated.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import sys
+import traceback
+import KBAExceptions
+import KBAGeneralize
+import KBAMapBuilder
+
+
+# Define class called Tool
+class Tool:
+    """Build the generalized polygons of the filtered datasets that the mapping tools draw at overview scales."""
+
+    # Instantiate the class
+    def __init__(self):
+        pass
+
+    """These functions are called from within the run_tool function."""
+
+    # Define a function to run the tool
+    def run_tool(self, parameters, messages):
+
+        # # SET VARIABLES FOR THE SCRIPT ...............................................................................
+
+        # Make variables from input parameters defined in .pyt
+        # This is a multivalue parameter, the tolerances are in metres
+        param_tolerances = parameters[0].values or KBAGeneralize.generalize_tolerances
+        arcpy.AddMessage("Tolerances (metres): {}".format(param_tolerances))
+
+        try:
+            # Current ArcPro Project
+            aprx = arcpy.mp.ArcGISProject("CURRENT")
+
+            # Current Active Map in ArcPro Project
+            m = aprx.activeMap
+
+            # # START ERROR HANDLING TO CHECK THAT THE MAP CONTAINS THE NECESSARY TABLES AND DATA LAYERS ...............
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Error Handling Processes...")
+
+            # Check that the map contains the SpeciesData group layer and the required data layers and tables without
+            # active definition queries, so every feature of the filtered datasets is generalized
+            KBAMapBuilder.validateMap(m)
+
+            # Check that the tolerances are positive
+            if param_tolerances and min(param_tolerances) <= 0:
+                arcpy.AddError("The tolerances must be greater than 0.")
+                return
+
+            # # END ERROR HANDLING .....................................................................................
+
+            # # START DATA PROCESSING ..................................................................................
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Geoprocessing...")
+
+            arcpy.SetProgressorLabel("Generalizing the InputPolygon features...")
+            feature_count, vertex_count, tolerance_vertices = KBAGeneralize.buildGeneralized(param_tolerances)
+            arcpy.ResetProgressor()
+
+            arcpy.AddMessage("{} InputPolygon features with {} vertices generalized.".format(feature_count,
+                                                                                               vertex_count))
+
+            # Report the number of vertices that are left at each tolerance
+            for tolerance in sorted(tolerance_vertices):
+                arcpy.AddMessage("Tolerance {:g}: {} vertices ({:.1f}% fewer).".format(
+                    tolerance, tolerance_vertices[tolerance],
+                    100.0 * (1 - tolerance_vertices[tolerance] / vertex_count) if vertex_count else 0.0))
+
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Generalized polygons written to {}.".format(KBAGeneralize.generalizedWorkspace()))
+            arcpy.AddMessage("End of script.")
+
+        # Error handling for custom error related to required data layers in the map
+        except KBAExceptions.NoDataError as error:
+            arcpy.AddError("{} Layer does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to required data tables in the map
+        except KBAExceptions.NoTableError as error:
+            arcpy.AddError("{} Table does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to active definition queries on required layers
+        except KBAExceptions.DefQueryError as error:
+            arcpy.AddError("{} has an active definition query. "
+                           "Turn off all active definition queries on {} to run the tool.".format(error.args[0],
+                                                                                                  error.args[0]))
+
+        # Error handling for custom error related to SpeciesData group layer not existing
+        except KBAExceptions.SpeciesDataError:
+            arcpy.AddError("SpeciesData (Group Layer) does not exist. "
+                           "Re-load original SpeciesData from WCSC-KBA Map Template.")
+
+        # Error handling for custom error related to InputPolygon having a geographic coordinate system
+        except KBAExceptions.GeographicError as error:
+            arcpy.AddError("InputPolygon has a geographic coordinate system ({}). The tolerances are in metres, so the "
+                           "polygons can only be generalized in a projected coordinate system.".format(error.args[0]))
+
+        # Error handling if an error occurs while using a Geoprocessing Tool in the script
+        except arcpy.ExecuteError:
+            # Get the tool error messages
+            msgs = arcpy.GetMessages(2)
+
+            # Return tool error messages for use with a script tool
+            arcpy.AddError(msgs)
+
+            # Print tool error messages for use in Python
+            print(msgs)
+
+        # Error handling if the script fails for other unexplained reasons
+        except:
+            # Get the traceback object
+            tb = sys.exc_info()[2]
+            tbinfo = traceback.format_tb(tb)[0]
+
+            # Concatenate information together concerning the error into a message string
+            pymsg = "PYTHON ERRORS:\nTraceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+            msgs = "ArcPy ERRORS:\n" + arcpy.GetMessages(2) + "\n"
+
+            # Return Python error messages for use in script tool or Python window
+            arcpy.AddError(pymsg)
+            arcpy.AddError(msgs)
+
+# End of script
@@ -0,0 +1,202 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      IndexAuditTool.py
+# Tool Location:    KBAToolsLocal Toolbox
+# Tool Name:        "Audit Data Indexes"
+#
+# Script Created:   2026-10-17
+# Last Updated:     2026-10-17
+# Script Author:    Meg Southee
+# Credits:          © WCS Canada / Meg Southee 2026
+#
+# Purpose:          Checks that the data sources behind the SpeciesData data layers and the Biotics, Species and
+#                   InputDataset tables have the attribute indexes (speciesid, inputdatasetid, datasetsourceid,
+#                   element_code, fullspecies_elementcode) and spatial indexes that the other tools rely on, and
+#                   reports the ones that are missing (KBAAudit). Local copies of the WCSC-KBA data are often made
+#                   without them, which makes every tool query read the whole table.
+#                   The missing indexes can be added by the tool, and a set of queries that stand for the ones the
+#                   tools run can be timed before and after, so the effect of the new indexes is reported.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import sys
+import traceback
+import KBAAudit
+import KBAExceptions
+import KBAMapBuilder
+
+
+# Define class called Tool
+class Tool:
+    """Report (and add) the missing attribute and spatial indexes on the KBA data used by the tools."""
+
+    # Instantiate the class
+    def __init__(self):
+        pass
+
+    """These functions are called from within the run_tool function."""
+
+    # Define a function to describe an index in the tool messages
+    def index_label(index_status):
+        if index_status.field == KBAAudit.spatial_index_name:
+            return "{} spatial index".format(index_status.table)
+
+        return "{}.{} attribute index".format(index_status.table, index_status.field)
+
+    # Define a function to report the timings of the audit queries, with the change from the timings before the indexes
+    # were added (if there are any)
+    def report_timings(query_timings, before_timings=None):
+        for query_number, (query_name, seconds) in enumerate(query_timings):
+            if before_timings is None:
+                arcpy.AddMessage("{}: {:.3f} s".format(query_name, seconds))
+
+            else:
+                before_seconds = before_timings[query_number][1]
+                arcpy.AddMessage("{}: {:.3f} s (was {:.3f} s, {:.1f}x faster)".format(
+                    query_name, seconds, before_seconds, before_seconds / seconds if seconds else 1.0))
+
+    # Define a function to run the tool
+    def run_tool(self, parameters, messages):
+
+        # # SET VARIABLES FOR THE SCRIPT ...............................................................................
+
+        # Make variables from input parameters defined in .pyt
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_add_indexes = parameters[0].value
+        arcpy.AddMessage("Add Missing Indexes: {}".format(param_add_indexes))
+
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_time_queries = parameters[1].value
+        arcpy.AddMessage("Time Tool Queries: {}".format(param_time_queries))
+
+        try:
+            # Current ArcPro Project
+            aprx = arcpy.mp.ArcGISProject("CURRENT")
+
+            # Current Active Map in ArcPro Project
+            m = aprx.activeMap
+
+            # # START ERROR HANDLING TO CHECK THAT THE MAP CONTAINS THE NECESSARY TABLES AND DATA LAYERS ...............
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Error Handling Processes...")
+
+            # Check that the map contains the SpeciesData group layer and the required data layers and tables without
+            # active definition queries, which would also slow down the timed queries
+            KBAMapBuilder.validateMap(m)
+
+            # # END ERROR HANDLING .....................................................................................
+
+            # # START DATA PROCESSING ..................................................................................
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Geoprocessing...")
+
+            # Check the indexes on the data sources behind the layers and tables in the map
+            index_statuses = KBAAudit.auditIndexes()
+
+            for index_status in index_statuses:
+                if index_status.exists:
+                    arcpy.AddMessage("{} exists.".format(Tool.index_label(index_status)))
+
+                elif index_status.exists is None:
+                    arcpy.AddWarning("{} could not be checked.".format(Tool.index_label(index_status)))
+
+                else:
+                    arcpy.AddWarning("{} is missing.".format(Tool.index_label(index_status)))
+
+            missing_indexes = KBAAudit.missingIndexes(index_statuses)
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("{} of {} indexes are missing.".format(len(missing_indexes), len(index_statuses)))
+
+            # Time the tool queries before any indexes are added
+            before_timings = None
+            if param_time_queries:
+                arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+                arcpy.AddMessage("Timing the tool queries...")
+                audit_queries = KBAAudit.auditQueries()
+                before_timings = KBAAudit.timeQueries(audit_queries)
+                Tool.report_timings(before_timings)
+
+            # # ADD THE MISSING INDEXES ................................................................................
+            addable_indexes = KBAAudit.addableIndexes(index_statuses)
+            if param_add_indexes and missing_indexes:
+                arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+                arcpy.AddMessage("Adding the missing indexes...")
+
+                for index_status in missing_indexes:
+                    if index_status not in addable_indexes:
+                        arcpy.AddWarning("{} can't be added to this data source.".format(
+                            Tool.index_label(index_status)))
+
+                added_count = 0
+                for index_status in addable_indexes:
+                    arcpy.SetProgressorLabel("Adding {}...".format(Tool.index_label(index_status)))
+
+                    # Keep adding the rest of the indexes if one can't be added (e.g. on a database view, or without
+                    # ownership of an enterprise geodatabase table)
+                    try:
+                        KBAAudit.addIndex(index_status)
+                        added_count += 1
+                        arcpy.AddMessage("{} added.".format(Tool.index_label(index_status)))
+
+                    except arcpy.ExecuteError:
+                        arcpy.AddWarning("{} could not be added.\n{}".format(Tool.index_label(index_status),
+                                                                             arcpy.GetMessages(2)))
+
+                arcpy.ResetProgressor()
+                arcpy.AddMessage("{} of {} missing indexes added.".format(added_count, len(missing_indexes)))
+
+                # Time the same tool queries again with the new indexes
+                if param_time_queries and added_count:
+                    arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+                    arcpy.AddMessage("Timing the tool queries with the new indexes...")
+                    Tool.report_timings(KBAAudit.timeQueries(audit_queries), before_timings)
+
+            arcpy.AddMessage("End of script.")
+
+        # Error handling for custom error related to required data layers in the map
+        except KBAExceptions.NoDataError as error:
+            arcpy.AddError("{} Layer does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to required data tables in the map
+        except KBAExceptions.NoTableError as error:
+            arcpy.AddError("{} Table does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to active definition queries on required layers
+        except KBAExceptions.DefQueryError as error:
+            arcpy.AddError("{} has an active definition query. "
+                           "Turn off all active definition queries on {} to run the tool.".format(error.args[0],
+                                                                                                  error.args[0]))
+
+        # Error handling for custom error related to SpeciesData group layer not existing
+        except KBAExceptions.SpeciesDataError:
+            arcpy.AddError("SpeciesData (Group Layer) does not exist. "
+                           "Re-load original SpeciesData from WCSC-KBA Map Template.")
+
+        # Error handling if an error occurs while using a Geoprocessing Tool in the script
+        except arcpy.ExecuteError:
+            # Get the tool error messages
+            msgs = arcpy.GetMessages(2)
+
+            # Return tool error messages for use with a script tool
+            arcpy.AddError(msgs)
+
+            # Print tool error messages for use in Python
+            print(msgs)
+
+        # Error handling if the script fails for other unexplained reasons
+        except:
+            # Get the traceback object
+            tb = sys.exc_info()[2]
+            tbinfo = traceback.format_tb(tb)[0]
+
+            # Concatenate information together concerning the error into a message string
+            pymsg = "PYTHON ERRORS:\nTraceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+            msgs = "ArcPy ERRORS:\n" + arcpy.GetMessages(2) + "\n"
+
+            # Return Python error messages for use in script tool or Python window
+            arcpy.AddError(pymsg)
+            arcpy.AddError(msgs)
+
+# End of script
@@ -4,7 +4,7 @@
 # Tool Name:        "Mapping Tool - Infraspecies" [SEPARATE GROUP LAYERS]
 #
 # Script Created:   2022-02-15
-# Last Updated:     2024-03-28
+# Last Updated:     2026-10-17
 # Script Author:    Meg Southee
 # Credits:          © WCS Canada / Meg Southee 2022
 #
@@ -20,6 +20,31 @@
 # 2024-03-35        Added functionality to separate four additional datasets from the InputPolygon layer using a data
 #                   dictionary. The datasets display as their own output layers in the map with custom symbology.
 #                   WCSC Area of Occupancy Maps, WCSC Range Maps, COSEWIC Range Maps, COSEWIC Extent of Occurrence Maps.
+# 2026-10-17        Species resolution, layer names, sql queries and record counts come from KBAPlanner, which reads
+#                   the data through KBABackend. Feature layers are only made for outputs that have records.
+#                   Records are counted with one grouped query per feature class for all the species in the run.
+#                   Record counts are read from the species summary table built by the "Build Species Index" tool
+#                   when it is current, and the output layer names show the number of records in each layer.
+#                   Full species and infraspecies records are looked up in the taxon hierarchy held by KBAIndexes.
+#                   Each run is timed by KBAProfiler (phases, map builder functions and arcpy calls) and writes a JSON
+#                   timing report to the scratch folder.
+#                   The inputdatasetid sql queries are built by KBAUtils.inputDatasetPredicate (unique ids, BETWEEN
+#                   ranges, or a subquery on InputDataset for long lists). The inputdatasetid values of the filtered
+#                   datasets are held as compact sorted id sets (KBAUtils.IdSet) and merged once per session.
+#                   The group layers are added from an empty SpeciesData template cached by KBATemplates, and the
+#                   output data layers are made directly from the SpeciesData data layers.
+#                   All the group layers and output layers are planned first (KBAPlanner.OutputPlan) and added to
+#                   the map in a single pass by KBAMapBuilder.
+#                   The planned output layers are cached by KBAPlanCache for each species until the data changes, so
+#                   a repeat run for the same species only adds the layers to the map.
+#                   Added an optional parameter to zoom to the output layers, using the extents in the species summary
+#                   table (KBASummary) so the features behind the definition queries are not read again.
+#                   The map is validated, the species are resolved and the group layers are named and planned by
+#                   the output plan engine shared by the mapping tools (KBAMapBuilder.validateMap, KBAEngine), so the
+#                   tool only describes the group layers it wants as a plan request.
+#                   The output layers of the filtered datasets are drawn from the generalized polygons built by the
+#                   "Build Generalized Polygons" tool (KBAGeneralize) at overview scales, and from the original polygons
+#                   at detail scales, unless the full resolution parameter is checked.
 # ----------------------------------------------------------------------------------------------------------------------
 
 # Import libraries
@@ -27,7 +52,11 @@ import arcpy
 import sys
 import traceback
 import KBAExceptions
-import KBAUtils
+import KBAEngine
+import KBAGeneralize
+import KBAMapBuilder
+import KBAProfiler
+import KBATemplates
 
 
 # Define class called Tool
@@ -38,189 +67,17 @@ class Tool:
     def __init__(self):
         pass
 
-    """These functions are called from within the run_tool function."""
-
-    # Define a function to create the group layer for the selected infraspecies record
-    def create_infraspecies_group_lyr(m, grp_lyr, sp_com_name, sp_sci_name):
-        # arcpy.AddMessage("Run create_group_lyr function.")
-
-        # Assign naming convention for output group layer
-        # Common Name (Scientific Name)
-        grp_lyr_name = "{} ({})".format(sp_com_name, sp_sci_name)
-
-        # Add a copy of the SpeciesData group layer to the TOC (by referencing the .lyrx file written to scratch)
-        m.addLayer(grp_lyr, "TOP")
-
-        # Rename the newly added group layer, because layer was added at top index reference = [0]
-        group_lyr = m.listLayers("SpeciesData")[0]
-        group_lyr.name = grp_lyr_name  # rename the group layer in TOC
-        group_lyr = m.listLayers(grp_lyr_name)[0]
-        group_lyr.visible = False  # Turn off the visibility for the group layer
-
-        return group_lyr
-
-    # Define a function to create the group layer for optional full species records
-    def create_optional_species_group_lyr(m, empty_grp_lyr, sp_com_name, sp_sci_name, infraspecies_grp_lyr):
-        # arcpy.AddMessage("Run create_group_lyr function.")
-
-        # Assign naming convention for output group layer in TOC
-        # Common Name (Scientific Name) data not identified to infraspecies
-        grp_lyr_name = "{} ({}) data not identified to infraspecies".format(sp_com_name, sp_sci_name)
-
-        # Insert an empty copy of the SpeciesData group layer BELOW the infraspecies group layer
-        m.insertLayer(infraspecies_grp_lyr, empty_grp_lyr, "AFTER")
-
-        # Rename the newly added group layer, because layer was added at top index reference = [0]
-        group_lyr = m.listLayers("SpeciesData")[0]
-        group_lyr.name = grp_lyr_name  # rename the group layer in TOC
-        group_lyr = m.listLayers(grp_lyr_name)[0]
-        group_lyr.visible = False  # Turn off the visibility for the group layer
-
-        return group_lyr
-
-    # Define a function to create the InputPoint / InputLine / EO_Polygon layers
-    def create_lyr(m, grp_lyr, speciesid, ft_type):
-        # arcpy.AddMessage("Run create_lyr function for {}.".format(ft_type))
-
-        # Naming convention for point/line/eo_polygon layers in TOC:
-        lyr_name = "{} {}".format(ft_type, speciesid)
-
-        if len(m.listLayers(ft_type)) > 0:
-            # Create a variable from the old/existing layer
-            lyr = m.listLayers(ft_type)[0]
-
-            # Make a new feature layer with sql query and added .getOutput(0) function
-            new_lyr = arcpy.MakeFeatureLayer_management(lyr, lyr_name, "speciesid = {}".format(speciesid),
-                                                        None).getOutput(0)
-
-            # Get a count of the records in the new feature layer
-            row_count = int(arcpy.GetCount_management(new_lyr).getOutput(0))
-
-            # Check to see if there are any records for the species
-            if row_count != 0:
-                m.addLayerToGroup(grp_lyr, new_lyr, "BOTTOM")  # Add the new layer
-                new_lyr = m.listLayers(lyr_name)[0]
-                new_lyr.visible = False  # Turn off the visibility for the new layer
-
-                # Check if the current layer is the EO_Polygon layer
-                if ft_type == "EO_Polygon":
-
-                    # Apply custom symbology
-                    sym = new_lyr.symbology
-                    sym.renderer.symbol.color = {'RGB': [0, 112, 255, 30]}
-                    sym.renderer.symbol.outlineColor = {'RGB': [10, 112, 255, 100]}
-                    sym.renderer.symbol.outlineWidth = 2
-                    new_lyr.symbology = sym
-
-                else:
-                    pass  # Do nothing for the points and the lines
-
-            else:
-                pass
-
-            m.removeLayer(lyr)  # remove old layer
-
-        else:
-            raise KBAExceptions.SpeciesDataError
-
-    # Define a function to create the InputPolygon layers (w/out the filtered data layers)
-    def create_poly_lyr(m, grp_lyr, speciesid, range_data_list):
-        # arcpy.AddMessage("Run create_poly_lyr function for InputPolygon.")
-
-        # Naming convention for polygon layer in TOC:
-        lyr_name = "InputPolygon {}".format(speciesid)
-
-        if len(m.listLayers("InputPolygon")) > 0:
-            lyr = m.listLayers("InputPolygon")[0]
-
-            # Convert the range_data_list into string variable separated by commas for use in the SQL statement
-            range_data_string = ', '.join(str(i) for i in range_data_list)
-
-            # SQL statement to select InputPolygons for the species w/out Range & Critical Habitat data records
-            range_sql = "speciesid = {} And inputdatasetid NOT IN ({})".format(speciesid, range_data_string)
-
-            # Make a new feature layer with sql query and added .getOutput(0) function
-            new_lyr = arcpy.MakeFeatureLayer_management(lyr, lyr_name, range_sql,
-                                                        None).getOutput(0)
-
-            # Get a count of the records in the new feature layer
-            row_count = int(arcpy.GetCount_management(new_lyr).getOutput(0))
-
-            # Check to see if there are any records for the species
-            if row_count != 0:
-                m.addLayerToGroup(grp_lyr, new_lyr, "BOTTOM")  # Add the new poly layer
-                new_lyr = m.listLayers(lyr_name)[0]
-                new_lyr.visible = False  # Turn off the visibility for the new layer
-
-                # Apply custom symbology
-                sym = new_lyr.symbology
-                sym.renderer.symbol.color = {'RGB': [56, 168, 0, 30]}
-                sym.renderer.symbol.outlineColor = {'RGB': [56, 168, 0, 100]}
-                sym.renderer.symbol.outlineWidth = 2
-                new_lyr.symbology = sym
-
-            else:
-                pass
-
-            m.removeLayer(lyr)  # remove poly layer from the new species group
-
-        else:
-            raise KBAExceptions.SpeciesDataError
-
-    # Define a function to create the data layers for the filtered datasets [ECCC/IUCN/WCSC/COSEWIC MAPS]
-    def create_range_lyr(m, grp_lyr, speciesid, map_dict, inputdatasetid_list):
-        # arcpy.AddMessage("Run create_range_lyr function for {}.".format(range_type))
-
-        # Unpack the dictionary
-        current_layer_name = map_dict[0]
-        fill_rgb = map_dict[2]
-        outline_rgb = map_dict[3]
-
-        # Naming convention for Range/AOO/Critical Habitat output layers:
-        lyr_name = "{} {}".format(current_layer_name, speciesid)
-
-        # Check that the InputPolygon layer is loaded and that there are records in the inputdatasetid_list parameter
-        if len(m.listLayers("InputPolygon")) > 0 and len(inputdatasetid_list) > 0:
-            lyr = m.listLayers("InputPolygon")[0]
-
-            # Convert the inputdatasetid_list into string variable separated by commas for use in the SQL statement
-            inputdatasetid_list_as_string = ', '.join(str(i) for i in inputdatasetid_list)
-
-            # SQL statement to select InputPolygons for the species and filtered data only
-            range_sql = "speciesid = {} And inputdatasetid IN ({})".format(speciesid, inputdatasetid_list_as_string)
-
-            # Make a new feature layer with sql query and added .getOutput(0) function
-            new_lyr = arcpy.MakeFeatureLayer_management(lyr, lyr_name, range_sql,
-                                                        None).getOutput(0)
-
-            # Get a count of the records in the new feature layer
-            row_count = int(arcpy.GetCount_management(new_lyr).getOutput(0))
-
-            # Check to see if there are any records for the species for the filtered dataset type
-            if row_count != 0:
-                m.addLayerToGroup(grp_lyr, new_lyr, "BOTTOM")  # Add the new filtered data layer to the map
-                new_lyr = m.listLayers(lyr_name)[0]
-                new_lyr.visible = False  # Turn off the visibility for the new layer
-
-                # Apply custom symbology
-                sym = new_lyr.symbology
-                sym.renderer.symbol.color = fill_rgb
-                sym.renderer.symbol.outlineColor = outline_rgb
-                sym.renderer.symbol.outlineWidth = 2
-                new_lyr.symbology = sym
-
-            else:
-                pass  # Do nothing
-
-        else:
-            raise KBAExceptions.SpeciesDataError
-
     # Define a function to run the tool
     def run_tool(self, parameters, messages):
 
+        # Time the phases of the run, the map builder functions and the arcpy calls (see KBAProfiler)
+        KBAProfiler.startRun("Mapping Tool - Infraspecies", arcpy)
+        KBAProfiler.startPhase("setup")
+
         # # SET VARIABLES FOR THE SCRIPT ...............................................................................
 
-        # Make variables from input parameters defined in .pyt
+        # Make variables from input parameters defined in .pyt (the last parameter is the search string, which only
+        # fills the species dropdown)
         # Input infraspecies from filtered list in dropdown menu in tool dialog
         param_infraspecies = parameters[0].valueAsText
         arcpy.AddMessage("Species: {}".format(param_infraspecies))
@@ -233,30 +90,16 @@ class Tool:
         param_french_name = parameters[2].value
         arcpy.AddMessage("Use French Name: {}".format(param_french_name))
 
-        # SQL query based on the input species parameter
-        sql = "national_scientific_name = '{}'".format(param_infraspecies)
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_zoom = parameters[3].value
+        arcpy.AddMessage("Zoom To Result: {}".format(param_zoom))
+
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_full_resolution = parameters[4].value
+        arcpy.AddMessage("Full Resolution Range Maps: {}".format(param_full_resolution))
 
         # Tables
         biotics_table = "BIOTICS_ELEMENT_NATIONAL"
-        species_table = "Species (view only)"
-
-        # Fields in BIOTICS_ELEMENT_NATIONAL that are used in the search cursor
-        biotics_fields = ["speciesid",
-                          "element_code",
-                          "ca_nname_level",
-                          "national_scientific_name",
-                          "national_engl_name",
-                          "national_fr_name"]  # Added french species names
-
-        # Load dictionary of filtered datasets (Range/AOO/EOO maps), corresponding datasetsourceid values and symbology
-        dataset_dict = KBAUtils.symbology_dict
-
-        # Empty lists to hold data values
-        filtered_inputdatasetid_list = []  # hold all inputdatasetid values for range/aoo/habitat maps
-
-        # Datasets/tables that need to exist in the map and not have active definition query
-        dataset_list = ["InputPoint", "InputLine", "InputPolygon", "EO_Polygon"]
-        table_list = [biotics_table, species_table, "InputDataset"]
 
         try:
             # Current ArcPro Project
@@ -268,290 +111,114 @@ class Tool:
             # clear all selections in the map
             m.clearSelection()
 
-            # scratchFolder = Guaranteed to exist at run time
-            scratch = arcpy.env.scratchFolder
-            arcpy.AddMessage("Scratch folder: {}".format(scratch))
-
             # # START ERROR HANDLING TO CHECK THAT THE MAP CONTAINS THE NECESSARY TABLES AND DATA LAYERS ...............
+            KBAProfiler.startPhase("validation")
             arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
             arcpy.AddMessage("Start Error Handling Processes...")
 
-            """Error handling to check for existence of the "SpeciesData" group layer."""
-            # Check that the SpeciesData Group Layer exists in the map
-            if arcpy.Exists("SpeciesData"):
-                arcpy.AddMessage("SpeciesData group layer exists.")
-
-                # Get the existing SpeciesDate group layer as a layer object
-                primary_infraspecies_group_lyr = m.listLayers("SpeciesData")[0]
-
-                # Write a copy of the SpeciesData group layer to the user's scratch folder
-                arcpy.SaveToLayerFile_management(primary_infraspecies_group_lyr, scratch + "\\species_group.lyrx")
-
-                # Create a layer file from the scratch workspace
-                new_group_lyr = arcpy.mp.LayerFile(scratch + "\\species_group.lyrx")
-
-            else:
-                raise KBAExceptions.SpeciesDataError
-
-            """Error handling to check for existence of required data layers in the current map."""
-            # Iterate through the list of dataset names (layers)
-            for dataset in dataset_list:
-                # Check to see if a dataset layer with that name exists in the map
-                if arcpy.Exists("SpeciesData\\{}".format(dataset)):
-                    arcpy.AddMessage("{} data layer exists.".format(dataset))
-
-                    # Create a layer variable out of the current dataset
-                    lyr = m.listLayers(dataset)[0]
-
-                    # Check if the layer supports a definition query
-                    if lyr.supports("DEFINITIONQUERY"):
-                        # arcpy.AddMessage("{} supports def query.".format(dataset))
-
-                        # Check if there is an active definition query on any of the layer
-                        if lyr.definitionQuery != '':
-
-                            # Raise custom DefQueryError if there is a definition query
-                            raise KBAExceptions.DefQueryError
-
-                        else:
-                            # arcpy.AddMessage("No def query on {}.".format(dataset))
-                            pass
-                    else:
-                        pass
-                else:
-                    # Raise the custom NoDataError if the dataset doesn't exist. Pass the dataset name to the error.
-                    raise KBAExceptions.NoDataError
-
-            """ Error handling to check for existence of required data tables in the current map."""
-            # Iterate through the list of table names (tables)
-            for table in table_list:
-                # Error handling to ensure that the required tables exists in the map
-                if arcpy.Exists(table):
-                    arcpy.AddMessage("{} table exists.".format(table))
-
-                    # Create a layer variable out of the current table
-                    lyr = m.listTables(table)[0]
-
-                    # Check if there is an active definition query on any of the layer
-                    if lyr.definitionQuery != '':
-
-                        # Raise custom DefQueryError if there is a definition query
-                        raise KBAExceptions.DefQueryError
+            # Check that the map contains the SpeciesData group layer and the required data layers and tables without
+            # active definition queries
+            species_group_lyr = KBAMapBuilder.validateMap(m)
 
-                    else:
-                        # arcpy.AddMessage("No def query on {}.".format(table))
-                        pass
+            # Empty copy of the SpeciesData group layer, written to the KBAToolsCache folder the first time it is
+            # used and reused until the SpeciesData layer definitions change
+            new_group_lyr = KBATemplates.readGroupTemplate(species_group_lyr)
 
-                else:
-                    raise KBAExceptions.NoTableError
             # # END ERROR HANDLING .....................................................................................
 
             # # START DATA PROCESSING ..................................................................................
+            KBAProfiler.startPhase("species resolution")
             arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
             arcpy.AddMessage("Start Geoprocessing...")
 
-            # Get record details from Biotics table using a search cursor for the selected infraspecies record
-            with arcpy.da.SearchCursor(biotics_table, biotics_fields, sql) as biotics_cursor:
-                for row in biotics_cursor:
-                    # Assign variables from the record based on the list order in biotics_fields variable
-                    speciesid = row[0]
-                    element_code = row[1]
-                    s_level = row[2]
-                    sci_name = row[3]
-                    en_name = row[4]
-                    fr_name = row[5]
-
-                    arcpy.AddMessage("Species ID: {}".format(speciesid))
-                    arcpy.AddMessage("Scientific Name: {}".format(sci_name))
-                    arcpy.AddMessage("English Name: {}".format(en_name))
-                    arcpy.AddMessage("French Name: {}".format(fr_name))
-                    arcpy.AddMessage("Species Level: {}".format(s_level))
-                    arcpy.AddMessage("Element Code: {}".format(element_code))
+            # Request a group layer for the selected infraspecies, and a group layer below it for the full species if
+            # the user wants to process the full species (see KBAEngine)
+            plan_request = KBAEngine.PlanRequest(param_infraspecies, "separate", param_includefullspecies,
+                                                 param_french_name)
+
+            # Get record details from Biotics table for the selected record. If the user wants to process the full
+            # species, its record is found from the fullspecies_elementcode of the infraspecies record in Species
+            # table, in the taxon hierarchy
+            KBAEngine.resolveRequests([plan_request])
+            speciesid, element_code, s_level, sci_name, en_name, fr_name = plan_request.record
+
+            arcpy.AddMessage("Species ID: {}".format(speciesid))
+            arcpy.AddMessage("Scientific Name: {}".format(sci_name))
+            arcpy.AddMessage("English Name: {}".format(en_name))
+            arcpy.AddMessage("French Name: {}".format(fr_name))
+            arcpy.AddMessage("Species Level: {}".format(s_level))
+            arcpy.AddMessage("Element Code: {}".format(element_code))
 
             # If param_french_name is True, then check if fr_name exists, if None then use en_name
-            if param_french_name and not fr_name:
+            if param_french_name and not plan_request.useFrenchNames():
                 arcpy.AddMessage("There is no french name for this species. Revert to using english name.")
-                # Set the French name parameter to False
-                param_french_name = False
-
-            else:
-                pass
-
-            # Exit the search cursor, but keep the variables from inside the search cursor
-            del row, biotics_cursor
-
-            """ Process infraspecies record to create the outputs in the Contents pane of the current map."""
-
-            # # USE FUNCTIONS TO CREATE GROUP LAYER AND POINTS/LINES/EOS LAYERS [FOR INFRASPECIES] ...................
-            # Create the group layer by calling the create_infraspecies_group_lyr() function defined in the tool
-            # Use French or english name depending on parameters
-
-            # if the parameter to use French names is True, use French name
-            if param_french_name:
-                primary_infraspecies_group_lyr = Tool.create_infraspecies_group_lyr(m,
-                                                                                    new_group_lyr,
-                                                                                    fr_name,
-                                                                                    sci_name)
-
-            # if the parameter to use French names is False or None, use english name
-            else:
-                primary_infraspecies_group_lyr = Tool.create_infraspecies_group_lyr(m,
-                                                                                    new_group_lyr,
-                                                                                    en_name,
-                                                                                    sci_name)
-
-            # Call the create_lyr() function x3 to create the point, lines & EO Layers
-            Tool.create_lyr(m, primary_infraspecies_group_lyr, speciesid, 'InputPoint')
-            Tool.create_lyr(m, primary_infraspecies_group_lyr, speciesid, 'InputLine')
-            Tool.create_lyr(m, primary_infraspecies_group_lyr, speciesid, 'EO_Polygon')
-
-            # # CREATE OUTPUT LAYERS IN TOC AND LIST OF DATASETIDS FOR RANGE / AOO / HABITAT DATASETS ...............
-            # Iterate through the dictionary of filtered datasets
-            for key in dataset_dict:
-                myname = dataset_dict[key][0]  # Get the name of the dataset from the dictionary
-                myvalue = dataset_dict[key][1]  # Get the datasetsourceid value from the dictionary
-                arcpy.AddMessage("Processing: {}".format(myname))
-
-                # Call the readFilteredInputDatasetID function for each of the datasets in the dictionary to generate
-                # a list of the inputdatasetid values for that dataset
-                id_values = KBAUtils.readFilteredInputDatasetID(myvalue)
-
-                # Call the create_range_lyr() function to process each of the filtered datasets as separate outputs
-                Tool.create_range_lyr(m, primary_infraspecies_group_lyr, speciesid, dataset_dict[key], id_values)
-
-                # Create a merged list of the inputdatasetids for all the filtered datasets
-                filtered_inputdatasetid_list.extend(id_values)
-
-            # # CREATE OUTPUT LAYER IN TOC FOR THE INPUTPOLYGON DATASET W/OUT THE FILTERED DATASETS ............
-            # Call the function to create the InputPolygon layer w/out the filtered datasets
-            Tool.create_poly_lyr(m, primary_infraspecies_group_lyr, speciesid, filtered_inputdatasetid_list)
-
-            # Check to see if there are data layers in the infrapecies group layer, if empty delete it
-            if len(primary_infraspecies_group_lyr.listLayers()) > 0:
-                pass
-            else:
-                m.removeLayer(primary_infraspecies_group_lyr)
-                arcpy.AddWarning("There is no spatial data for this species.")
 
             # # CHECK TO SEE IF THE USER WANTS TO PROCESS THE FULL SPECIES ..........................................
-            # if param_includefullspecies is False or None
-            if not param_includefullspecies:
-                pass  # Do nothing
-
-            else:
-                """Use logic to select the full species by getting the fullspecies_elementcode from the infraspecies 
-                record in Species table based on the speciesid."""
-
+            if plan_request.parent_record is not None:
                 arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
                 arcpy.AddMessage("Processing full species for this infraspecies...")
+                arcpy.AddMessage("Species ID: {} ({}).".format(plan_request.parent_record.speciesid,
+                                                               plan_request.parent_record.sci_name))
+
+            KBAProfiler.startPhase("record counts")
+            # Compile the request into the output plan, with the points, lines, EOs, filtered datasets & InputPolygon
+            # layers that have records in a group for the infraspecies and (optionally) a group for the full species.
+            # The features for all the groups are counted in one grouped query per feature class, unless the groups
+            # are read from the plan cache (KBAPlanCache) because the same species were already mapped with the same
+            # data
+            output_plan = KBAEngine.compilePlan([plan_request])
+
+            # Add a layer of the generalized polygons, at a tolerance that suits the extent of each group layer, next to
+            # the output layers of the filtered datasets for the overview scales (KBAGeneralize), unless only full
+            # resolution is requested
+            if not param_full_resolution:
+                KBAProfiler.startPhase("generalized polygons")
+                generalized_lyrs = KBAGeneralize.generalizePlan(output_plan)
+
+                if generalized_lyrs is None:
+                    arcpy.AddMessage("The generalized polygons have not been built for the current data. "
+                                     "Range maps are drawn at full resolution.")
+                else:
+                    arcpy.AddMessage("{} range map layers are drawn from generalized polygons at overview "
+                                     "scales.".format(len(generalized_lyrs)))
 
-                # Select the infraspecies record in the Species table
-                infraspecies_record = arcpy.management.SelectLayerByAttribute(species_table,
-                                                                              "NEW_SELECTION",
-                                                                              "speciesid = {}".format(speciesid))
-
-                # Use a search cursor to get the fullspecies_elementcode from the Species table fro the infraspecies
-                with arcpy.da.SearchCursor(infraspecies_record, ["fullspecies_elementcode"]) as infraspecies_cursor:
-                    for infraspecies_row in infraspecies_cursor:
-                        # Get the fullspecies_elementcode for the parent species from the selected infraspecies record
-                        fullspecies_elementcode = infraspecies_row[0]
-
-                del infraspecies_cursor, infraspecies_row  # delete some variables
-
-                # arcpy.AddMessage("FullSpecies_ElementCode: {}".format(fullspecies_elementcode))
-
-                """Create SQL query where the elementcode in Biotics (for the parent species) is equal to 
-                the fullspecies_elementcode in the Species table (from the infraspecies record)"""
-
-                # SQL query to get full species record in Biotics
-                biotics_sql = "element_code = '{}'".format(fullspecies_elementcode)
-
-                # Select the full species record in Biotics that is related to the infraspecies
-                arcpy.SelectLayerByAttribute_management(biotics_table, "NEW_SELECTION", biotics_sql)
-
-                # Query the record in Biotics to get species information using a search cursor
-                with arcpy.da.SearchCursor(biotics_table, biotics_fields) as biotics_full_species_cursor:
-                    for row in biotics_full_species_cursor:
-                        # Assign relevant variables from the biotics record
-                        full_speciesid = row[0]
-                        sci_name = row[3]
-                        en_name = row[4]
-                        fr_name = row[5]
-
-                arcpy.AddMessage("Species ID: {} ({}).".format(full_speciesid, sci_name))
-
-                # # USE FUNCTIONS TO CREATE OUTPUT LAYERS FOR THE PARENT SPECIES ...........................
-                # Create the species group layer using the create_optional_species_group_lyr function
-                # Use french or english name depending on parameters
-
-                # if the parameter to use French names is True, use French name
-                if param_french_name:
-                    full_species_group_lyr = Tool.create_optional_species_group_lyr(m,
-                                                                                    new_group_lyr,
-                                                                                    fr_name,
-                                                                                    sci_name,
-                                                                                    primary_infraspecies_group_lyr)
+            # # ADD THE PLANNED GROUP LAYERS AND OUTPUT LAYERS TO THE TOC IN A SINGLE PASS ...........................
+            KBAProfiler.startPhase("output layers")
+            KBAMapBuilder.applyOutputPlan(m, new_group_lyr, output_plan)
 
-                # if the parameter to use French names is False or None, use english name
-                else:
-                    full_species_group_lyr = Tool.create_optional_species_group_lyr(m,
-                                                                                    new_group_lyr,
-                                                                                    en_name,
-                                                                                    sci_name,
-                                                                                    primary_infraspecies_group_lyr)
-
-                # Call the create_lyr() function x3 for points, lines & EOs
-                Tool.create_lyr(m, full_species_group_lyr, full_speciesid, 'InputPoint')
-                Tool.create_lyr(m, full_species_group_lyr, full_speciesid, 'InputLine')
-                Tool.create_lyr(m, full_species_group_lyr, full_speciesid, 'EO_Polygon')
-
-                # # CREATE OUTPUT LAYERS IN TOC AND LIST OF DATASETIDS FOR RANGE / AOO / HABITAT DATASETS ............
-                # Iterate through the dictionary of filtered datasets
-                for key in dataset_dict:
-                    myname = dataset_dict[key][0]  # Get the name of the dataset from the dictionary
-                    myvalue = dataset_dict[key][1]  # Get the datasetsourceid value from the dictionary
-                    arcpy.AddMessage("Processing: {}".format(myname))
-
-                    # Call the readFilteredInputDatasetID function for each of the datasets in the dictionary
-                    # to create a list of the inputdatasetid values for that dataset
-                    id_values = KBAUtils.readFilteredInputDatasetID(myvalue)
-                    # arcpy.AddMessage("InputDatasetIDs: {}".format(id_values))
-
-                    # Call the create_range_lyr() function to process each of the filtered datasets as separate outputs
-                    Tool.create_range_lyr(m, full_species_group_lyr, full_speciesid, dataset_dict[key], id_values)
-
-                    # Create a merged list of the inputdatasetids for all the filtered datasets
-                    filtered_inputdatasetid_list.extend(id_values)
-
-                # # CREATE OUTPUT LAYER IN TOC FOR THE INPUTPOLYGON DATASET W/OUT THE FILTERED DATASETS ............
-                # Call the function to create the InputPolygon layer w/out the filtered datasets
-                Tool.create_poly_lyr(m, full_species_group_lyr, full_speciesid, filtered_inputdatasetid_list)
-
-                # Check to see if there are data layers in the full species group layer, if empty delete it
-                if len(full_species_group_lyr.listLayers()) > 0:
-                    pass
-                else:
-                    m.removeLayer(full_species_group_lyr)
-                    arcpy.AddWarning("There is no spatial data for parent species {}.".format(sci_name))
+            # Warn about the group layers that have no output layers, they aren't added to the map
+            for output_group in output_plan.emptyGroups():
+                arcpy.AddWarning(output_group.empty_warning)
 
             m.clearSelection()  # clear all selections
 
+            # Zoom to the output layers, using the extents in the species summary table instead of reading the features
+            if param_zoom:
+                KBAProfiler.startPhase("zoom")
+                KBAMapBuilder.zoomToPlan(aprx, m, output_plan)
+
             arcpy.AddMessage("End of script.")
 
         # Error handling for custom error related to required data layers in the map
-        except KBAExceptions.NoDataError:
+        except KBAExceptions.NoDataError as error:
             arcpy.AddError("{} Layer does not exist. "
-                           "Re-load {} from WCSC-KBA Map Template.".format(dataset, dataset))
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
 
         # Error handling for custom error related to required data tables in the map
-        except KBAExceptions.NoTableError:
+        except KBAExceptions.NoTableError as error:
             arcpy.AddError("{} Table does not exist. "
-                           "Re-load {} from WCSC-KBA Map Template.".format(table, table))
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
 
         # Error handling for custom error related to active definition queries on required layers
-        except KBAExceptions.DefQueryError:
+        except KBAExceptions.DefQueryError as error:
             arcpy.AddError("{} has an active definition query. "
-                           "Turn off all active definition queries on {} to run the tool.".format(lyr.name, lyr.name))
+                           "Turn off all active definition queries on {} to run the tool.".format(error.args[0],
+                                                                                                  error.args[0]))
+
+        # Error handling for custom error related to the selected species not existing in Biotics
+        except KBAExceptions.BioticsError:
+            arcpy.AddError("No record selected in {}. "
+                           "Please select a record using the dropdown.".format(biotics_table))
 
         # Error handling for custom error related to SpeciesData group layer not existing
         except KBAExceptions.SpeciesDataError:
@@ -560,9 +227,6 @@ class Tool:
 
         # Error handling if an error occurs while using a Geoprocessing Tool in the script
         except arcpy.ExecuteError:
-            # If the script crashes, remove the group layer
-            m.removeLayer(primary_infraspecies_group_lyr)
-
             # Get the tool error messages
             msgs = arcpy.GetMessages(2)
 
@@ -574,9 +238,6 @@ class Tool:
 
         # Error handling if the script fails for other unexplained reasons
         except:
-            # If the script crashes, remove the group layer
-            m.removeLayer(primary_infraspecies_group_lyr)
-
             # Get the traceback object
             tb = sys.exc_info()[2]
             tbinfo = traceback.format_tb(tb)[0]
@@ -589,4 +250,10 @@ class Tool:
             arcpy.AddError(pymsg)
             arcpy.AddError(msgs)
 
+        finally:
+            # Print the timing summary and write the timing report to the scratch folder
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            for timing_message in KBAProfiler.endRun(arcpy.env.scratchFolder):
+                arcpy.AddMessage(timing_message)
+
 # End of Script
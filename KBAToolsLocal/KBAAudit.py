@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAAudit.py
+#
+# Purpose:          Attribute and spatial index audit of the KBA data for the scripts in the KBAToolsLocal Toolbox.
+#                   Every query that the tools run filters on speciesid, inputdatasetid, datasetsourceid, element_code
+#                   or fullspecies_elementcode. Without an index on those fields each query reads the whole table,
+#                   which is the main reason local copies of the data can be much slower than the national database.
+#                   The audit lists the indexes that are missing from the data sources behind the layers and tables in
+#                   the map, adds them, and times a set of queries that stand for the ones the tools run, so the
+#                   effect of the new indexes can be measured before and after.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import time
+import KBABackend
+import KBAIndexes
+import KBAPlanner
+import KBAUtils
+
+# VARIABLES FOR KBAAUDIT
+
+# Fields that need an attribute index in each layer / table, the fields that the tool queries filter on
+index_fields = {"InputPoint": ["speciesid", "inputdatasetid"],
+                "InputLine": ["speciesid", "inputdatasetid"],
+                "InputPolygon": ["speciesid", "inputdatasetid"],
+                "EO_Polygon": ["speciesid"],
+                KBAIndexes.inputdataset_table: ["inputdatasetid", "datasetsourceid"],
+                KBAIndexes.species_table: ["speciesid", "fullspecies_elementcode"],
+                KBAIndexes.biotics_table: ["speciesid", "element_code"]}
+
+# Layers that need a spatial index, for drawing the output layers and zooming to them
+spatial_index_layers = ["InputPoint", "InputLine", "InputPolygon", "EO_Polygon"]
+
+# Name used for the spatial index in the audit results
+spatial_index_name = "SHAPE"
+
+# Number of species (spread across the taxon hierarchy) that the audit queries are run for
+audit_samples = 20
+
+
+# CLASSES FOR KBAAUDIT
+class IndexStatus:
+    """An index that the tools need: the layer / table, the field (spatial_index_name for the spatial index) and
+    whether the index exists (None if it can't be read, e.g. for a database view)."""
+
+    def __init__(self, table, field, exists):
+        self.table = table
+        self.field = field
+        self.exists = exists
+
+    def __repr__(self):
+        return "IndexStatus({!r}, {!r}, {!r})".format(self.table, self.field, self.exists)
+
+
+# FUNCTIONS FOR KBAAUDIT
+def auditIndexes():
+    """Return an IndexStatus for each attribute index in index_fields and each spatial index in
+    spatial_index_layers, in that order."""
+    backend = KBABackend.getBackend()
+    index_statuses = []
+
+    for table, fields in index_fields.items():
+        try:
+            indexed_fields = backend.indexedFields(table)
+        except Exception:
+            indexed_fields = None
+
+        index_statuses.extend(IndexStatus(table, field, None if indexed_fields is None else field in indexed_fields)
+                              for field in fields)
+
+    for table in spatial_index_layers:
+        try:
+            has_spatial_index = backend.hasSpatialIndex(table)
+        except Exception:
+            index_statuses.append(IndexStatus(table, spatial_index_name, None))
+            continue
+
+        # Tables without geometry (e.g. a local copy of the data without the shapes) don't need a spatial index
+        if has_spatial_index is not None:
+            index_statuses.append(IndexStatus(table, spatial_index_name, has_spatial_index))
+
+    return index_statuses
+
+
+def missingIndexes(index_statuses):
+    """Return the index statuses for the indexes that don't exist."""
+    return [index_status for index_status in index_statuses if index_status.exists is False]
+
+
+def addableIndexes(index_statuses):
+    """Return the index statuses for the missing indexes that the backend can add. Spatial indexes are left out for
+    the backends that can't add them (see KBABackend.Backend.adds_spatial_indexes)."""
+    adds_spatial_indexes = KBABackend.getBackend().adds_spatial_indexes
+
+    return [index_status for index_status in missingIndexes(index_statuses)
+            if adds_spatial_indexes or index_status.field != spatial_index_name]
+
+
+def addIndex(index_status):
+    """Add a missing index. Raises the backend error (e.g. arcpy.ExecuteError) if the index can't be added."""
+    backend = KBABackend.getBackend()
+
+    if index_status.field == spatial_index_name:
+        backend.addSpatialIndex(index_status.table)
+    else:
+        backend.addIndex(index_status.table, index_status.field)
+
+    index_status.exists = True
+
+
+def _sampleRecords():
+    """Return audit_samples Biotics records spread evenly across the taxon hierarchy, so the audit queries are the
+    same for every run against the same data."""
+    records = list(KBAIndexes.readTaxonHierarchy()["records"].values())
+    step = max(1, len(records) // audit_samples)
+
+    return [KBAUtils.SpeciesRecord._make(record) for record in records[::step][:audit_samples]]
+
+
+def auditQueries():
+    """Return the queries that stand for the ones the tools run, as [query name, function], for the sample species:
+    the grouped record counts of each feature class, the inputdatasetid values of the filtered datasets and the taxon
+    lookups by element_code, speciesid and fullspecies_elementcode. The queries read the tables directly, without the
+    session indexes, the species summary or the plan cache."""
+    backend = KBABackend.getBackend()
+    sample_records = _sampleRecords()
+    speciesids = [record.speciesid for record in sample_records]
+    datasetsourceids = ", ".join(str(KBAUtils.symbology_dict[key][1]) for key in KBAUtils.symbology_dict)
+
+    audit_queries = [["{} record counts".format(ft_type),
+                      lambda ft_type=ft_type: [backend.countGroups(ft_type, KBAPlanner.count_fields[ft_type],
+                                                                   KBAPlanner.speciesQuery([speciesid]))
+                                               for speciesid in speciesids]]
+                     for ft_type in KBAPlanner.count_fields]
+
+    audit_queries.extend([
+        ["InputDataset filtered datasets",
+         lambda: list(backend.readRows(KBAIndexes.inputdataset_table, ["inputdatasetid"],
+                                       "datasetsourceid IN ({})".format(datasetsourceids)))],
+        ["Biotics by element_code",
+         lambda: [list(backend.readRows(KBAIndexes.biotics_table, KBAIndexes.biotics_fields,
+                                        "element_code = '{}'".format(record.element_code)))
+                  for record in sample_records]],
+        ["Biotics by speciesid",
+         lambda: [list(backend.readRows(KBAIndexes.biotics_table, KBAIndexes.biotics_fields,
+                                        "speciesid = {}".format(speciesid))) for speciesid in speciesids]],
+        ["Species by fullspecies_elementcode",
+         lambda: [list(backend.readRows(KBAIndexes.species_table, ["speciesid"],
+                                        "fullspecies_elementcode = '{}'".format(record.element_code)))
+                  for record in sample_records]]])
+
+    return audit_queries
+
+
+def timeQueries(audit_queries=None):
+    """Run each audit query once and return a list of [query name, seconds]."""
+    query_timings = []
+    for query_name, query_function in audit_queries or auditQueries():
+        start = time.perf_counter()
+        query_function()
+        query_timings.append([query_name, time.perf_counter() - start])
+
+    return query_timings
@@ -0,0 +1,582 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBABackend.py
+#
+# Purpose:          Data access for the scripts in the KBAToolsLocal Toolbox.
+#                   ArcpyBackend reads the tables and layers in the current ArcGIS Pro map.
+#                   SQLiteBackend reads a local SQLite / GeoPackage copy of the same tables, so that the species
+#                   resolution and layer planning logic can be run (and benchmarked) without ArcGIS Pro.
+#                   The scripts get the backend with getBackend(). ArcpyBackend is used unless another backend has
+#                   been set with setBackend().
+#                   Backends that set concurrent_reads can be read from several threads at once (see
+#                   KBAPlanner.readCountMatrix). SQLiteBackend opens one connection per thread.
+#                   The backends also list and add the attribute and spatial indexes of the tables (see KBAAudit).
+#                   A backend can also read and write the tables in a workspace (a geodatabase or GeoPackage) instead
+#                   of the map, which is used to keep a local replica of the national database in sync (see KBAReplica).
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import contextlib
+import os
+import sqlite3
+import tempfile
+import threading
+
+# VARIABLES FOR KBABACKEND
+
+# Backend used by the scripts, created on the first call to getBackend()
+_backend = None
+
+# Lower case name of the field that editor tracking adds to a table for the time of the last edit of each row
+change_field = "last_edited_date"
+
+# Extensions of the single file databases, whose modified time changes when any of their tables is edited
+file_databases = [".gpkg", ".sqlite", ".geodatabase"]
+
+# Extensions of the GeoPackage and SQLite databases, which arcpy can't open an edit session on
+sqlite_databases = [".gpkg", ".sqlite"]
+
+
+# CLASSES FOR KBABACKEND
+class Backend:
+    """Data access interface used by the scripts. Tables are referred to by their name in the WCSC-KBA map."""
+
+    # True if reads run faster on several threads at once, e.g. file geodatabases on a network share
+    concurrent_reads = False
+
+    # True if addSpatialIndex can add a spatial index to the tables (see KBAAudit.addableIndexes)
+    adds_spatial_indexes = True
+
+    def readRows(self, table, fields, where_clause=None):
+        """Yield a tuple of the field values for each row in the table that matches the where clause."""
+        raise NotImplementedError
+
+    def countRows(self, table, where_clause=None):
+        """Return the number of rows in the table that match the where clause."""
+        raise NotImplementedError
+
+    def countGroups(self, table, group_fields, where_clause=None):
+        """Return a dictionary of (group field values) : number of rows, for the rows that match the where clause."""
+        raise NotImplementedError
+
+    def summarizeGroups(self, table, group_fields, where_clause=None):
+        """Return a dictionary of (group field values) : [number of rows, xmin, ymin, xmax, ymax], for the rows that
+        match the where clause. The extent values are None if the extent of the features can't be read."""
+        raise NotImplementedError
+
+    def tableStamp(self, table):
+        """Return a JSON serializable value that changes when the contents of the table change, or None if changes to
+        the table can't be detected, in which case nothing read from the table is cached between tool runs."""
+        raise NotImplementedError
+
+    def homeFolder(self):
+        """Return the folder that holds the files written by the tools for the current project."""
+        raise NotImplementedError
+
+    def indexedFields(self, table):
+        """Return the lower case names of the fields that are the first field of an attribute index on the table."""
+        raise NotImplementedError
+
+    def hasSpatialIndex(self, table):
+        """Return True if the table has a spatial index, False if it doesn't, or None if it has no geometry."""
+        raise NotImplementedError
+
+    def addIndex(self, table, field):
+        """Add an attribute index on a field of the table."""
+        raise NotImplementedError
+
+    def addSpatialIndex(self, table):
+        """Add a spatial index to the table."""
+        raise NotImplementedError
+
+    def hasTable(self, table):
+        """Return True if the table exists."""
+        raise NotImplementedError
+
+    def subqueryTableName(self, table, query_table):
+        """Return the name of the table to use in a sql subquery of a where clause on query_table (e.g.
+        kba.dbo.InputDataset in an enterprise geodatabase), or None if the name can't be resolved in the workspace of
+        query_table. The where clauses then list the values instead (see KBAUtils.inputDatasetPredicate)."""
+        return None
+
+    def fieldNames(self, table):
+        """Return the names of the fields that are copied to a replica of the table (see KBAReplica)."""
+        raise NotImplementedError
+
+    def createTable(self, table, source):
+        """Create an empty table with the schema of the table in the source backend (a backend of the same type)."""
+        raise NotImplementedError
+
+    def deleteRows(self, table, where_clause):
+        """Delete the rows in the table that match the where clause and return the number of rows deleted."""
+        raise NotImplementedError
+
+    def insertRows(self, table, fields, rows):
+        """Insert the rows (tuples of the field values) in the table and return the number of rows inserted."""
+        raise NotImplementedError
+
+    def transaction(self):
+        """Return a context manager for a transaction, which writes all of the changes made inside it or none of
+        them."""
+        raise NotImplementedError
+
+
+class ArcpyBackend(Backend):
+    """Read the tables and layers in the current ArcGIS Pro map with arcpy, or the tables in a workspace (e.g. a file
+    geodatabase, GeoPackage or enterprise geodatabase connection file) if one is given."""
+
+    # Each thread reads with its own search cursor, which hides most of the I/O latency of network geodatabases
+    concurrent_reads = True
+
+    # Key : table name in the WCSC-KBA map, val : table name in the workspace
+    table_names = {"Species (view only)": "Species"}
+
+    def __init__(self, workspace=None):
+        # arcpy is only imported when it is used, so that the other backends work without ArcGIS Pro
+        import arcpy
+        self.arcpy = arcpy
+        self.workspace = workspace
+
+        # Key : table name in the WCSC-KBA map, val : path of the table in the workspace
+        self._table_paths = {}
+
+        # Key : (table, query table), val : name of the table in sql subqueries on the query table, or None
+        self._subquery_names = {}
+
+    def tablePath(self, table):
+        """Return the table name in the map, or the path of the table in the workspace if there is one. Tables in
+        an enterprise geodatabase are found by their unqualified name (e.g. InputPoint for kba.dbo.InputPoint)."""
+        if self.workspace is None:
+            return table
+
+        if table not in self._table_paths:
+            table_name = self.table_names.get(table, table)
+            table_path = os.path.join(self.workspace, table_name)
+
+            if not self.arcpy.Exists(table_path):
+                walk_names = [name for _, _, names in self.arcpy.da.Walk(self.workspace, ["FeatureClass", "Table"])
+                              for name in names]
+                qualified_names = [name for name in walk_names if name.split(".")[-1].lower() == table_name.lower()]
+                if not qualified_names:
+                    return table_path  # The table doesn't exist (yet), see hasTable and createTable
+
+                table_path = os.path.join(self.workspace, qualified_names[0])
+
+            self._table_paths[table] = table_path
+
+        return self._table_paths[table]
+
+    def workspacePath(self, catalog_path):
+        """Return the path of the workspace of a table from its catalog path, above the feature dataset it is in."""
+        workspace_path = os.path.dirname(catalog_path)
+        if getattr(self.arcpy.Describe(workspace_path), "dataType", None) == "FeatureDataset":
+            workspace_path = os.path.dirname(workspace_path)
+
+        return workspace_path
+
+    def editSessions(self):
+        """Return True if the changes to the tables in the workspace can be made in an edit session (transaction),
+        which isn't the case for GeoPackage and SQLite workspaces."""
+        return self.workspace is not None and \
+            os.path.splitext(self.workspace.rstrip("\\/"))[1].lower() not in sqlite_databases
+
+    def readRows(self, table, fields, where_clause=None):
+        with self.arcpy.da.SearchCursor(self.tablePath(table), fields, where_clause) as cursor:
+            for row in cursor:
+                yield row
+
+    def countRows(self, table, where_clause=None):
+        # Counting the object ids in a cursor avoids creating a feature layer for each count
+        with self.arcpy.da.SearchCursor(self.tablePath(table), ["OID@"], where_clause) as cursor:
+            return sum(1 for row in cursor)
+
+    def countGroups(self, table, group_fields, where_clause=None):
+        # Only the group fields are read (no geometry), so a single pass over the table is cheap
+        group_counts = {}
+        with self.arcpy.da.SearchCursor(self.tablePath(table), group_fields, where_clause) as cursor:
+            for row in cursor:
+                group_counts[row] = group_counts.get(row, 0) + 1
+
+        return group_counts
+
+    def summarizeGroups(self, table, group_fields, where_clause=None):
+        # The extent of each feature is read with the SHAPE@EXTENT token, so the full geometry is never loaded
+        group_summaries = {}
+        with self.arcpy.da.SearchCursor(self.tablePath(table), group_fields + ["SHAPE@EXTENT"],
+                                        where_clause) as cursor:
+            for row in cursor:
+                extent = row[-1]
+                summary = group_summaries.setdefault(row[:-1], [0, None, None, None, None])
+                summary[0] += 1
+
+                # Features with empty geometry have no extent
+                if extent is not None:
+                    summary[1:] = [extent.XMin if summary[1] is None else min(summary[1], extent.XMin),
+                                   extent.YMin if summary[2] is None else min(summary[2], extent.YMin),
+                                   extent.XMax if summary[3] is None else max(summary[3], extent.XMax),
+                                   extent.YMax if summary[4] is None else max(summary[4], extent.YMax)]
+
+        return group_summaries
+
+    def editedField(self, table):
+        """Return the name of the field that holds the time of the last edit of each row (editor tracking), or None
+        if the table doesn't have one."""
+        description = self.arcpy.Describe(self.arcpy.Describe(self.tablePath(table)).catalogPath)
+        if getattr(description, "editorTrackingEnabled", False) and description.editedAtFieldName:
+            return description.editedAtFieldName
+
+        for field in self.arcpy.ListFields(self.tablePath(table)):
+            if field.name.lower() == change_field:
+                return field.name
+
+        return None
+
+    def tableStamp(self, table):
+        row_count = int(self.arcpy.GetCount_management(self.tablePath(table)).getOutput(0))
+        catalog_path = self.arcpy.Describe(self.tablePath(table)).catalogPath
+
+        # Tables with editor tracking (e.g. in the national enterprise geodatabase) hold the time of the last edit of
+        # each row, which also changes with edits that keep the row count. The database sorts the rows on the field,
+        # so only the latest row is read
+        edited_field = self.editedField(table)
+        if edited_field is not None:
+            with self.arcpy.da.SearchCursor(self.tablePath(table), [edited_field],
+                                            "{} IS NOT NULL".format(edited_field),
+                                            sql_clause=(None, "ORDER BY {} DESC".format(edited_field))) as cursor:
+                last_edited = next(iter(cursor), [None])[0]
+
+            return [row_count, str(last_edited), catalog_path]
+
+        # Walk up the catalog path to the first item on disk (e.g. the .gdb folder for a file geodatabase table)
+        disk_path = catalog_path
+        while disk_path and not os.path.exists(disk_path):
+            parent_path = os.path.dirname(disk_path)
+            if parent_path == disk_path:
+                break
+            disk_path = parent_path
+
+        # Tables in a file geodatabase are stored as files inside the .gdb folder (see fileGeodatabaseModified)
+        if disk_path and os.path.isdir(disk_path):
+            modified = fileGeodatabaseModified(disk_path, getattr(self.arcpy.Describe(catalog_path), "DSID", None))
+
+        # Tables in a GeoPackage or SQLite database are stored in the database file
+        elif disk_path and os.path.splitext(disk_path)[1].lower() in file_databases:
+            modified = os.path.getmtime(disk_path)
+
+        # The data sources of other workspaces (e.g. an enterprise geodatabase connection file, or a feature service)
+        # don't change on disk when their tables are edited
+        else:
+            return None
+
+        return [row_count, round(modified, 3), catalog_path]
+
+    def homeFolder(self):
+        try:
+            # Keep the files with the current ArcGIS Pro project
+            return self.arcpy.mp.ArcGISProject("CURRENT").homeFolder
+        except Exception:
+            # There is no current project when the scripts are run outside of ArcGIS Pro
+            return tempfile.gettempdir()
+
+    def indexedFields(self, table):
+        # The indexes belong to the data source of the layer or table in the map
+        catalog_path = self.arcpy.Describe(self.tablePath(table)).catalogPath
+        return set(index.fields[0].name.lower() for index in self.arcpy.ListIndexes(catalog_path) if index.fields)
+
+    def hasSpatialIndex(self, table):
+        description = self.arcpy.Describe(self.arcpy.Describe(self.tablePath(table)).catalogPath)
+        if not hasattr(description, "shapeType"):
+            return None
+
+        return bool(description.hasSpatialIndex)
+
+    def addIndex(self, table, field):
+        catalog_path = self.arcpy.Describe(self.tablePath(table)).catalogPath
+
+        # Index names are unique in some enterprise geodatabases and limited to 30 characters in older ones
+        table_name = os.path.basename(catalog_path).split(".")[-1]
+        index_name = "{}_{}".format(field, table_name)[:26].lower() + "_idx"
+        self.arcpy.AddIndex_management(catalog_path, [field], index_name, "NON_UNIQUE", "NON_ASCENDING")
+
+    def addSpatialIndex(self, table):
+        self.arcpy.AddSpatialIndex_management(self.arcpy.Describe(self.tablePath(table)).catalogPath)
+
+    def hasTable(self, table):
+        return bool(self.arcpy.Exists(self.tablePath(table)))
+
+    def subqueryTableName(self, table, query_table):
+        # The names are resolved once per session, the same as the table paths. The table is named as it is in the
+        # workspace (e.g. kba.dbo.InputDataset), and only if the where clause is run in the same workspace
+        if (table, query_table) not in self._subquery_names:
+            table_path = self.arcpy.Describe(self.tablePath(table)).catalogPath
+            query_path = self.arcpy.Describe(self.tablePath(query_table)).catalogPath
+
+            if os.path.normcase(self.workspacePath(table_path)) == os.path.normcase(self.workspacePath(query_path)):
+                self._subquery_names[(table, query_table)] = os.path.basename(table_path)
+            else:
+                self._subquery_names[(table, query_table)] = None
+
+        return self._subquery_names[(table, query_table)]
+
+    def fieldNames(self, table):
+        # Object ids, global ids and the shape length / area fields are written by the geodatabase, the geometry is
+        # copied with the SHAPE@ token
+        table_path = self.tablePath(table)
+        field_names = [field.name for field in self.arcpy.ListFields(table_path)
+                       if field.editable and field.type not in ("OID", "Geometry", "GlobalID")]
+
+        if hasattr(self.arcpy.Describe(table_path), "shapeType"):
+            field_names.append("SHAPE@")
+
+        return field_names
+
+    def createTable(self, table, source):
+        source_path = self.arcpy.Describe(source.tablePath(table)).catalogPath
+        source_description = self.arcpy.Describe(source_path)
+        table_name = self.table_names.get(table, table)
+
+        # The source table is used as the template, so the replica has the same fields and coordinate system
+        if hasattr(source_description, "shapeType"):
+            self.arcpy.CreateFeatureclass_management(self.workspace, table_name, source_description.shapeType.upper(),
+                                                     source_path, "SAME_AS_TEMPLATE", "SAME_AS_TEMPLATE", source_path)
+        else:
+            self.arcpy.CreateTable_management(self.workspace, table_name, source_path)
+
+        self._table_paths.pop(table, None)
+
+    def deleteRows(self, table, where_clause):
+        # The rows are deleted in one operation on a view of the rows that match the where clause
+        table_view = self.arcpy.MakeTableView_management(self.tablePath(table), "kba_delete_rows",
+                                                         where_clause).getOutput(0)
+        try:
+            row_count = int(self.arcpy.GetCount_management(table_view).getOutput(0))
+            if row_count:
+                self.arcpy.DeleteRows_management(table_view)
+        finally:
+            self.arcpy.Delete_management(table_view)
+
+        return row_count
+
+    def insertRows(self, table, fields, rows):
+        row_count = 0
+        with self.arcpy.da.InsertCursor(self.tablePath(table), fields) as cursor:
+            for row in rows:
+                cursor.insertRow(row)
+                row_count += 1
+
+        return row_count
+
+    def transaction(self):
+        # The tables in the map are written in the edit session of ArcGIS Pro, and GeoPackage / SQLite workspaces don't
+        # support edit sessions, so their changes are written as they are made
+        if not self.editSessions():
+            return contextlib.nullcontext()
+
+        # The edit session is saved when the block ends, or its edits are discarded if the block raises an error
+        return self.arcpy.da.Editor(self.workspace)
+
+
+class SQLiteBackend(Backend):
+    """Read a local SQLite / GeoPackage copy of the WCSC-KBA tables with the sqlite3 module."""
+
+    # Key : table name in the WCSC-KBA map, val : table name in the SQLite database
+    table_names = {"Species (view only)": "Species"}
+
+    # The GeoPackage R*Tree index and its triggers are written by the GDAL / SpatiaLite extensions, which the sqlite3
+    # module doesn't have
+    adds_spatial_indexes = False
+
+    def __init__(self, database, concurrent_reads=False):
+        self.database = database
+
+        # A local database is read in-process, so reading on several threads is usually slower (see KBABenchmark)
+        self.concurrent_reads = concurrent_reads
+
+        # Each thread gets its own connection, so that worker threads (e.g. the grouped counts in KBAPlanner) can
+        # read the database at the same time
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        # Key : table, val : name of the table in sql subqueries, or None if the table doesn't exist
+        self._subquery_names = {}
+
+    @property
+    def connection(self):
+        """Return the connection to the database for the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.database, check_same_thread=False)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+
+        return connection
+
+    def close(self):
+        """Close the connections opened by all the threads."""
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+        self._local = threading.local()
+
+    def tableName(self, table):
+        """Return the quoted name of the table in the SQLite database."""
+        return '"{}"'.format(self.table_names.get(table, table))
+
+    def readRows(self, table, fields, where_clause=None):
+        sql = "SELECT {} FROM {}".format(", ".join(fields), self.tableName(table))
+        if where_clause:
+            sql += " WHERE " + where_clause
+
+        for row in self.connection.execute(sql):
+            yield row
+
+    def countRows(self, table, where_clause=None):
+        sql = "SELECT COUNT(*) FROM {}".format(self.tableName(table))
+        if where_clause:
+            sql += " WHERE " + where_clause
+
+        return self.connection.execute(sql).fetchone()[0]
+
+    def countGroups(self, table, group_fields, where_clause=None):
+        sql = "SELECT {0}, COUNT(*) FROM {1}".format(", ".join(group_fields), self.tableName(table))
+        if where_clause:
+            sql += " WHERE " + where_clause
+        sql += " GROUP BY " + ", ".join(group_fields)
+
+        return {tuple(row[:-1]): row[-1] for row in self.connection.execute(sql)}
+
+    def spatialIndexName(self, table):
+        """Return the name of the GeoPackage R*Tree spatial index of the table, or None if there isn't one."""
+        try:
+            row = self.connection.execute("SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?",
+                                          (self.table_names.get(table, table),)).fetchone()
+        except sqlite3.Error:
+            return None  # Not a GeoPackage
+
+        if row is None:
+            return None
+
+        rtree_name = "rtree_{}_{}".format(self.table_names.get(table, table), row[0])
+        if self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (rtree_name,)).fetchone() is None:
+            return None
+
+        return rtree_name
+
+    def summarizeGroups(self, table, group_fields, where_clause=None):
+        rtree_name = self.spatialIndexName(table)
+
+        # The feature extents are read from the GeoPackage spatial index, so the geometry blobs are never parsed
+        if rtree_name is not None:
+            sql = "SELECT {0}, COUNT(*), MIN(r.minx), MIN(r.miny), MAX(r.maxx), MAX(r.maxy) " \
+                  "FROM {1} t LEFT JOIN \"{2}\" r ON r.id = t.rowid".format(
+                      ", ".join("t." + field for field in group_fields), self.tableName(table), rtree_name)
+        else:
+            sql = "SELECT {0}, COUNT(*), NULL, NULL, NULL, NULL FROM {1} t".format(
+                ", ".join("t." + field for field in group_fields), self.tableName(table))
+
+        if where_clause:
+            sql += " WHERE " + where_clause
+        sql += " GROUP BY " + ", ".join("t." + field for field in group_fields)
+
+        return {tuple(row[:-5]): list(row[-5:]) for row in self.connection.execute(sql)}
+
+    def tableStamp(self, table):
+        modified = os.path.getmtime(self.database) if os.path.exists(self.database) else 0.0
+        return [self.countRows(table), round(modified, 3), "{}\\{}".format(self.database, table)]
+
+    def homeFolder(self):
+        return os.path.dirname(os.path.abspath(self.database))
+
+    def indexedFields(self, table):
+        indexed_fields = set()
+        for index_row in self.connection.execute("PRAGMA index_list({})".format(self.tableName(table))).fetchall():
+            first_field = self.connection.execute("PRAGMA index_info(\"{}\")".format(index_row[1])).fetchone()
+            if first_field is not None and first_field[2] is not None:
+                indexed_fields.add(first_field[2].lower())
+
+        return indexed_fields
+
+    def hasSpatialIndex(self, table):
+        try:
+            row = self.connection.execute("SELECT 1 FROM gpkg_geometry_columns WHERE table_name = ?",
+                                          (self.table_names.get(table, table),)).fetchone()
+        except sqlite3.Error:
+            return None  # Not a GeoPackage, so the tables have no geometry
+
+        if row is None:
+            return None
+
+        return self.spatialIndexName(table) is not None
+
+    def addIndex(self, table, field):
+        with self.connection:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS \"{}_{}_idx\" ON {} ({})".format(
+                self.table_names.get(table, table), field.lower(), self.tableName(table), field))
+
+    def subqueryTableName(self, table, query_table):
+        # All the tables are in the same database, the names are resolved once per backend
+        if table not in self._subquery_names:
+            self._subquery_names[table] = self.tableName(table) if self.hasTable(table) else None
+
+        return self._subquery_names[table]
+
+    def hasTable(self, table):
+        return self.connection.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') And name = ?",
+                                       (self.table_names.get(table, table),)).fetchone() is not None
+
+    def fieldNames(self, table):
+        return [row[1] for row in self.connection.execute("PRAGMA table_info({})".format(self.tableName(table)))]
+
+    def createTable(self, table, source):
+        # The table is created with the same statement as the source table, followed by the same indexes
+        schema_sql = [row[0] for row in source.connection.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? And sql IS NOT NULL ORDER BY type = 'index'",
+            (source.table_names.get(table, table),))]
+
+        with self.connection:
+            for sql in schema_sql:
+                self.connection.execute(sql)
+
+    def deleteRows(self, table, where_clause):
+        return self.connection.execute("DELETE FROM {} WHERE {}".format(self.tableName(table), where_clause)).rowcount
+
+    def insertRows(self, table, fields, rows):
+        cursor = self.connection.executemany("INSERT INTO {} ({}) VALUES ({})".format(
+            self.tableName(table), ", ".join(fields), ", ".join("?" * len(fields))), rows)
+
+        return cursor.rowcount
+
+    def transaction(self):
+        # The connection commits the changes when the block ends, or rolls them back if the block raises an error
+        return self.connection
+
+
+# FUNCTIONS FOR KBABACKEND
+def fileGeodatabaseModified(gdb_path, dsid=None):
+    """Return the newest modified time of the files of a table in a file geodatabase folder. The files of a table are
+    named after its dataset id in hexadecimal (e.g. a0000000b.gdbtable for DSID 11), so edits to other tables don't
+    change it. All the files are used if the dataset id isn't known. The .lock files are left out, because ArcGIS Pro
+    writes them when it opens the data."""
+    table_prefix = "a{:08x}.".format(dsid) if dsid else ""
+
+    return max([entry.stat().st_mtime for entry in os.scandir(gdb_path)
+                if entry.name.lower().startswith(table_prefix) and not entry.name.lower().endswith(".lock")],
+               default=0.0)
+
+
+def getBackend():
+    """Return the backend used by the scripts, creating an ArcpyBackend if no backend has been set."""
+    global _backend
+    if _backend is None:
+        _backend = ArcpyBackend()
+
+    return _backend
+
+
+def setBackend(backend):
+    """Set the backend used by the scripts, e.g. a SQLiteBackend to run the planning logic without ArcGIS Pro."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,152 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAEngine.py
+#
+# Purpose:          Output plan engine shared by the mapping tools in the KBAToolsLocal Toolbox.
+#                   A tool describes what it wants to map as a plan request: the root taxon, the grouping strategy
+#                   (the taxon and its infraspecies in a single group layer, or in separate group layers), whether the
+#                   parent full species of an infraspecies is added and whether the group layers use French names.
+#                   The engine resolves the requests from the taxon hierarchy (KBAPlanner) and compiles them into one
+#                   output plan (KBAPlanner.OutputPlan). The output layers of all the groups in the plan are planned
+#                   with a single call to the plan cache (KBAPlanCache), so the features are counted with one grouped
+#                   query per feature class for the whole run, whatever the tool.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import KBAPlanCache
+import KBAPlanner
+import KBAUtils
+
+# VARIABLES FOR KBAENGINE
+
+# Grouping strategies for the root taxon and its infraspecies
+# single : one group layer for the taxon and its infraspecies, separate : one group layer for each of them
+grouping_strategies = ["single", "separate"]
+
+# Name of the plan cache entries (KBAPlanCache). The output layers of a group only depend on its speciesid values, so
+# every tool (and the export tool) shares the same entries
+plan_cache_name = "mapping"
+
+
+# CLASSES FOR KBAENGINE
+class PlanRequest:
+    """A declarative request for an output plan: the root taxon (a national scientific name, or a Biotics record from
+    KBAUtils.SpeciesRecord), the grouping strategy, whether the parent full species of an infraspecies is added in a
+    group below and whether the group layers use French names. The Biotics records are set by resolveRequests."""
+
+    def __init__(self, taxon, grouping="single", include_parent=False, french_names=False):
+        if grouping not in grouping_strategies:
+            raise ValueError("Unknown grouping strategy: {}".format(grouping))
+
+        self.taxon = taxon
+        self.grouping = grouping
+        self.include_parent = include_parent
+        self.french_names = french_names
+        # Biotics record of the root taxon, the records that are already read (e.g. in a batch) aren't read again
+        self.record = taxon if isinstance(taxon, KBAUtils.SpeciesRecord) else None
+        self.infraspeciesids = []  # speciesid values of the infraspecies of the root taxon
+        self.infraspecies_records = []  # Biotics records of the infraspecies (separate grouping only)
+        self.parent_record = None  # Biotics record of the parent full species (include_parent only)
+
+    def __repr__(self):
+        return "PlanRequest({!r}, {!r})".format(self.taxon, self.grouping)
+
+    def speciesids(self):
+        """Return the speciesid values of the root taxon and its infraspecies (root taxon first)."""
+        return [self.record.speciesid] + self.infraspeciesids
+
+    def useFrenchNames(self):
+        """Return True if the group layers use French names, i.e. French names were requested and the root taxon has a
+        French name."""
+        return bool(self.french_names and self.record.fr_name)
+
+
+# FUNCTIONS FOR KBAENGINE
+def commonName(record, french_names):
+    """Return the French name of a Biotics record if french_names is True and it has one, otherwise the English
+    name."""
+    return record.fr_name if french_names and record.fr_name else record.en_name
+
+
+def groupName(record, french_names, infraspecies_exist=False, grouping="single"):
+    """Return the TOC name of a group layer for a Biotics record: Common Name (Scientific Name), followed by what the
+    group shows of the infraspecies of a full species when they exist."""
+    grp_lyr_name = "{} ({})".format(commonName(record, french_names), record.sci_name)
+
+    if infraspecies_exist and grouping == "single":
+        return "{} including data identified to infraspecies".format(grp_lyr_name)
+
+    if infraspecies_exist:
+        return "{} data not identified to infraspecies".format(grp_lyr_name)
+
+    return grp_lyr_name
+
+
+def resolveRequests(plan_requests):
+    """Set the Biotics records of the root taxon, its infraspecies and (if requested) its parent full species for a
+    list of plan requests, from the taxon hierarchy. Raises KBAExceptions.BioticsError if a taxon isn't in Biotics."""
+    for plan_request in plan_requests:
+        if plan_request.record is None:
+            plan_request.record = KBAPlanner.readBioticsRecord(plan_request.taxon)
+
+        speciesid, element_code = plan_request.record[:2]
+        plan_request.infraspeciesids = KBAPlanner.readInfraspeciesIds(element_code, speciesid)
+
+        # The infraspecies records are only needed to name their group layers
+        if plan_request.grouping == "separate":
+            plan_request.infraspecies_records = [KBAPlanner.readBioticsRecordById(infraspeciesid)
+                                                 for infraspeciesid in plan_request.infraspeciesids]
+
+        # Get the full species record in Biotics that is related to the infraspecies from the taxon hierarchy
+        if plan_request.include_parent and not plan_request.record.isFullSpecies():
+            plan_request.parent_record = KBAPlanner.readBioticsRecordByElementCode(
+                KBAPlanner.readFullSpeciesElementCode(speciesid))
+
+    return plan_requests
+
+
+def planRequestGroups(plan_request):
+    """Return the [group layer name, speciesid values, empty warning] of each group layer for a resolved plan request,
+    in TOC order (top first)."""
+    record = plan_request.record
+    french_names = plan_request.useFrenchNames()
+    infraspecies_exist = bool(plan_request.infraspeciesids)
+
+    if plan_request.grouping == "single":
+        request_groups = [[groupName(record, french_names, infraspecies_exist, "single"),
+                           plan_request.speciesids(),
+                           "There is no spatial data for {}.".format(record.sci_name)]]
+
+    else:
+        # The full species first, then each infraspecies in a group layer below it
+        request_groups = [[groupName(record, french_names, infraspecies_exist, "separate"),
+                           [record.speciesid],
+                           "There is no spatial data for {}.".format(record.sci_name)]]
+        request_groups.extend([groupName(infra_record, french_names),
+                               [infra_record.speciesid],
+                               "There is no spatial data for infraspecies {}.".format(infra_record.sci_name)]
+                              for infra_record in plan_request.infraspecies_records)
+
+    if plan_request.parent_record is not None:
+        # The parent full species only shows the data that isn't identified to the infraspecies
+        request_groups.append([groupName(plan_request.parent_record, french_names, True, "separate"),
+                               [plan_request.parent_record.speciesid],
+                               "There is no spatial data for parent species {}.".format(
+                                   plan_request.parent_record.sci_name)])
+
+    return request_groups
+
+
+def compilePlan(plan_requests, output_plan=None):
+    """Compile a list of resolved plan requests into an output plan, with the groups of each request in the order of
+    the requests. The output layers of all the groups are planned with a single call to the plan cache, so the groups
+    that aren't cached are counted together. The groups are added to output_plan if one is given."""
+    if output_plan is None:
+        output_plan = KBAPlanner.OutputPlan()
+
+    plan_groups = [request_group for plan_request in plan_requests for request_group in planRequestGroups(plan_request)]
+    group_lyrs = KBAPlanCache.planGroupLayers(plan_cache_name, [speciesids for _, speciesids, _ in plan_groups])
+
+    for (grp_lyr_name, speciesids, empty_warning), output_lyrs in zip(plan_groups, group_lyrs):
+        output_plan.addGroup(grp_lyr_name, speciesids, output_lyrs, empty_warning)
+
+    return output_plan
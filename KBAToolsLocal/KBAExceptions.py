@@ -24,3 +24,13 @@ class SpeciesDataError(Exception):
 class BioticsError(Exception):
     """Exception raised for BioticsError in the tool."""
     pass
+
+
+class BatchInputError(Exception):
+    """Exception raised for BatchInputError in the tool."""
+    pass
+
+
+class GeographicError(Exception):
+    """Exception raised for GeographicError in the tool."""
+    pass
@@ -0,0 +1,178 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAExport.py
+#
+# Purpose:          Per-species data packages for the scripts in the KBAToolsLocal Toolbox.
+#                   Each species is written to its own GeoPackage with one table for each output layer that the mapping
+#                   tool would add to the map (points, lines, EO polygons, the filtered datasets in
+#                   KBAUtils.symbology_dict and the remaining InputPolygons), using the same sql queries (KBAPlanner)
+#                   and the same plan cache (KBAPlanCache).
+#                   The packages are written by a pool of worker processes (ExportPool), one species at a time per
+#                   worker, which is started once for the export and reused for every buffer of species. The
+#                   features are copied one at a time from a search cursor to an insert cursor, so the memory used by a
+#                   worker doesn't depend on the number of features or vertices of the species.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import multiprocessing
+import os
+import re
+import sys
+import KBAEngine
+import KBAPlanCache
+
+# VARIABLES FOR KBAEXPORT
+
+# Default number of worker processes that write the data packages
+export_workers = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+# Name of the data package for a species, from the speciesid and the national scientific name
+package_file_name = "{}_{}.gpkg"
+
+
+# CLASSES FOR KBAEXPORT
+class ExportJob:
+    """A data package planned for a species: the package path, the data layers that the features are read from
+    (key : feature class, val : catalog path) and the [table name, feature class, sql query] of each output table.
+    Export jobs are sent to the worker processes, so they only hold plain values."""
+
+    def __init__(self, name, package_path, source_paths, output_tables):
+        self.name = name
+        self.package_path = package_path
+        self.source_paths = source_paths
+        self.output_tables = output_tables
+
+    def __repr__(self):
+        return "ExportJob({!r}, {} output tables)".format(self.name, len(self.output_tables))
+
+
+class ExportPool:
+    """The worker processes that write the data packages of an export. The processes are started once, for the first
+    list of export jobs that needs more than one worker, and write the packages of every later list (e.g. every
+    buffer of species) until the export pool is closed. Use it as a context manager, so the processes are stopped
+    when the export ends or fails."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or export_workers
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _startPool(self):
+        """Start the worker processes. They are started with a fresh interpreter (not forked), which is the only
+        method that works inside ArcGIS Pro, and the toolbox folder is passed on in sys.path so they can import this
+        module."""
+        context = multiprocessing.get_context("spawn")
+        context.set_executable(_pythonExecutable())
+        self._pool = context.Pool(self.workers)
+
+    def exportPackages(self, export_jobs):
+        """Write the data packages for a list of export jobs. Yields the result of exportPackage for each job as soon
+        as it is written, in the order they finish."""
+        # A single worker (or a single species before the workers are started) is written in the tool process,
+        # without the cost of starting a process
+        if self._pool is None and min(self.workers, len(export_jobs)) <= 1:
+            for export_job in export_jobs:
+                yield exportPackage(export_job)
+            return
+
+        if self._pool is None:
+            self._startPool()
+
+        for export_result in self._pool.imap_unordered(exportPackage, export_jobs):
+            yield export_result
+
+
+# FUNCTIONS FOR KBAEXPORT
+def tableName(lyr_name):
+    """Return the GeoPackage table name for an output layer name, without the record count,
+    e.g. ECCC Range Map 1234+ (5 records) > ECCC_Range_Map_1234."""
+    return re.sub(r"\W+", "_", lyr_name.rsplit(" (", 1)[0]).strip("_")
+
+
+def packagePath(output_folder, speciesid, sci_name):
+    """Return the path of the data package for a species in the output folder."""
+    return os.path.join(output_folder, package_file_name.format(speciesid, re.sub(r"\W+", "_", sci_name).strip("_")))
+
+
+def planExportJobs(output_folder, source_paths, species_list):
+    """Return an export job for each (speciesid values, national scientific name) in the species list, in the same
+    order. The output tables are the output layers that have records (see KBAPlanCache.planGroupLayers)."""
+    group_lyrs = KBAPlanCache.planGroupLayers(KBAEngine.plan_cache_name,
+                                              [speciesids for speciesids, sci_name in species_list])
+
+    return [ExportJob(sci_name,
+                      packagePath(output_folder, speciesids[0], sci_name),
+                      source_paths,
+                      [[tableName(output_lyr.name), output_lyr.ft_type, output_lyr.sql] for output_lyr in output_lyrs])
+            for (speciesids, sci_name), output_lyrs in zip(species_list, group_lyrs)]
+
+
+def _copyFeatures(arcpy, source_path, package_path, table_name, sql):
+    """Create a table in the data package with the schema of the data layer and copy the features that match the
+    sql query into it, one feature at a time. Returns the number of features."""
+    shape_type = arcpy.Describe(source_path).shapeType
+    out_table = arcpy.CreateFeatureclass_management(package_path, table_name, shape_type.upper(), source_path,
+                                                    "SAME_AS_TEMPLATE", "SAME_AS_TEMPLATE",
+                                                    source_path).getOutput(0)
+
+    # Copy the attribute fields that exist in both tables (object ids and geometry fields are written by the cursor)
+    source_fields = set(field.name.lower() for field in arcpy.ListFields(source_path))
+    fields = [field.name for field in arcpy.ListFields(out_table)
+              if field.editable and field.type not in ("OID", "Geometry", "GlobalID")
+              and field.name.lower() in source_fields]
+
+    row_count = 0
+    with arcpy.da.SearchCursor(source_path, fields + ["SHAPE@"], sql) as search_cursor, \
+            arcpy.da.InsertCursor(out_table, fields + ["SHAPE@"]) as insert_cursor:
+        for row in search_cursor:
+            insert_cursor.insertRow(row)
+            row_count += 1
+
+    return row_count
+
+
+def exportPackage(export_job):
+    """Write the data package for an export job. Runs in a worker process (or in the tool process if there is only
+    one worker). Returns [export job, [[table name, number of features]...], error messages or None]; the errors are
+    returned instead of raised so one species doesn't stop the rest of the export."""
+    import arcpy
+
+    table_counts = []
+    try:
+        # Replace the data package from an earlier export
+        if os.path.exists(export_job.package_path):
+            os.remove(export_job.package_path)
+
+        arcpy.CreateSQLiteDatabase_management(export_job.package_path, "GEOPACKAGE")
+
+        for table_name, ft_type, sql in export_job.output_tables:
+            table_counts.append([table_name, _copyFeatures(arcpy, export_job.source_paths[ft_type],
+                                                           export_job.package_path, table_name, sql)])
+
+    except arcpy.ExecuteError:
+        return [export_job, table_counts, arcpy.GetMessages(2)]
+
+    except Exception as error:
+        return [export_job, table_counts, "{}: {}".format(type(error).__name__, error)]
+
+    return [export_job, table_counts, None]
+
+
+def _pythonExecutable():
+    """Return the Python interpreter for the worker processes. Inside ArcGIS Pro sys.executable is ArcGISPro.exe, so
+    the python.exe of the active ArcGIS Pro Python environment is used instead."""
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+
+    return os.path.join(sys.exec_prefix, "python.exe")
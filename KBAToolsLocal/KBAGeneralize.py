@@ -0,0 +1,233 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAGeneralize.py
+#
+# Purpose:          Generalized polygons of the filtered datasets (KBAUtils.symbology_dict) for the scripts in the
+#                   KBAToolsLocal Toolbox.
+#                   The range, AOO, EOO and critical habitat maps are large polygons with many vertices, and drawing
+#                   their output layers is the slowest part of using the tool outputs at national scale. The
+#                   "Build Generalized Polygons" tool writes a simplified copy of each of their InputPolygon features at
+#                   several tolerances (in metres, so InputPolygon must have a projected coordinate system) to a file
+#                   geodatabase in the KBAToolsCache folder. Each tolerance is generalized from the original polygon.
+#                   Each copy keeps the object id of the original feature (source_oid) with its speciesid and
+#                   inputdatasetid values, and the InputDataset table is copied with them, so the sql queries of the
+#                   output layers work on the copies with the InputDataset table named as it is in the copy.
+#                   The mapping tools can then add a layer made from the copy whose tolerance suits the extent of each
+#                   group layer next to each output layer of the filtered datasets (generalizePlan). The generalized
+#                   layer is only drawn at overview scales, where the tolerance is smaller than a map pixel, and the
+#                   full resolution layer at the detail scales (see displayScale). The copies are only used while
+#                   InputPolygon and InputDataset haven't changed since they were built.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import contextlib
+import json
+import os
+import KBABackend
+import KBAExceptions
+import KBAIndexes
+import KBAPlanner
+import KBAUtils
+
+# VARIABLES FOR KBAGENERALIZE
+
+# Default tolerances (maximum offset from the original outline) in metres, from the finest to the coarsest copy. They
+# are converted to the linear unit of the InputPolygon coordinate system when the polygons are generalized
+generalize_tolerances = [50, 500, 5000]
+
+# Version of the generalized polygons, which is part of their stamp, so the copies written by an earlier version (with
+# the tolerances in the linear unit of the coordinate system) are built again
+generalized_version = 2
+
+# Number of map pixels across the extent of a group layer when it is viewed as a whole. The coarsest tolerance that is
+# smaller than one pixel at that scale is used for the group layer, so the simplification can't be seen
+overview_pixels = 2000
+
+# Name of the file geodatabase (in the KBAToolsCache folder) that holds the generalized polygons, of the feature class
+# for each tolerance and of the file that holds the table stamps the copies were built from
+generalized_gdb_name = "generalized_polygons.gdb"
+generalized_fc_name = "InputPolygon_G{}"
+generalized_stamp_file = "generalized_polygons.json"
+
+# Fields of the generalized feature classes, source_oid is the object id of the original InputPolygon feature
+generalized_fields = ["source_oid", "speciesid", "inputdatasetid"]
+
+# Added to the TOC name of the layers that are made from the generalized polygons
+generalized_suffix = " [generalized {:g}]"
+
+# Size of a map pixel in metres, used to find the map scales at which a tolerance can't be seen (the 0.28 mm standard
+# rendering pixel)
+map_pixel_size = 0.00028
+
+
+# FUNCTIONS FOR KBAGENERALIZE
+def generalizedWorkspace():
+    """Return the path of the file geodatabase that holds the generalized polygons."""
+    return os.path.join(KBAIndexes.cacheFolder(), generalized_gdb_name)
+
+
+def generalizedPath(tolerance):
+    """Return the path of the generalized feature class for a tolerance."""
+    return os.path.join(generalizedWorkspace(), generalized_fc_name.format("{:g}".format(tolerance).replace(".", "_")))
+
+
+def _stampPath():
+    """Return the path of the file that holds the table stamps the generalized polygons were built from."""
+    return os.path.join(KBAIndexes.cacheFolder(), generalized_stamp_file)
+
+
+def _sourceStamp():
+    """Return the table stamps of InputPolygon and InputDataset and the filtered datasets as JSON, or None if changes
+    to either table can't be detected."""
+    backend = KBABackend.getBackend()
+    stamps = [backend.tableStamp("InputPolygon"), backend.tableStamp(KBAIndexes.inputdataset_table)]
+    if None in stamps:
+        return None
+
+    return json.dumps(stamps + [KBAUtils.symbology_dict, generalized_version], sort_keys=True, default=str)
+
+
+def readGeneralizedStamp():
+    """Return the stamp of the generalized polygons as a dictionary with their tolerances (finest first) and the
+    metres per unit of their coordinate system, or None if they haven't been built or the data has changed since (or
+    changes to the data can't be detected)."""
+    try:
+        with open(_stampPath(), "r", encoding="utf-8") as stamp_file:
+            generalized_stamp = json.load(stamp_file)
+    except (OSError, ValueError):
+        return None
+
+    source_stamp = _sourceStamp()
+    if source_stamp is None or generalized_stamp.get("stamp") != source_stamp or \
+            not os.path.exists(generalizedWorkspace()):
+        return None
+
+    return generalized_stamp
+
+
+def buildGeneralized(tolerances=None):
+    """Write the generalized polygons of the filtered datasets for each tolerance in metres (generalize_tolerances by
+    default), replacing any that were built before. The features are read one at a time and each tolerance is
+    generalized from the original polygon, so the offsets of the coarser copies don't add up. Raises GeographicError
+    if InputPolygon has a geographic coordinate system, whose unit (degrees) isn't the same distance everywhere.
+    Returns [number of features, number of vertices, {tolerance : number of vertices}]."""
+    # arcpy is only imported when it is used, so that plans can be generalized without ArcGIS Pro
+    import arcpy
+
+    backend = KBABackend.getBackend()
+    tolerances = sorted(set(tolerances or generalize_tolerances))
+    workspace = generalizedWorkspace()
+
+    spatial_reference = arcpy.Describe(backend.tablePath("InputPolygon")).spatialReference
+    if spatial_reference.type == "Geographic":
+        raise KBAExceptions.GeographicError(spatial_reference.name)
+
+    meters_per_unit = spatial_reference.metersPerUnit or 1.0
+
+    # The copies are only used once they are all written, see readGeneralizedStamp
+    if os.path.exists(_stampPath()):
+        os.remove(_stampPath())
+    if arcpy.Exists(workspace):
+        arcpy.Delete_management(workspace)
+    arcpy.CreateFileGDB_management(os.path.dirname(workspace), generalized_gdb_name)
+
+    # The InputDataset table is copied so the subqueries in the planned sql queries work on the copies
+    arcpy.CopyRows_management(backend.tablePath(KBAIndexes.inputdataset_table),
+                              os.path.join(workspace, KBAIndexes.inputdataset_table))
+
+    for tolerance in tolerances:
+        out_path = generalizedPath(tolerance)
+        arcpy.CreateFeatureclass_management(workspace, os.path.basename(out_path), "POLYGON",
+                                            spatial_reference=spatial_reference)
+        arcpy.AddFields_management(out_path, [[field, "LONG"] for field in generalized_fields])
+
+    # Only the features of the filtered datasets are generalized
+    filtered_id_dict = KBAPlanner.readFilteredIdDict()
+    filtered_sql = KBAUtils.inputDatasetPredicate(
+        KBAUtils.unionIdSets([filtered_id_dict[key] for key in KBAUtils.symbology_dict]),
+        [KBAUtils.symbology_dict[key][1] for key in KBAUtils.symbology_dict])
+
+    feature_count = 0
+    vertex_count = 0
+    tolerance_vertices = {tolerance: 0 for tolerance in tolerances}
+
+    with contextlib.ExitStack() as cursors:
+        insert_cursors = [cursors.enter_context(arcpy.da.InsertCursor(generalizedPath(tolerance),
+                                                                      generalized_fields + ["SHAPE@"]))
+                          for tolerance in tolerances]
+
+        for row in backend.readRows("InputPolygon", ["OID@", "speciesid", "inputdatasetid", "SHAPE@"], filtered_sql):
+            shape = row[-1]
+            feature_count += 1
+            vertex_count += shape.pointCount if shape is not None else 0
+
+            generalized_shape = shape
+            for tolerance, insert_cursor in zip(tolerances, insert_cursors):
+                # Keep the previous copy if the polygon is too small to be generalized at this tolerance
+                tolerance_shape = shape.generalize(tolerance / meters_per_unit) if shape is not None else None
+                if tolerance_shape is not None and tolerance_shape.pointCount:
+                    generalized_shape = tolerance_shape
+
+                insert_cursor.insertRow(list(row[:-1]) + [generalized_shape])
+                tolerance_vertices[tolerance] += generalized_shape.pointCount if generalized_shape is not None else 0
+
+    for tolerance in tolerances:
+        arcpy.AddIndex_management(generalizedPath(tolerance), ["speciesid"], "speciesid_idx")
+
+    with open(_stampPath(), "w", encoding="utf-8") as stamp_file:
+        json.dump({"stamp": _sourceStamp(), "tolerances": tolerances,
+                   "meters_per_unit": meters_per_unit}, stamp_file)
+
+    return [feature_count, vertex_count, tolerance_vertices]
+
+
+def chooseTolerance(extent, tolerances, meters_per_unit=1.0):
+    """Return the coarsest tolerance (in metres) that is smaller than one of overview_pixels across the [xmin, ymin,
+    xmax, ymax] extent (in the unit of the coordinate system), or None if the extent is too small for any of them (or
+    there is no extent)."""
+    if extent is None or extent[0] is None:
+        return None
+
+    extent_size = max(extent[2] - extent[0], extent[3] - extent[1]) * meters_per_unit
+    fitting_tolerances = [tolerance for tolerance in tolerances if tolerance * overview_pixels <= extent_size]
+
+    return fitting_tolerances[-1] if fitting_tolerances else None
+
+
+def displayScale(tolerance):
+    """Return the map scale (denominator) at which a tolerance in metres is the size of one map pixel. The generalized
+    polygons at that tolerance look the same as the original polygons at smaller scales (zoomed out further)."""
+    return tolerance / map_pixel_size
+
+
+def generalizePlan(output_plan):
+    """Set the generalized polygons for the output layers of the filtered datasets in an output plan, at the tolerance
+    that suits the extent of each group (see chooseTolerance). The map builder adds a layer made from them next to the
+    output layer, drawn at the map scales smaller than displayScale, and only draws the output layer at the larger
+    scales. Returns the output layers that were changed, or None if the generalized polygons haven't been built or are
+    out of date (the plan is then left at full resolution)."""
+    generalized_stamp = readGeneralizedStamp()
+    if generalized_stamp is None:
+        return None
+
+    KBAPlanner.planGroupExtents(output_plan)
+
+    generalized_lyrs = []
+    for output_group in output_plan.groups:
+        tolerance = chooseTolerance(output_group.extent, generalized_stamp["tolerances"],
+                                    generalized_stamp["meters_per_unit"])
+        if tolerance is None:
+            continue
+
+        for output_lyr in output_group.output_lyrs:
+            if output_lyr.dataset_key is not None:
+                output_lyr.generalized_path = generalizedPath(tolerance)
+                output_lyr.generalized_name = output_lyr.name + generalized_suffix.format(tolerance)
+                output_lyr.generalized_sql = "{} And {}".format(
+                    KBAPlanner.speciesQuery(output_lyr.speciesids),
+                    KBAUtils.inputDatasetPredicate(output_lyr.inputdatasetids,
+                                                   [KBAUtils.symbology_dict[output_lyr.dataset_key][1]],
+                                                   subquery_table=KBAIndexes.inputdataset_table))
+                output_lyr.generalized_scale = displayScale(tolerance)
+                generalized_lyrs.append(output_lyr)
+
+    return generalized_lyrs
@@ -0,0 +1,475 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAIndexes.py
+#
+# Purpose:          Session-wide indexes of the KBA tables used by the scripts in the KBAToolsLocal Toolbox.
+#                   The indexes are built once per ArcGIS Pro session, persisted to a small cache on disk and only
+#                   rebuilt when the underlying table changes (row count and last edit or last-modified stamp).
+#                   The index cache files can be read on a background thread when the first tool dialog is opened. The
+#                   background thread only parses the files (pure Python, no arcpy), and the tool that loads an index
+#                   still checks the table stamps itself before it uses the parsed contents. A tool that needs an index
+#                   before its file has been read reads the file itself.
+#                   The species name search index finds species by prefix (or, for typing errors, by trigram
+#                   similarity) in their scientific, English and French names, for the search parameter of the tool
+#                   dialogs.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import bisect
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+import KBABackend
+
+# VARIABLES FOR KBAINDEXES
+
+# Names of the tables in the map
+biotics_table = "BIOTICS_ELEMENT_NATIONAL"
+species_table = "Species (view only)"
+inputdataset_table = "InputDataset"
+
+# Fields in BIOTICS_ELEMENT_NATIONAL that are held for each taxon in the taxon hierarchy
+biotics_fields = ["speciesid",
+                  "element_code",
+                  "ca_nname_level",
+                  "national_scientific_name",
+                  "national_engl_name",
+                  "national_fr_name"]
+
+# Name of the folder (in the project home folder) that holds the cached indexes
+cache_folder_name = "KBAToolsCache"
+
+# Minimum number of seconds between checks of a table stamp while an index is held in memory
+stamp_check_interval = 30
+
+# Process-wide indexes, shared by all the tools in the toolbox
+# Key : index name, val : {"stamp": table stamp, "checked": time of the last stamp check, "data": index contents}
+_indexes = {}
+
+# Locks that stop two threads (e.g. the warm-up thread and a tool dialog) from building the same index at the same time
+# Key : index name, val : threading.Lock
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+
+# Environment variable that turns off the background warm-up of the indexes
+no_warm_up_variable = "KBATOOLS_NO_WARMUP"
+
+# Cache files that the background warm-up reads, in order. Only the files are read in the background: arcpy (the table
+# stamps, cursors and map layers) is only used on the thread of the tool dialog or tool run
+warm_up_files = ["taxon_hierarchy.json",
+                 "species_names.json"]
+
+# Fields of the Biotics records (see biotics_fields) that the species name search index is built from
+search_fields = ["national_scientific_name", "national_engl_name", "national_fr_name"]
+
+# Maximum number of species returned by a species name search
+max_search_results = 50
+
+# Query words shorter than this are not searched for by trigram similarity (see searchSpecies)
+fuzzy_min_length = 4
+
+# Smallest share of trigrams (Dice coefficient) that a word must have in common with a query word to match it
+fuzzy_threshold = 0.5
+
+# Background thread that loads the indexes when the first tool dialog is opened, None until it is started
+_warm_up_thread = None
+
+# Errors raised while reading the cache files in the warm-up, as [file name, error message]
+_warm_up_errors = []
+
+# Contents of the cache files read by the warm-up, used (once) instead of reading the file again
+# Key : cache file path, val : contents
+_warm_up_contents = {}
+
+
+# FUNCTIONS FOR KBAINDEXES
+def cacheFolder():
+    """Return the folder used to persist the KBA tool caches, creating it if it doesn't exist."""
+    # Keep the cache with the current ArcGIS Pro project (or with the database for other backends)
+    folder = os.path.join(KBABackend.getBackend().homeFolder(), cache_folder_name)
+    os.makedirs(folder, exist_ok=True)
+
+    return folder
+
+
+def readTableStamp(table):
+    """Return the row count, last edit or last-modified time and source path used to detect changes to a table, or
+    None if changes to the table can't be detected (see KBABackend.Backend.tableStamp)."""
+    return KBABackend.getBackend().tableStamp(table)
+
+
+def _readCacheFile(file_name):
+    """Return the contents of a cache file, or None if it doesn't exist or can't be read. The contents read by the
+    warm-up are used if there are any."""
+    cache_path = os.path.join(cacheFolder(), file_name)
+    contents = _warm_up_contents.pop(cache_path, None)
+    if contents is not None:
+        return contents
+
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _writeCacheFile(file_name, contents):
+    """Write the contents of a cache file. A cache that can't be written is rebuilt in the next session."""
+    cache_path = os.path.join(cacheFolder(), file_name)
+    _warm_up_contents.pop(cache_path, None)
+
+    try:
+        with open(cache_path, "w", encoding="utf-8") as cache_file:
+            json.dump(contents, cache_file)
+    except OSError:
+        pass
+
+
+def _indexLock(index_name):
+    """Return the lock used to build an index."""
+    with _index_locks_guard:
+        return _index_locks.setdefault(index_name, threading.Lock())
+
+
+def _loadIndex(index_name, table, build_function, cache_file=None):
+    """Return the contents of an index, rebuilding it only if the table (or list of tables) it is read from has
+    changed. If a cache_file name is given the index is also persisted to disk between sessions.
+    If another thread is already loading the index, wait for it and use the index it loaded."""
+    index = _indexes.get(index_name)
+
+    # Use the index in memory without checking the table if it was checked recently
+    if index is not None and time.time() - index["checked"] < stamp_check_interval:
+        return index["data"]
+
+    with _indexLock(index_name):
+        return _loadIndexLocked(index_name, table, build_function, cache_file)
+
+
+def _loadIndexLocked(index_name, table, build_function, cache_file):
+    """Load an index while holding its lock (see _loadIndex)."""
+    index = _indexes.get(index_name)
+
+    # The index may have been loaded by another thread while this thread was waiting for the lock
+    if index is not None and time.time() - index["checked"] < stamp_check_interval:
+        return index["data"]
+
+    if isinstance(table, str):
+        stamp = readTableStamp(table)
+    else:
+        stamp = [readTableStamp(t) for t in table]
+
+    # Changes to some tables (e.g. in an enterprise geodatabase without editor tracking) can't be detected, so their
+    # indexes are built again after each stamp_check_interval and never written to disk
+    if stamp is None or None in stamp:
+        index = {"stamp": None, "data": build_function(), "checked": time.time()}
+        _indexes[index_name] = index
+        return index["data"]
+
+    # Use the index in memory if the table hasn't changed
+    if index is not None and index["stamp"] == stamp:
+        index["checked"] = time.time()
+        return index["data"]
+
+    # Use the index on disk if the table hasn't changed, otherwise build it (and write it to disk)
+    index = _readCacheFile(cache_file) if cache_file else None
+    if index is None or index.get("stamp") != stamp:
+        index = {"stamp": stamp, "data": build_function()}
+        if cache_file:
+            _writeCacheFile(cache_file, index)
+
+    index["checked"] = time.time()
+    _indexes[index_name] = index
+
+    return index["data"]
+
+
+def invalidateIndex(index_name=None):
+    """Drop an index (or all indexes if no name is given) so that it is checked against its table on the next call."""
+    if index_name is None:
+        _indexes.clear()
+    else:
+        _indexes.pop(index_name, None)
+
+
+def _buildNameIndex():
+    """Read the species and infraspecies names from the Biotics table in a single pass."""
+    species_names = []
+    infraspecies_names = []
+
+    for sci_name, s_level in KBABackend.getBackend().readRows(biotics_table,
+                                                              ["national_scientific_name", "ca_nname_level"]):
+        if s_level == "Species":
+            species_names.append(sci_name)
+        else:
+            infraspecies_names.append(sci_name)
+
+    return {"species": sorted(species_names),
+            "infraspecies": sorted(infraspecies_names)}
+
+
+def readSpeciesNames():
+    """Return the sorted national_scientific_name values for the full species in Biotics."""
+    return _loadIndex("species_names", biotics_table, _buildNameIndex, "species_names.json")["species"]
+
+
+def readInfraspeciesNames():
+    """Return the sorted national_scientific_name values for the infraspecies in Biotics."""
+    return _loadIndex("species_names", biotics_table, _buildNameIndex, "species_names.json")["infraspecies"]
+
+
+def invalidateSpeciesNames():
+    """Drop the species name index held in memory so that it is checked against the table on the next call."""
+    invalidateIndex("species_names")
+
+
+def _buildInputDatasetIndex():
+    """Read the InputDataset table in a single pass and group the inputdatasetid values by datasetsourceid."""
+    inputdataset_index = {}
+
+    for inputdatasetid, datasetsourceid in KBABackend.getBackend().readRows(inputdataset_table,
+                                                                            ["inputdatasetid", "datasetsourceid"]):
+        # Keys are strings to match the datasetsourceid values in KBAUtils.symbology_dict
+        inputdataset_index.setdefault(str(datasetsourceid), []).append(inputdatasetid)
+
+    return inputdataset_index
+
+
+def readInputDatasetIndex():
+    """Return a dictionary of datasetsourceid : [inputdatasetid values] for every record in InputDataset."""
+    return _loadIndex("inputdataset", inputdataset_table, _buildInputDatasetIndex)
+
+
+def invalidateInputDatasetIndex():
+    """Drop the InputDataset index held in memory so that it is re-read on the next call."""
+    invalidateIndex("inputdataset")
+
+
+def _buildTaxonHierarchy():
+    """Read the Biotics and Species tables in a single pass each and build the taxon hierarchy.
+    Keys are strings so that the hierarchy can be written to the JSON cache file."""
+    taxon_hierarchy = {"records": {},  # speciesid : Biotics record (values for biotics_fields)
+                       "names": {},  # national_scientific_name : speciesid
+                       "elements": {},  # element_code : speciesid
+                       "infraspecies": {},  # fullspecies_elementcode : [speciesid values in the Species table]
+                       "full_species": {}}  # speciesid : fullspecies_elementcode
+
+    # The last record is kept if a name or element_code is in more than one record, the same as the search cursors
+    for row in KBABackend.getBackend().readRows(biotics_table, biotics_fields):
+        taxon_hierarchy["records"][str(row[0])] = list(row)
+        taxon_hierarchy["names"][row[3]] = row[0]
+        taxon_hierarchy["elements"][row[1]] = row[0]
+
+    for speciesid, fullspecies_elementcode in KBABackend.getBackend().readRows(species_table,
+                                                                               ["speciesid",
+                                                                                "fullspecies_elementcode"]):
+        taxon_hierarchy["infraspecies"].setdefault(fullspecies_elementcode, []).append(speciesid)
+        taxon_hierarchy["full_species"][str(speciesid)] = fullspecies_elementcode
+
+    return taxon_hierarchy
+
+
+def readTaxonHierarchy():
+    """Return the taxon hierarchy of the Biotics and Species tables, used to resolve full species and infraspecies
+    records with dictionary lookups instead of queries. The hierarchy is rebuilt if either table changes."""
+    return _loadIndex("taxon_hierarchy", [biotics_table, species_table], _buildTaxonHierarchy,
+                      "taxon_hierarchy.json")
+
+
+def invalidateTaxonHierarchy():
+    """Drop the taxon hierarchy held in memory so that it is checked against the tables on the next call."""
+    invalidateIndex("taxon_hierarchy")
+
+
+def searchWords(name):
+    """Return the words of a species name for the search index, in lower case and without accents,
+    e.g. Épinette noire > ["epinette", "noire"]."""
+    if not name:
+        return []
+
+    name = "".join(character for character in unicodedata.normalize("NFKD", name)
+                   if not unicodedata.combining(character))
+
+    return re.findall(r"[^\W_]+", name.lower())
+
+
+def _trigrams(word):
+    """Return the set of trigrams of a word, with the start and end of the word marked so short words have trigrams."""
+    word = "^{}$".format(word)
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+def _buildSpeciesSearchIndex():
+    """Build the species name search index from the Biotics records in the taxon hierarchy.
+    Each word of the scientific, English and French names points to the records (by position in "speciesids") that
+    have it, and each trigram of a word points to the words (by position in "words") that have it."""
+    field_indexes = [biotics_fields.index(field) for field in search_fields]
+    level_index = biotics_fields.index("ca_nname_level")
+    name_index = biotics_fields.index("national_scientific_name")
+
+    search_index = {"speciesids": [],  # speciesid of each record
+                    "sci_names": [],  # national_scientific_name of each record
+                    "full_species": [],  # True if the record is a full species
+                    "names": [],  # words of the names of each record, joined with spaces, for ranking
+                    "words": [],  # sorted words of all the names
+                    "postings": [],  # record positions for each word
+                    "trigrams": {}}  # trigram : word positions
+
+    word_records = {}
+    for record in readTaxonHierarchy()["records"].values():
+        record_number = len(search_index["speciesids"])
+        search_index["speciesids"].append(record[0])
+        search_index["sci_names"].append(record[name_index])
+        search_index["full_species"].append(record[level_index] == "Species")
+
+        record_names = []
+        for field_index in field_indexes:
+            words = searchWords(record[field_index])
+            record_names.append(" ".join(words))
+            for word in words:
+                word_records.setdefault(word, set()).add(record_number)
+
+        search_index["names"].append(record_names)
+
+    for word_number, word in enumerate(sorted(word_records)):
+        search_index["words"].append(word)
+        search_index["postings"].append(sorted(word_records[word]))
+        for trigram in _trigrams(word):
+            search_index["trigrams"].setdefault(trigram, []).append(word_number)
+
+    return search_index
+
+
+def readSpeciesSearchIndex():
+    """Return the species name search index, which is rebuilt from the taxon hierarchy if the Biotics or Species table
+    changes. It is only held in memory, because it is quicker to build from the taxon hierarchy than to read."""
+    return _loadIndex("species_search", [biotics_table, species_table], _buildSpeciesSearchIndex)
+
+
+def _prefixWords(search_index, query_word):
+    """Return the positions of the words in the search index that start with a query word."""
+    words = search_index["words"]
+    start = bisect.bisect_left(words, query_word)
+    end = bisect.bisect_left(words, query_word + "\uffff", start)
+
+    return range(start, end)
+
+
+def _similarWords(search_index, query_word):
+    """Return a dictionary of word position : share of trigrams in common (Dice coefficient) for the words in the
+    search index that share at least fuzzy_threshold of their trigrams with a query word (e.g. a word with a typing
+    error)."""
+    query_trigrams = _trigrams(query_word)
+    shared_counts = Counter(word_number for trigram in query_trigrams
+                            for word_number in search_index["trigrams"].get(trigram, []))
+
+    similar_words = {}
+    for word_number, shared_count in shared_counts.items():
+        similarity = 2.0 * shared_count / (len(query_trigrams) + len(search_index["words"][word_number]))
+        if similarity >= fuzzy_threshold:
+            similar_words[word_number] = similarity
+
+    return similar_words
+
+
+def searchSpecies(search_string, full_species=None, max_results=None):
+    """Return the [speciesid, national_scientific_name] of the Biotics records whose scientific, English or French
+    name has a word starting with each word of the search string, best matches first, up to max_results
+    (max_search_results by default). A query word that doesn't start any word is matched to similar words instead.
+    Only full species (full_species=True) or infraspecies (full_species=False) are returned if full_species is set."""
+    query_words = searchWords(search_string)
+    if not query_words:
+        return []
+
+    search_index = readSpeciesSearchIndex()
+    postings = search_index["postings"]
+
+    # Each record must match every query word. An exact word match scores 3, a prefix 2 and a similar word its share
+    # of trigrams in common (less than 1)
+    record_scores = None
+    for query_word in query_words:
+        word_numbers = _prefixWords(search_index, query_word)
+        if word_numbers:
+            word_matches = {word_number: 3 if search_index["words"][word_number] == query_word else 2
+                            for word_number in word_numbers}
+        elif len(query_word) >= fuzzy_min_length:
+            word_matches = _similarWords(search_index, query_word)
+        else:
+            return []
+
+        word_scores = {}
+        for word_number, score in word_matches.items():
+            for record_number in postings[word_number]:
+                if word_scores.get(record_number, 0) < score:
+                    word_scores[record_number] = score
+
+        if record_scores is None:
+            record_scores = word_scores
+        else:
+            record_scores = {record_number: record_scores[record_number] + score
+                             for record_number, score in word_scores.items() if record_number in record_scores}
+
+        if not record_scores:
+            return []
+
+    # Rank the names that start with the whole search string first, then by score and by the shortest name
+    query_name = " ".join(query_words)
+    ranked_records = []
+    for record_number, score in record_scores.items():
+        if full_species is not None and search_index["full_species"][record_number] != full_species:
+            continue
+
+        starts_name = any(name.startswith(query_name) for name in search_index["names"][record_number])
+        ranked_records.append((not starts_name, -score, len(search_index["sci_names"][record_number]),
+                               search_index["sci_names"][record_number], record_number))
+
+    return [[search_index["speciesids"][ranked_record[-1]], search_index["sci_names"][ranked_record[-1]]]
+            for ranked_record in heapq.nsmallest(max_results or max_search_results, ranked_records)]
+
+
+def _warmUp(folder):
+    """Read each of the warm_up_files in the cache folder. Runs on the background thread, so it doesn't use arcpy."""
+    for file_name in warm_up_files:
+        cache_path = os.path.join(folder, file_name)
+        try:
+            with open(cache_path, "r", encoding="utf-8") as cache_file:
+                _warm_up_contents[cache_path] = json.load(cache_file)
+
+        # A file that hasn't been written yet is built by the first tool that uses the index
+        except FileNotFoundError:
+            pass
+
+        # A file that can't be read is read again (and rebuilt) by the first tool that uses the index
+        except (OSError, ValueError) as error:
+            _warm_up_errors.append([file_name, str(error)])
+
+
+def startWarmUp():
+    """Start reading the index cache files on a background thread, so that the tool dialogs and the first tool run
+    don't have to parse them. The cache folder is found on the calling thread, which is the only one that uses arcpy.
+    Only the first call starts the thread. Returns True if the thread was started."""
+    global _warm_up_thread
+    if os.environ.get(no_warm_up_variable):
+        return False
+
+    with _index_locks_guard:
+        if _warm_up_thread is not None:
+            return False
+
+        _warm_up_thread = threading.Thread(target=_warmUp, args=(cacheFolder(),), name="KBAIndexesWarmUp",
+                                           daemon=True)
+
+    _warm_up_thread.start()
+
+    return True
+
+
+def readWarmUpStatus():
+    """Return the status of the background warm-up: "not started", "running" or "finished"."""
+    if _warm_up_thread is None:
+        return "not started"
+
+    return "running" if _warm_up_thread.is_alive() else "finished"
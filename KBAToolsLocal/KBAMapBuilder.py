@@ -0,0 +1,216 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAMapBuilder.py
+#
+# Purpose:          Checks that the map has the data layers and tables that the tools need, then adds the output plan
+#                   of a tool run (see KBAPlanner.OutputPlan) to the map in a single pass.
+#                   Every group layer, output layer, definition query and symbology is decided before this runs, so
+#                   the map is only written to once per layer. The group layers and output layers are held as direct
+#                   references while they are added, and are never looked up by name in the map.
+#                   The map can then be zoomed to the groups that were added, using the extents in the species summary
+#                   table (KBAPlanner.planGroupExtents) instead of the extents of the new layers, which ArcGIS Pro
+#                   would compute by reading every feature behind their definition queries.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import KBAExceptions
+import KBAPlanner
+import KBAProfiler
+import KBATemplates
+
+# VARIABLES FOR KBAMAPBUILDER
+
+# Outline width of the output layers with custom symbology
+outline_width = 2
+
+# Share of the width / height of the output extent added around it when the map is zoomed to the output layers
+zoom_margin = 0.05
+
+# Smallest map scale that the map is zoomed to, e.g. for a species with a single point
+min_zoom_scale = 50000
+
+# Data layers (in the SpeciesData group layer) and tables that need to exist in the map and not have an active
+# definition query
+required_datasets = ["InputPoint", "InputLine", "InputPolygon", "EO_Polygon"]
+required_tables = ["BIOTICS_ELEMENT_NATIONAL", "Species (view only)", "InputDataset"]
+
+
+# FUNCTIONS FOR KBAMAPBUILDER
+def validateMap(m):
+    """Check that the map contains the SpeciesData group layer and the required data layers and tables, and that none
+    of them have an active definition query. Raises the KBAExceptions error for the first check that fails, with the
+    name of the layer or table. Returns the SpeciesData group layer."""
+    # Check that the SpeciesData Group Layer exists in the map
+    if not arcpy.Exists(KBATemplates.species_group_name):
+        raise KBAExceptions.SpeciesDataError
+
+    arcpy.AddMessage("SpeciesData group layer exists.")
+
+    # Iterate through the list of dataset names (layers)
+    for dataset in required_datasets:
+        # Raise the custom NoDataError if the dataset doesn't exist. Pass the dataset name to the error.
+        if not arcpy.Exists("{}\\{}".format(KBATemplates.species_group_name, dataset)):
+            raise KBAExceptions.NoDataError(dataset)
+
+        arcpy.AddMessage("{} data layer exists.".format(dataset))
+
+        # Raise custom DefQueryError if there is an active definition query on the layer
+        lyr = m.listLayers(dataset)[0]
+        if lyr.supports("DEFINITIONQUERY") and lyr.definitionQuery != '':
+            raise KBAExceptions.DefQueryError(lyr.name)
+
+    # Iterate through the list of table names (tables)
+    for table in required_tables:
+        if not arcpy.Exists(table):
+            raise KBAExceptions.NoTableError(table)
+
+        arcpy.AddMessage("{} table exists.".format(table))
+
+        # Raise custom DefQueryError if there is an active definition query on the table
+        lyr = m.listTables(table)[0]
+        if lyr.definitionQuery != '':
+            raise KBAExceptions.DefQueryError(lyr.name)
+
+    return m.listLayers(KBATemplates.species_group_name)[0]
+
+
+def readSourceLayers(m):
+    """Return a dictionary of feature class : data layer in the SpeciesData group layer for the output layers."""
+    source_lyrs = {}
+    for ft_type in KBAPlanner.count_fields:
+        source_lyrs[ft_type] = KBATemplates.readSourceLayer(m, ft_type)
+
+        if source_lyrs[ft_type] is None:
+            raise KBAExceptions.SpeciesDataError
+
+    return source_lyrs
+
+
+@KBAProfiler.timed
+def addGroupLayer(m, group_template, output_group):
+    """Add an empty copy of the SpeciesData group layer at the top of the TOC for a planned group."""
+    group_lyr = m.addLayer(group_template, "TOP")[0]
+    group_lyr.name = output_group.name  # rename the group layer in TOC
+    group_lyr.visible = False  # Turn off the visibility for the group layer
+
+    return group_lyr
+
+
+def _addDataLayer(m, group_lyr, data_source, lyr_name, sql, output_lyr):
+    """Make a layer from a data source with a sql query of a planned output layer, add it to the bottom of the group
+    layer and apply the custom symbology of the output layer."""
+    # Make a new feature layer based on the planned sql query and added .getOutput(0) function
+    new_lyr = arcpy.MakeFeatureLayer_management(data_source, lyr_name, sql, None).getOutput(0)
+
+    new_lyr = m.addLayerToGroup(group_lyr, new_lyr, "BOTTOM")[0]  # Add the new layer
+    new_lyr.visible = False  # Turn off the visibility for the new layer
+
+    # Apply custom symbology (EO_Polygon, InputPolygon & filtered data layers only)
+    if output_lyr.fill_rgb is not None:
+        with KBAProfiler.section("symbology"):
+            sym = new_lyr.symbology
+            sym.renderer.symbol.color = output_lyr.fill_rgb
+            sym.renderer.symbol.outlineColor = output_lyr.outline_rgb
+            sym.renderer.symbol.outlineWidth = outline_width
+            new_lyr.symbology = sym
+
+    return new_lyr
+
+
+@KBAProfiler.timed
+def addOutputLayer(m, group_lyr, source_lyr, output_lyr):
+    """Make a planned output layer from its SpeciesData data layer, add it to the bottom of the group layer and apply
+    its custom symbology. If the output layer has generalized polygons (see KBAGeneralize.generalizePlan), a layer made
+    from them is added below it and drawn at the overview scales, and the output layer is only drawn at the detail
+    scales."""
+    new_lyr = _addDataLayer(m, group_lyr, source_lyr, output_lyr.name, output_lyr.sql, output_lyr)
+
+    if output_lyr.generalized_path is not None:
+        # The layers don't draw when zoomed out beyond their minThreshold or zoomed in beyond their maxThreshold, so
+        # only one of them is drawn at any scale
+        new_lyr.minThreshold = output_lyr.generalized_scale
+        generalized_lyr = _addDataLayer(m, group_lyr, output_lyr.generalized_path, output_lyr.generalized_name,
+                                        output_lyr.generalized_sql, output_lyr)
+        generalized_lyr.maxThreshold = output_lyr.generalized_scale
+
+    return new_lyr
+
+
+@KBAProfiler.timed
+def applyOutputPlan(m, group_template, output_plan, skip_failed_groups=False, progress=None):
+    """Add the groups in the output plan that have output layers to the map, in the order of the plan (top first).
+    If anything fails, the groups that were already added are removed before the error is raised again. With
+    skip_failed_groups, a group whose geoprocessing fails is removed and the other groups are still added (e.g. for
+    batch runs). If a progress function is given, it is called with each group that has output layers once the group
+    has been added (or has failed), e.g. to move a step progressor forward. Returns the groups that failed as a list of
+    [output group, arcpy error messages]."""
+    source_lyrs = readSourceLayers(m)
+    added_group_lyrs = []
+    failed_groups = []
+
+    try:
+        # Each group is added at the top of the TOC, so the groups are added from the bottom of the plan up
+        for output_group in reversed(output_plan.groups):
+            if not output_group.output_lyrs:
+                continue
+
+            output_group.group_lyr = addGroupLayer(m, group_template, output_group)
+            added_group_lyrs.append(output_group.group_lyr)
+
+            try:
+                for output_lyr in output_group.output_lyrs:
+                    addOutputLayer(m, output_group.group_lyr, source_lyrs[output_lyr.ft_type], output_lyr)
+
+            except arcpy.ExecuteError:
+                if not skip_failed_groups:
+                    raise
+
+                # Remove the partly built group and keep adding the rest of the plan
+                m.removeLayer(added_group_lyrs.pop())
+                output_group.group_lyr = None
+                failed_groups.insert(0, [output_group, arcpy.GetMessages(2)])
+
+            if progress is not None:
+                progress(output_group)
+
+    except:
+        # Don't leave partly built groups in the map
+        for group_lyr in added_group_lyrs:
+            m.removeLayer(group_lyr)
+        raise
+
+    return failed_groups
+
+
+@KBAProfiler.timed
+def zoomToPlan(aprx, m, output_plan):
+    """Zoom the active map view to the groups in the output plan that were added to the map. The extents come from
+    KBAPlanner.planGroupExtents, in the coordinate system of the SpeciesData data layers. Returns False if there is
+    nothing to zoom to or no active map view."""
+    KBAPlanner.planGroupExtents(output_plan)
+    extent = KBAPlanner.unionExtent(output_group.extent for output_group in output_plan.groups
+                                    if output_group.group_lyr is not None)
+
+    map_view = aprx.activeView
+    if extent is None or map_view is None or not hasattr(map_view, "camera"):
+        return False
+
+    # Leave a margin around the output layers, so the features on the edges are not cut off
+    xmin, ymin, xmax, ymax = extent
+    x_margin = (xmax - xmin) * zoom_margin
+    y_margin = (ymax - ymin) * zoom_margin
+
+    spatial_reference = arcpy.Describe(KBATemplates.readSourceLayer(m, "InputPolygon")).spatialReference
+    zoom_extent = arcpy.Extent(xmin - x_margin, ymin - y_margin, xmax + x_margin, ymax + y_margin,
+                               spatial_reference=spatial_reference)
+
+    if m.spatialReference is not None and m.spatialReference.name != spatial_reference.name:
+        zoom_extent = zoom_extent.projectAs(m.spatialReference)
+
+    map_view.camera.setExtent(zoom_extent)
+
+    # Don't zoom in past min_zoom_scale, e.g. for the extent of a single point
+    if map_view.camera.scale < min_zoom_scale:
+        map_view.camera.scale = min_zoom_scale
+
+    return True
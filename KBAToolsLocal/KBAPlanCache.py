@@ -0,0 +1,197 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAPlanCache.py
+#
+# Purpose:          Persistent cache of the planned output layers for the scripts in the KBAToolsLocal Toolbox.
+#                   The output layers of a group layer (names with record counts and sql queries, for the layers that
+#                   have records) only depend on the speciesid values in the group and on the data, so they are kept
+#                   for each tool and speciesid set until the data changes. A repeat run for the same species (e.g. to
+#                   switch to French names, or to add back a group that was deleted) only adds the layers to the map.
+#                   The cache is stored in a SQLite database in the KBAToolsCache folder and the least recently used
+#                   entries are removed when it is full.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+import KBABackend
+import KBAIndexes
+import KBAPlanner
+import KBAUtils
+
+# VARIABLES FOR KBAPLANCACHE
+
+# Name of the SQLite database (in the KBAToolsCache folder) that holds the cached output layers
+cache_file_name = "plan_cache.sqlite"
+
+# Maximum number of group layers kept in the cache, the least recently used are removed first
+max_cache_entries = 2000
+
+# Tables that the planned output layers are read from, a change to any of them is a new data snapshot
+snapshot_tables = [KBAIndexes.inputdataset_table] + list(KBAPlanner.count_fields)
+
+# Version of the cached output layers, changed when the values that are cached for each layer change, so the entries
+# written by an earlier version of the tools are never read
+cache_version = 3
+
+# Tables in the cache database
+cache_schema = ["CREATE TABLE IF NOT EXISTS plan_cache (cache_key TEXT PRIMARY KEY, tool TEXT, speciesids TEXT, "
+                "snapshot TEXT, output_lyrs TEXT, last_used REAL)",
+                "CREATE INDEX IF NOT EXISTS plan_cache_last_used ON plan_cache (last_used)"]
+
+# Snapshot version of the data, checked at most every KBAIndexes.stamp_check_interval seconds
+# Key : cache path, val : [snapshot version, time of the check]
+_snapshots = {}
+
+
+# FUNCTIONS FOR KBAPLANCACHE
+def cachePath():
+    """Return the path of the plan cache database in the KBAToolsCache folder."""
+    return os.path.join(KBAIndexes.cacheFolder(), cache_file_name)
+
+
+def _connect():
+    """Open the plan cache database, creating the cache table if it doesn't exist."""
+    connection = sqlite3.connect(cachePath())
+    for sql in cache_schema:
+        connection.execute(sql)
+
+    return connection
+
+
+def snapshotVersion(check=False):
+    """Return a hash of the table stamps of the snapshot tables and of the filtered datasets in
+    KBAUtils.symbology_dict, or None if changes to one of the tables can't be detected (the cache is then not used).
+    The stamps are only re-read if they haven't been checked in the last KBAIndexes.stamp_check_interval seconds, or
+    if check is True."""
+    snapshot_key = cachePath()
+    snapshot = _snapshots.get(snapshot_key)
+
+    if check or snapshot is None or time.time() - snapshot[1] >= KBAIndexes.stamp_check_interval:
+        stamps = [KBABackend.getBackend().tableStamp(table) for table in snapshot_tables]
+        snapshot_json = json.dumps([stamps, KBAUtils.symbology_dict, cache_version], sort_keys=True, default=str)
+        snapshot = [hashlib.sha1(snapshot_json.encode("utf-8")).hexdigest() if None not in stamps else None,
+                    time.time()]
+        _snapshots[snapshot_key] = snapshot
+
+    return snapshot[0]
+
+
+def _cacheKey(tool_name, speciesids, snapshot):
+    """Return the cache key for the output layers of a group layer."""
+    return json.dumps([tool_name, list(speciesids), snapshot])
+
+
+def _writeOutputLayers(output_lyrs):
+    """Return the output layers as JSON. The inputdatasetid values behind the sql queries aren't written, only the
+    filtered dataset of the layer and whether it excludes the filtered datasets, because they are the same for every
+    layer of a data snapshot (see _readOutputLayers)."""
+    return json.dumps([[output_lyr.name, output_lyr.ft_type, output_lyr.sql, output_lyr.fill_rgb,
+                        output_lyr.outline_rgb, list(output_lyr.speciesids), output_lyr.dataset_key,
+                        output_lyr.exclude_inputdatasetids]
+                       for output_lyr in output_lyrs])
+
+
+def _readOutputLayers(output_lyrs_json, filtered_id_dict):
+    """Return the output layers from their JSON, with the inputdatasetid values behind their sql queries taken from
+    the filtered datasets (see KBAPlanner.planSpeciesLayers), so the extent matrix is read the same way for the
+    cached layers (see KBAPlanner.matrixOutputExtent)."""
+    output_lyrs = []
+    for name, ft_type, sql, fill_rgb, outline_rgb, speciesids, dataset_key, exclude in json.loads(output_lyrs_json):
+        if dataset_key is not None:
+            inputdatasetids = filtered_id_dict[dataset_key]
+        elif exclude:
+            inputdatasetids = KBAUtils.unionIdSets([filtered_id_dict[key] for key in KBAUtils.symbology_dict])
+        else:
+            inputdatasetids = None
+
+        output_lyrs.append(KBAPlanner.OutputLayer(name, ft_type, sql, fill_rgb, outline_rgb, speciesids,
+                                                  inputdatasetids, exclude, dataset_key))
+
+    return output_lyrs
+
+
+def readCachedLayers(tool_name, speciesid_groups):
+    """Return a dictionary of group index : [output layers] for the groups of speciesid values that are in the cache
+    for the current data snapshot. The cache entries that are read are marked as recently used."""
+    if not os.path.exists(cachePath()):
+        return {}
+
+    snapshot = snapshotVersion()
+    if snapshot is None:
+        return {}
+
+    cached_lyrs = {}
+    filtered_id_dict = KBAPlanner.readFilteredIdDict()
+
+    try:
+        with closing(_connect()) as connection, connection:
+            for group_index, speciesids in enumerate(speciesid_groups):
+                cache_key = _cacheKey(tool_name, speciesids, snapshot)
+                cache_row = connection.execute("SELECT output_lyrs FROM plan_cache WHERE cache_key = ?",
+                                               (cache_key,)).fetchone()
+
+                if cache_row is not None:
+                    cached_lyrs[group_index] = _readOutputLayers(cache_row[0], filtered_id_dict)
+                    connection.execute("UPDATE plan_cache SET last_used = ? WHERE cache_key = ?",
+                                       (time.time(), cache_key))
+
+    # A cache that can't be read is ignored, and the output layers are planned again
+    except sqlite3.Error:
+        return {}
+
+    return cached_lyrs
+
+
+def writeCachedLayers(tool_name, group_lyrs):
+    """Write the output layers for a list of (speciesid values, [output layers]) to the cache. Entries for older
+    data snapshots and the least recently used entries over max_cache_entries are removed."""
+    snapshot = snapshotVersion()
+    if snapshot is None:
+        return
+
+    try:
+        with closing(_connect()) as connection, connection:
+            connection.execute("DELETE FROM plan_cache WHERE snapshot != ?", (snapshot,))
+            connection.executemany("INSERT OR REPLACE INTO plan_cache VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(_cacheKey(tool_name, speciesids, snapshot), tool_name,
+                                     json.dumps(list(speciesids)), snapshot, _writeOutputLayers(output_lyrs),
+                                     time.time()) for speciesids, output_lyrs in group_lyrs])
+            connection.execute("DELETE FROM plan_cache WHERE cache_key IN (SELECT cache_key FROM plan_cache "
+                               "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (max_cache_entries,))
+
+    # The cache is optional, so the run doesn't fail if it can't be written
+    except sqlite3.Error:
+        pass
+
+
+def clearCache():
+    """Remove all the cached output layers."""
+    if os.path.exists(cachePath()):
+        with closing(_connect()) as connection, connection:
+            connection.execute("DELETE FROM plan_cache")
+
+
+def planGroupLayers(tool_name, speciesid_groups):
+    """Return the output layers that have records for each group of speciesid values, in the same order (see
+    KBAPlanner.planCountedLayers). The groups that aren't in the cache are counted with a single count matrix and
+    planned, then written to the cache."""
+    group_lyrs = readCachedLayers(tool_name, speciesid_groups)
+    missing_groups = [group_index for group_index in range(len(speciesid_groups)) if group_index not in group_lyrs]
+
+    if missing_groups:
+        filtered_id_dict = KBAPlanner.readFilteredIdDict()
+        count_matrix = KBAPlanner.readCountMatrix([speciesid for group_index in missing_groups
+                                                   for speciesid in speciesid_groups[group_index]])
+
+        for group_index in missing_groups:
+            group_lyrs[group_index] = KBAPlanner.planCountedLayers(speciesid_groups[group_index], filtered_id_dict,
+                                                                   count_matrix)
+
+        writeCachedLayers(tool_name, [(speciesid_groups[group_index], group_lyrs[group_index])
+                                      for group_index in missing_groups])
+
+    return [group_lyrs[group_index] for group_index in range(len(speciesid_groups))]
@@ -0,0 +1,422 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAPlanner.py
+#
+# Purpose:          Species resolution and output layer planning for the scripts in the KBAToolsLocal Toolbox.
+#                   The functions only read data through KBABackend and never touch the map, so the same logic runs
+#                   inside ArcGIS Pro and against a local SQLite / GeoPackage copy of the tables for benchmarking.
+#                   Full species and infraspecies are resolved from the taxon hierarchy in KBAIndexes.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import KBABackend
+import KBAExceptions
+import KBAIndexes
+import KBASummary
+import KBAUtils
+
+# VARIABLES FOR KBAPLANNER
+
+# Feature layers created for each species, in the order they are added to the group layer
+feature_list = ["InputPoint", "InputLine", "EO_Polygon"]
+
+# Fields used to count the features for each species in a single grouped query per feature class
+# EO_Polygon outputs are never split by dataset, so EO_Polygon features are only counted by speciesid
+count_fields = {"InputPoint": ["speciesid", "inputdatasetid"],
+                "InputLine": ["speciesid", "inputdatasetid"],
+                "InputPolygon": ["speciesid", "inputdatasetid"],
+                "EO_Polygon": ["speciesid"]}
+
+# Maximum number of speciesid values in the sql query of each grouped count
+count_chunk_size = 1000
+
+# Maximum number of grouped counts that are run at the same time, each on its own worker thread and cursor, for
+# backends that support concurrent reads. Set to 1 to run the counts one after the other
+count_workers = 4
+
+# Thread pool for the grouped counts, created on first use and kept for the session so the worker threads (and their
+# cursors / connections) are reused by later runs
+_count_executor = None
+
+# Symbology for the EO_Polygon and InputPolygon output layers: val[0] = fill colour, val[1] = outline colour
+eo_polygon_symbology = [{'RGB': [0, 112, 255, 30]}, {'RGB': [10, 112, 255, 100]}]
+input_polygon_symbology = [{'RGB': [56, 168, 0, 30]}, {'RGB': [56, 168, 0, 100]}]
+
+
+# CLASSES FOR KBAPLANNER
+class OutputLayer:
+    """An output data layer planned for a species group layer: the layer name in the TOC, the layer in the
+    SpeciesData group layer it is made from, the sql query and the custom symbology (None for points and lines).
+    The speciesid / inputdatasetid values behind the sql query are kept so the layer can be counted from a
+    count matrix without running the query. Layers for the filtered datasets keep their KBAUtils.symbology_dict key,
+    so the generalized polygons can be drawn for them at overview scales (see KBAGeneralize)."""
+
+    def __init__(self, name, ft_type, sql, fill_rgb=None, outline_rgb=None,
+                 speciesids=(), inputdatasetids=None, exclude_inputdatasetids=False, dataset_key=None):
+        self.name = name
+        self.ft_type = ft_type
+        self.sql = sql
+        self.fill_rgb = fill_rgb
+        self.outline_rgb = outline_rgb
+        self.speciesids = speciesids
+        self.inputdatasetids = inputdatasetids  # None = all inputdatasetid values
+        self.exclude_inputdatasetids = exclude_inputdatasetids  # True = NOT IN
+        self.dataset_key = dataset_key  # KBAUtils.symbology_dict key of a filtered dataset
+        # Generalized polygons drawn instead of the layer at overview scales, their TOC name, sql query and the map
+        # scale below which they are drawn, set by KBAGeneralize.generalizePlan
+        self.generalized_path = None
+        self.generalized_name = None
+        self.generalized_sql = None
+        self.generalized_scale = None
+
+    def __repr__(self):
+        return "OutputLayer({!r}, {!r}, {!r})".format(self.name, self.ft_type, self.sql)
+
+
+class OutputGroup:
+    """A group layer planned for the TOC: the group layer name, the speciesid values it shows, the output layers that
+    have records (in the order they are added to the group layer) and the warning shown if there are none."""
+
+    def __init__(self, name, speciesids, output_lyrs, empty_warning):
+        self.name = name
+        self.speciesids = speciesids
+        self.output_lyrs = output_lyrs
+        self.empty_warning = empty_warning
+        self.group_lyr = None  # Group layer in the map, set when the plan is applied
+        self.extent = None  # [xmin, ymin, xmax, ymax] of the output layers, set by planGroupExtents
+
+    def __repr__(self):
+        return "OutputGroup({!r}, {} output layers)".format(self.name, len(self.output_lyrs))
+
+
+class OutputPlan:
+    """All the group layers and output layers of a tool run, planned before anything is added to the map.
+    The groups are kept in TOC order (top first) and are added to the map in a single pass by KBAMapBuilder."""
+
+    def __init__(self):
+        self.groups = []
+
+    def addGroup(self, name, speciesids, output_lyrs, empty_warning):
+        """Add a group layer below the groups already in the plan."""
+        output_group = OutputGroup(name, speciesids, output_lyrs, empty_warning)
+        self.groups.append(output_group)
+
+        return output_group
+
+    def emptyGroups(self):
+        """Return the groups that have no output layers, which are not added to the map."""
+        return [output_group for output_group in self.groups if not output_group.output_lyrs]
+
+    def layerCount(self):
+        """Return the number of output layers in the plan."""
+        return sum(len(output_group.output_lyrs) for output_group in self.groups)
+
+
+# FUNCTIONS FOR KBAPLANNER
+def _bioticsRecord(taxon_hierarchy, speciesid):
+    """Return the Biotics record (KBAUtils.SpeciesRecord) for a speciesid from the taxon hierarchy, or None if it
+    isn't in Biotics."""
+    record = taxon_hierarchy["records"].get(str(speciesid))
+    return KBAUtils.SpeciesRecord._make(record) if record is not None else None
+
+
+def readBioticsRecord(sci_name):
+    """Return the Biotics record (values for KBAIndexes.biotics_fields) for a national_scientific_name."""
+    taxon_hierarchy = KBAIndexes.readTaxonHierarchy()
+    biotics_record = _bioticsRecord(taxon_hierarchy, taxon_hierarchy["names"].get(sci_name))
+
+    if biotics_record is None:
+        raise KBAExceptions.BioticsError
+
+    return biotics_record
+
+
+def readBioticsRecordById(speciesid):
+    """Return the Biotics record (values for KBAIndexes.biotics_fields) for a speciesid."""
+    biotics_record = _bioticsRecord(KBAIndexes.readTaxonHierarchy(), speciesid)
+
+    if biotics_record is None:
+        raise KBAExceptions.BioticsError
+
+    return biotics_record
+
+
+def readBioticsRecordByElementCode(element_code):
+    """Return the Biotics record (values for KBAIndexes.biotics_fields) for an element_code."""
+    taxon_hierarchy = KBAIndexes.readTaxonHierarchy()
+    biotics_record = _bioticsRecord(taxon_hierarchy, taxon_hierarchy["elements"].get(element_code))
+
+    if biotics_record is None:
+        raise KBAExceptions.BioticsError
+
+    return biotics_record
+
+
+def readBioticsRecords(species_values):
+    """Return a dictionary of species value : Biotics record (or None) for a list of national_scientific_name and
+    speciesid values. Values that are whole numbers are speciesids (see KBAUtils.streamSpeciesRecords)."""
+    return dict(KBAUtils.streamSpeciesRecords(species_values))
+
+
+def readInfraspeciesIds(element_code, speciesid):
+    """Return the speciesid values of the infraspecies of a full species, by matching the element_code of the full
+    species to the fullspecies_elementcode of the records in the Species table."""
+    # Only keep the infraspecies, not the original full species record
+    return [infraspeciesid for infraspeciesid in KBAIndexes.readTaxonHierarchy()["infraspecies"].get(element_code, [])
+            if infraspeciesid != speciesid]
+
+
+def readInfraspeciesIdDict(biotics_records):
+    """Return a dictionary of element_code : [speciesid of the full species, infraspecies speciesids...] for a list of
+    full species Biotics records."""
+    return {row[1]: [row[0]] + readInfraspeciesIds(row[1], row[0]) for row in biotics_records}
+
+
+def readFullSpeciesElementCode(speciesid):
+    """Return the fullspecies_elementcode of the parent species for an infraspecies in the Species table."""
+    fullspecies_elementcode = KBAIndexes.readTaxonHierarchy()["full_species"].get(str(speciesid))
+
+    if fullspecies_elementcode is None:
+        raise KBAExceptions.BioticsError
+
+    return fullspecies_elementcode
+
+
+def readFilteredIdDict():
+    """Return a dictionary of symbology_dict key : inputdatasetid values (KBAUtils.IdSet) for each of the filtered
+    datasets."""
+    return {key: KBAUtils.readFilteredInputDatasetID(KBAUtils.symbology_dict[key][1])
+            for key in KBAUtils.symbology_dict}
+
+
+def layerName(base_name, speciesids):
+    """Return the TOC name of an output layer, with a + if the layer includes infraspecies."""
+    if len(speciesids) > 1:
+        return "{} {}+".format(base_name, speciesids[0])
+
+    return "{} {}".format(base_name, speciesids[0])
+
+
+def speciesQuery(speciesids):
+    """Return the sql query that selects the features for the speciesid values (full species first)."""
+    if len(speciesids) > 1:
+        return "speciesid IN ({})".format(", ".join(str(i) for i in speciesids))
+
+    return "speciesid = {}".format(speciesids[0])
+
+
+def planFeatureLayer(ft_type, speciesids):
+    """Plan the InputPoint / InputLine / EO_Polygon output layer for the speciesid values."""
+    if ft_type == "EO_Polygon":
+        fill_rgb, outline_rgb = eo_polygon_symbology
+    else:
+        fill_rgb, outline_rgb = None, None  # Points and lines keep the SpeciesData symbology
+
+    return OutputLayer(layerName(ft_type, speciesids), ft_type, speciesQuery(speciesids), fill_rgb, outline_rgb,
+                       speciesids)
+
+
+def planRangeLayer(map_dict, speciesids, inputdatasetid_list, dataset_key=None):
+    """Plan the output layer for one of the filtered datasets [ECCC/IUCN/WCSC/COSEWIC MAPS].
+    Returns None if there are no inputdatasetid values for the dataset, because the layer would always be empty."""
+    if not inputdatasetid_list:
+        return None
+
+    range_sql = "{} And {}".format(speciesQuery(speciesids),
+                                   KBAUtils.inputDatasetPredicate(inputdatasetid_list, [map_dict[1]]))
+
+    return OutputLayer(layerName(map_dict[0], speciesids), "InputPolygon", range_sql, map_dict[2], map_dict[3],
+                       speciesids, inputdatasetid_list, dataset_key=dataset_key)
+
+
+def planPolyLayer(speciesids, inputdatasetid_list):
+    """Plan the InputPolygon output layer, without the records that belong to the filtered datasets.
+    The inputdatasetid_list holds the inputdatasetid values of all the filtered datasets in KBAUtils.symbology_dict."""
+    range_sql = speciesQuery(speciesids)
+    if inputdatasetid_list:
+        datasetsourceid_list = [KBAUtils.symbology_dict[key][1] for key in KBAUtils.symbology_dict]
+        range_sql += " And {}".format(KBAUtils.inputDatasetPredicate(inputdatasetid_list, datasetsourceid_list,
+                                                                     True))
+
+    fill_rgb, outline_rgb = input_polygon_symbology
+
+    return OutputLayer(layerName("InputPolygon", speciesids), "InputPolygon", range_sql, fill_rgb, outline_rgb,
+                       speciesids, inputdatasetid_list, True)
+
+
+def labelOutputLayer(output_lyr, row_count):
+    """Add the number of records to the TOC name of an output layer."""
+    output_lyr.name = "{} ({} {})".format(output_lyr.name, row_count, "record" if row_count == 1 else "records")
+
+
+def planSpeciesLayers(speciesids, filtered_id_dict):
+    """Plan all the output layers for a species group layer, in the order they are added to the group layer."""
+    output_lyrs = [planFeatureLayer(ft_type, speciesids) for ft_type in feature_list]
+
+    for key in KBAUtils.symbology_dict:
+        range_lyr = planRangeLayer(KBAUtils.symbology_dict[key], speciesids, filtered_id_dict[key], key)
+        if range_lyr is not None:
+            output_lyrs.append(range_lyr)
+
+    # The union of the filtered datasets is the same for every species, so it is only merged once (see unionIdSets)
+    filtered_inputdatasetids = KBAUtils.unionIdSets([filtered_id_dict[key] for key in KBAUtils.symbology_dict])
+    output_lyrs.append(planPolyLayer(speciesids, filtered_inputdatasetids))
+
+    return output_lyrs
+
+
+def countOutputRows(output_lyr):
+    """Return the number of features that an output layer would contain."""
+    return KBABackend.getBackend().countRows(output_lyr.ft_type, output_lyr.sql)
+
+
+def _countChunk(backend, count_job):
+    """Return the grouped counts for a (feature class, speciesid values) count job. Runs on a worker thread."""
+    ft_type, speciesids = count_job
+    return backend.countGroups(ft_type, count_fields[ft_type], speciesQuery(speciesids))
+
+
+def _countExecutor():
+    """Return the thread pool used for the grouped counts."""
+    global _count_executor
+    if _count_executor is None:
+        _count_executor = ThreadPoolExecutor(max_workers=count_workers, thread_name_prefix="KBACount")
+
+    return _count_executor
+
+
+def readCountMatrix(speciesids):
+    """Return the count matrix for a list of speciesid values, using one grouped count query per feature class.
+    Key : feature class, val : {speciesid : {inputdatasetid : number of features}}. EO_Polygon counts are keyed by
+    an inputdatasetid of None.
+    The counts are read from the species summary table for the feature classes that haven't changed since the
+    summary was built, so only the other feature classes are queried. The queries only read the feature classes, so
+    they run at the same time on up to count_workers threads (if the backend supports concurrent reads) and are
+    merged on the calling thread."""
+    speciesids = sorted(set(speciesids))
+    count_matrix = KBASummary.readSummaryCountMatrix(speciesids)
+
+    # Split long lists of speciesid values so the sql query stays a reasonable length (e.g. for batch runs)
+    count_jobs = []
+    for ft_type in count_fields:
+        if ft_type not in count_matrix:
+            count_matrix[ft_type] = {}
+            count_jobs.extend((ft_type, speciesids[i:i + count_chunk_size])
+                              for i in range(0, len(speciesids), count_chunk_size))
+
+    # The backend is read on the calling thread, so that the worker threads share it
+    backend = KBABackend.getBackend()
+    count_function = functools.partial(_countChunk, backend)
+
+    if backend.concurrent_reads and count_workers > 1 and len(count_jobs) > 1:
+        group_counts_list = list(_countExecutor().map(count_function, count_jobs))
+    else:
+        group_counts_list = [count_function(count_job) for count_job in count_jobs]
+
+    for (ft_type, _), group_counts in zip(count_jobs, group_counts_list):
+        species_counts = count_matrix[ft_type]
+
+        for group, row_count in group_counts.items():
+            inputdatasetid = group[1] if len(group) > 1 else None
+            dataset_counts = species_counts.setdefault(group[0], {})
+            dataset_counts[inputdatasetid] = dataset_counts.get(inputdatasetid, 0) + row_count
+
+    return count_matrix
+
+
+def _matrixValues(matrix, output_lyr):
+    """Yield the values in a count or extent matrix for the speciesid / inputdatasetid values behind the sql query of
+    an output layer."""
+    species_values = matrix[output_lyr.ft_type]
+    inputdatasetids = output_lyr.inputdatasetids
+    if inputdatasetids is not None:
+        inputdatasetids = KBAUtils.asIdSet(inputdatasetids)
+
+    for speciesid in output_lyr.speciesids:
+        for inputdatasetid, dataset_value in species_values.get(speciesid, {}).items():
+            # Null inputdatasetid values never match IN or NOT IN in the sql query, so they are only included when the
+            # layer doesn't filter on inputdatasetid
+            if inputdatasetids is None:
+                yield dataset_value
+            elif inputdatasetid is not None and \
+                    (inputdatasetid in inputdatasetids) != output_lyr.exclude_inputdatasetids:
+                yield dataset_value
+
+
+def matrixOutputRows(count_matrix, output_lyr):
+    """Return the number of features that an output layer would contain, using the count matrix from
+    readCountMatrix instead of querying the feature class."""
+    return sum(_matrixValues(count_matrix, output_lyr))
+
+
+def unionExtent(extents):
+    """Return the [xmin, ymin, xmax, ymax] extent that covers a list of extents, or None if none of them have an
+    extent (e.g. features with empty geometry)."""
+    union_extent = None
+    for extent in extents:
+        if extent is None or extent[0] is None:
+            continue
+
+        if union_extent is None:
+            union_extent = list(extent)
+        else:
+            union_extent = [min(union_extent[0], extent[0]), min(union_extent[1], extent[1]),
+                            max(union_extent[2], extent[2]), max(union_extent[3], extent[3])]
+
+    return union_extent
+
+
+def matrixOutputExtent(extent_matrix, output_lyr):
+    """Return the [xmin, ymin, xmax, ymax] extent of the features that an output layer would contain, using the extent
+    matrix from readExtentMatrix instead of reading the features, or None if there are none."""
+    return unionExtent(_matrixValues(extent_matrix, output_lyr))
+
+
+def planCountedLayers(speciesids, filtered_id_dict, count_matrix):
+    """Plan the output layers for a species group layer that have records, with the number of records in the layer
+    names. The records are counted from the count matrix (see readCountMatrix)."""
+    output_lyrs = []
+    for output_lyr in planSpeciesLayers(speciesids, filtered_id_dict):
+        row_count = matrixOutputRows(count_matrix, output_lyr)
+        if row_count != 0:
+            labelOutputLayer(output_lyr, row_count)
+            output_lyrs.append(output_lyr)
+
+    return output_lyrs
+
+
+def readExtentMatrix(speciesids):
+    """Return the extent matrix for a list of speciesid values. Key : feature class, val : {speciesid :
+    {inputdatasetid : [xmin, ymin, xmax, ymax]}}, with EO_Polygon extents keyed by an inputdatasetid of None.
+    The extents are read from the species summary table for the feature classes that haven't changed since the
+    summary was built. The other feature classes are read with one grouped summary query per feature class, which
+    only reads the extent of each feature (not its geometry)."""
+    speciesids = sorted(set(speciesids))
+    extent_matrix = KBASummary.readSummaryExtentMatrix(speciesids)
+
+    for ft_type in count_fields:
+        if ft_type in extent_matrix:
+            continue
+
+        species_extents = extent_matrix.setdefault(ft_type, {})
+        for i in range(0, len(speciesids), count_chunk_size):
+            for group, (row_count, xmin, ymin, xmax, ymax) in KBABackend.getBackend().summarizeGroups(
+                    ft_type, count_fields[ft_type], speciesQuery(speciesids[i:i + count_chunk_size])).items():
+                inputdatasetid = group[1] if len(group) > 1 else None
+                species_extents.setdefault(group[0], {})[inputdatasetid] = [xmin, ymin, xmax, ymax]
+
+    return extent_matrix
+
+
+def planGroupExtents(output_plan):
+    """Set the extent of each group in an output plan to the extent of its output layers, using a single extent
+    matrix for all the groups. Returns the extent of the whole plan, or None if there is nothing to zoom to."""
+    extent_matrix = readExtentMatrix([speciesid for output_group in output_plan.groups
+                                      if output_group.output_lyrs for speciesid in output_group.speciesids])
+
+    for output_group in output_plan.groups:
+        output_group.extent = unionExtent(matrixOutputExtent(extent_matrix, output_lyr)
+                                          for output_lyr in output_group.output_lyrs)
+
+    return unionExtent(output_group.extent for output_group in output_plan.groups)
@@ -0,0 +1,259 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAProfiler.py
+#
+# Purpose:          Run-level timing instrumentation shared by the tools in the KBAToolsLocal Toolbox.
+#                   A run is split into phases (e.g. validation, species resolution, outputs), the map builder
+#                   functions are timed with the timed decorator and the arcpy functions and map methods used by the
+#                   tools are counted and timed while the run is active.
+#                   Each run writes a JSON timing report to the scratch folder and returns a short summary that the
+#                   tools print as messages. Set the KBATOOLS_PROFILE environment variable to also write cProfile
+#                   output for the run.
+#                   The time taken to load the toolbox is recorded once per session and checked against a budget.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import functools
+import io
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+
+# VARIABLES FOR KBAPROFILER
+
+# Environment variable that turns on cProfile output for each run
+profile_variable = "KBATOOLS_PROFILE"
+
+# arcpy functions that are counted and timed during a run, key : module path in arcpy, val : function names
+tracked_functions = {"": ["Exists",
+                          "GetCount_management",
+                          "MakeFeatureLayer_management",
+                          "SaveToLayerFile_management",
+                          "SelectLayerByAttribute_management"],
+                     "da": ["SearchCursor"]}
+
+# Methods of the arcpy.mp.Map class that are counted and timed during a run
+tracked_map_methods = ["addLayer",
+                       "addLayerToGroup",
+                       "clearSelection",
+                       "insertLayer",
+                       "listLayers",
+                       "listTables",
+                       "removeLayer"]
+
+# Number of arcpy calls and timed functions listed in the summary messages
+summary_length = 5
+
+# Seconds that loading the toolbox should take at most (e.g. when the toolbox is opened in the Catalog pane). The load
+# time is added to the timing report of each run, and to the summary messages if it is over the budget
+startup_budget = 0.5
+
+# Seconds taken by each stage of loading the toolbox in this session, key : stage name, val : seconds
+_startup_timings = {}
+
+# Profile of the run in progress, None if there is no run
+_run = None
+
+
+# CLASSES FOR KBAPROFILER
+class RunProfile:
+    """Timings for a single tool run: phases in the order they ran, timed functions / code sections and arcpy calls.
+    Functions and arcpy calls are kept as name : [number of calls, seconds]."""
+
+    def __init__(self, tool_name):
+        self.tool_name = tool_name
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.phases = []  # [phase name, seconds]
+        self.phase_name = None
+        self.phase_start = None
+        self.functions = {}
+        self.arcpy_calls = {}
+        self.patched = []  # (owner, attribute name, original attribute) restored at the end of the run
+        self.profiler = None
+
+    def endPhase(self):
+        """Record the time of the phase in progress."""
+        if self.phase_name is not None:
+            self.phases.append([self.phase_name, time.perf_counter() - self.phase_start])
+            self.phase_name = None
+
+    def startPhase(self, phase_name):
+        """End the phase in progress and start a new one."""
+        self.endPhase()
+        self.phase_name = phase_name
+        self.phase_start = time.perf_counter()
+
+    def record(self, timings, name, seconds):
+        """Add a call and its time to the timings of a function or arcpy call."""
+        timing = timings.setdefault(name, [0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+
+
+# FUNCTIONS FOR KBAPROFILER
+def _trackCall(owner, attribute_name, call_name):
+    """Replace a function on its module / class with a wrapper that counts and times the calls in the active run."""
+    original = getattr(owner, attribute_name)
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            if _run is not None:
+                _run.record(_run.arcpy_calls, call_name, time.perf_counter() - start)
+
+    try:
+        setattr(owner, attribute_name, wrapper)
+    except (AttributeError, TypeError):
+        return  # Built-in types can't be patched, so the calls aren't counted
+
+    _run.patched.append((owner, attribute_name, original))
+
+
+def startRun(tool_name, arcpy_module=None):
+    """Start the profile of a tool run. The arcpy functions and map methods used by the tools are counted while the
+    run is active if the arcpy module is passed in."""
+    global _run
+    if _run is not None:
+        endRun()  # A run that didn't end (e.g. the tool was cancelled) is dropped
+
+    _run = RunProfile(tool_name)
+
+    if arcpy_module is not None:
+        for module_path, function_names in tracked_functions.items():
+            owner = arcpy_module
+            if module_path:
+                owner = getattr(arcpy_module, module_path)
+
+            for function_name in function_names:
+                if hasattr(owner, function_name):
+                    _trackCall(owner, function_name, function_name)
+
+        for method_name in tracked_map_methods:
+            if hasattr(arcpy_module.mp.Map, method_name):
+                _trackCall(arcpy_module.mp.Map, method_name, "Map." + method_name)
+
+    if os.environ.get(profile_variable):
+        # cProfile and pstats are only imported when they are used, because they are slow to import when the toolbox
+        # is loaded
+        import cProfile
+        _run.profiler = cProfile.Profile()
+        _run.profiler.enable()
+
+
+def recordStartup(stage_name, seconds):
+    """Record the time taken by a stage of loading the toolbox, e.g. importing the .pyt."""
+    _startup_timings[stage_name] = seconds
+
+
+def startPhase(phase_name):
+    """End the phase in progress and start a new one (does nothing if there is no run)."""
+    if _run is not None:
+        _run.startPhase(phase_name)
+
+
+@contextmanager
+def section(section_name):
+    """Time a block of code, e.g. the symbology of an output layer (does nothing if there is no run)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _run is not None:
+            _run.record(_run.functions, section_name, time.perf_counter() - start)
+
+
+def timed(function):
+    """Decorator that times every call of a function while a run is active, e.g. the KBAMapBuilder functions."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with section(function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def _topTimings(timings):
+    """Return the slowest timings as name : [number of calls, seconds], slowest first."""
+    return sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:summary_length]
+
+
+def endRun(report_folder=None):
+    """End the run, restore the arcpy functions and write the JSON timing report (and cProfile output) to the report
+    folder. Returns the summary lines to print as tool messages."""
+    global _run
+    run = _run
+    if run is None:
+        return []
+
+    _run = None
+    run.endPhase()
+    total_seconds = time.perf_counter() - run.start
+
+    # Put back the original arcpy functions and map methods
+    for owner, attribute_name, original in reversed(run.patched):
+        setattr(owner, attribute_name, original)
+
+    if run.profiler is not None:
+        run.profiler.disable()
+
+    report = {"tool": run.tool_name,
+              "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run.started)),
+              "total_seconds": round(total_seconds, 4),
+              "phases": [{"name": name, "seconds": round(seconds, 4)} for name, seconds in run.phases],
+              "functions": {name: {"calls": calls, "seconds": round(seconds, 4)}
+                            for name, (calls, seconds) in run.functions.items()},
+              "arcpy_calls": {name: {"calls": calls, "seconds": round(seconds, 4)}
+                              for name, (calls, seconds) in run.arcpy_calls.items()},
+              "startup": {"budget_seconds": startup_budget,
+                          "stages": {name: round(seconds, 4) for name, seconds in _startup_timings.items()}},
+              "cprofile": None}
+
+    summary = ["Run time: {:.2f} s".format(total_seconds)]
+    summary.extend("  {}: {:.2f} s".format(name, seconds) for name, seconds in run.phases)
+
+    startup_seconds = sum(_startup_timings.values())
+    if startup_seconds > startup_budget:
+        summary.append("Toolbox load: {:.2f} s (over the {:.2f} s budget)".format(startup_seconds, startup_budget))
+
+    if run.arcpy_calls:
+        summary.append("arcpy calls: {} ({:.2f} s)".format(sum(t[0] for t in run.arcpy_calls.values()),
+                                                            sum(t[1] for t in run.arcpy_calls.values())))
+        summary.extend("  {} x {}: {:.2f} s".format(name, calls, seconds)
+                       for name, (calls, seconds) in _topTimings(run.arcpy_calls))
+
+    if run.functions:
+        summary.append("Timed functions:")
+        summary.extend("  {} x {}: {:.2f} s".format(name, calls, seconds)
+                       for name, (calls, seconds) in _topTimings(run.functions))
+
+    if report_folder:
+        file_stem = os.path.join(report_folder, "{}_{}".format(re.sub(r"\W+", "_", run.tool_name),
+                                                               time.strftime("%Y%m%d_%H%M%S",
+                                                                             time.localtime(run.started))))
+
+        try:
+            # Write the cProfile output as a .prof file (for snakeviz etc.) and as text sorted by cumulative time
+            if run.profiler is not None:
+                run.profiler.dump_stats(file_stem + ".prof")
+                import pstats
+                stats_text = io.StringIO()
+                pstats.Stats(run.profiler, stream=stats_text).sort_stats("cumulative").print_stats(40)
+                with open(file_stem + "_profile.txt", "w", encoding="utf-8") as stats_file:
+                    stats_file.write(stats_text.getvalue())
+                report["cprofile"] = file_stem + ".prof"
+
+            with open(file_stem + "_timing.json", "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, indent=2)
+
+            summary.append("Timing report: {}".format(file_stem + "_timing.json"))
+
+        # The timing report is optional, so the run doesn't fail if it can't be written
+        except OSError:
+            pass
+
+    return summary
@@ -0,0 +1,239 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBAReplica.py
+#
+# Purpose:          Local replica of the national WCSC-KBA database for the scripts in the KBAToolsLocal Toolbox.
+#                   The replica is a file geodatabase or GeoPackage with a copy of each table that the tools read.
+#                   Instead of downloading the whole database again, each sync only pulls the rows whose key
+#                   (inputdatasetid and speciesid, see replica_keys) has changed. A key has changed when its number of
+#                   rows or the checksum of its change timestamps (change_field, from editor tracking) in the national
+#                   database doesn't match the replica, so new, edited and deleted rows are all found with one pass
+#                   over the key fields of each table, without reading the geometry. The timestamps are compared to the
+#                   second, as the replica may store them at a different precision.
+#                   The rows of the changed keys are deleted from the replica and pulled again, in one transaction for
+#                   each table, so a sync that fails part way leaves every table either synced or as it was. GeoPackage
+#                   replicas can't be written in a transaction, but the keys of a table that was left part way
+#                   through don't match the national database, so they are pulled again by the next sync.
+#                   The inputdatasetid values that were pulled are returned so the species summary (KBASummary) only
+#                   refreshes the datasets that changed.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import datetime
+import re
+import time
+import KBABackend
+import KBAIndexes
+
+# VARIABLES FOR KBAREPLICA
+
+# Key fields of each table in the replica, in the order they are synced. The InputDataset table is synced first, so
+# the datasetsourceid values are current when the species summary of the changed inputdatasetid values is refreshed
+replica_keys = {KBAIndexes.inputdataset_table: ["inputdatasetid"],
+                KBAIndexes.biotics_table: ["speciesid"],
+                KBAIndexes.species_table: ["speciesid"],
+                "InputPoint": ["inputdatasetid", "speciesid"],
+                "InputLine": ["inputdatasetid", "speciesid"],
+                "InputPolygon": ["inputdatasetid", "speciesid"],
+                "EO_Polygon": ["speciesid"]}
+
+# Change timestamp field that editor tracking adds to the tables. The attribute values are compared in the tables
+# without it, so edits to the geometry alone are only found in the tables that have the field
+change_field = KBABackend.change_field
+
+# Number of significant digits of the float values that are compared. Single precision fields hold about seven, so
+# a value stored at a lower precision in the replica than in the national database is still the same value
+signature_float_digits = 6
+
+# Date and time values that a backend reads as text (e.g. from a GeoPackage), which are compared as datetime values
+datetime_pattern = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}")
+
+# Maximum number of keys in the sql query used to delete and pull the rows of the changed keys
+sync_chunk_size = 500
+
+
+# CLASSES FOR KBAREPLICA
+class TableSync:
+    """The result of syncing a table: the table, whether it was created in the replica, the number of changed keys and
+    the number of rows deleted from and pulled into the replica, the inputdatasetid values of the changed keys and the
+    time taken in seconds."""
+
+    def __init__(self, table):
+        self.table = table
+        self.created = False
+        self.changed_keys = 0
+        self.deleted_count = 0
+        self.pulled_count = 0
+        self.inputdatasetids = set()
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return "TableSync({!r}, {} changed keys)".format(self.table, self.changed_keys)
+
+
+# FUNCTIONS FOR KBAREPLICA
+def _compareFields(fields):
+    """Return the fields whose values are compared to find the changed keys of a table: the change timestamp field if
+    it is one of the fields, otherwise the attribute fields (without the geometry)."""
+    for field_name in fields:
+        if field_name.lower() == change_field.lower():
+            return [field_name]
+
+    return [field_name for field_name in fields if field_name.upper() != "SHAPE@"]
+
+
+def _signatureValue(value):
+    """Return a compare field value as it is checksummed. Date and times (also as ISO 8601 text) are rounded to the
+    second and float values to signature_float_digits significant digits, so a value that the replica stores at a
+    different precision than the national database gives the same checksum."""
+    if isinstance(value, str):
+        if not datetime_pattern.match(value):
+            return value
+
+        try:
+            value = datetime.datetime.fromisoformat(value.rstrip("Z"))
+        except ValueError:
+            return value
+
+    if isinstance(value, datetime.datetime):
+        return (value.replace(tzinfo=None) + datetime.timedelta(microseconds=500000)).replace(microsecond=0)
+
+    if isinstance(value, float):
+        return float("{:.{}g}".format(value, signature_float_digits))
+
+    return value
+
+
+def _normalizedColumn(value):
+    """Return True if the values of a compare field need to be normalized (see _signatureValue) for the checksum, from
+    its first value that isn't null: date and times (also as ISO 8601 text) and float values."""
+    if isinstance(value, str):
+        return bool(datetime_pattern.match(value))
+
+    return isinstance(value, (datetime.datetime, float))
+
+
+def readKeySignatures(backend, table, key_fields, compare_fields):
+    """Return a dictionary of (key field values) : (number of rows, checksum of the compare field values) for a table.
+    The checksum doesn't depend on the order of the rows or on the precision the values are stored at (see
+    _signatureValue), so the same rows give the same signature in both backends."""
+    key_signatures = {}
+    key_length = len(key_fields)
+
+    # Only the compare fields that hold date and times or float values are normalized, so the checksum of the integer
+    # and text fields is as fast as hashing the row
+    pending_columns = set(range(len(compare_fields)))
+    normalized_columns = set()
+
+    for row in backend.readRows(table, key_fields + compare_fields):
+        key = tuple(row[:key_length])
+        values = row[key_length:]
+
+        if pending_columns:
+            for column in [column for column in pending_columns if values[column] is not None]:
+                pending_columns.discard(column)
+                if _normalizedColumn(values[column]):
+                    normalized_columns.add(column)
+
+        if normalized_columns:
+            values = tuple(_signatureValue(value) if column in normalized_columns else value
+                           for column, value in enumerate(values))
+
+        row_count, checksum = key_signatures.get(key, (0, 0))
+        key_signatures[key] = (row_count + 1, (checksum + hash(tuple(values))) % 2 ** 64)
+
+    return key_signatures
+
+
+def changedKeys(source_signatures, replica_signatures):
+    """Return the keys whose number of rows or latest change timestamp doesn't match, including the keys that only
+    exist on one side (new or deleted), sorted with the null values last."""
+    changed_keys = [key for key in set(source_signatures) | set(replica_signatures)
+                    if source_signatures.get(key) != replica_signatures.get(key)]
+
+    return sorted(changed_keys, key=lambda key: tuple((value is None, value) for value in key))
+
+
+def _valueQuery(field, values):
+    """Return the sql query that selects the rows for a list of id values (None selects the null values)."""
+    value_list = ", ".join(str(value) for value in values if value is not None)
+    null_sql = "{} IS NULL".format(field) if None in values else ""
+
+    if value_list and null_sql:
+        return "({} IN ({}) Or {})".format(field, value_list, null_sql)
+
+    return "{} IN ({})".format(field, value_list) if value_list else null_sql
+
+
+def keyQuery(key_fields, keys):
+    """Return the sql query that selects the rows of a list of keys. Keys with two fields are grouped by the first
+    field, e.g. (inputdatasetid = 12 And speciesid IN (1, 2)) Or (inputdatasetid = 40 And speciesid IN (3))."""
+    if len(key_fields) == 1:
+        return _valueQuery(key_fields[0], [key[0] for key in keys])
+
+    second_values = {}
+    for key in keys:
+        second_values.setdefault(key[0], []).append(key[1])
+
+    return " Or ".join("({} And {})".format(_valueQuery(key_fields[0], [first_value]),
+                                            _valueQuery(key_fields[1], values))
+                       for first_value, values in second_values.items())
+
+
+def syncTable(source, replica, table):
+    """Pull the rows of the changed keys of a table from the source backend into the replica backend, in one
+    transaction. The table is created in the replica (and all of its rows are pulled) if it doesn't exist.
+    Returns a TableSync."""
+    start = time.perf_counter()
+    table_sync = TableSync(table)
+    key_fields = replica_keys[table]
+
+    if not replica.hasTable(table):
+        replica.createTable(table, source)
+        table_sync.created = True
+
+    # Only the fields in both tables are pulled, in case a field was added to the national database since the replica
+    # was created
+    replica_fields = set(field_name.lower() for field_name in replica.fieldNames(table))
+    fields = [field_name for field_name in source.fieldNames(table) if field_name.lower() in replica_fields]
+
+    # The change timestamp is only compared if both tables have it
+    compare_fields = _compareFields(fields)
+    replica_signatures = readKeySignatures(replica, table, key_fields, compare_fields)
+    source_signatures = readKeySignatures(source, table, key_fields, compare_fields)
+    changed_keys = changedKeys(source_signatures, replica_signatures)
+    table_sync.changed_keys = len(changed_keys)
+
+    if "inputdatasetid" in key_fields:
+        table_sync.inputdatasetids = set(key[key_fields.index("inputdatasetid")] for key in changed_keys)
+
+    if changed_keys:
+        with replica.transaction():
+            # An empty table in the replica (e.g. the first sync) is pulled in one pass over the source table
+            if not replica_signatures:
+                table_sync.pulled_count = replica.insertRows(table, fields, source.readRows(table, fields))
+
+            else:
+                for i in range(0, len(changed_keys), sync_chunk_size):
+                    key_sql = keyQuery(key_fields, changed_keys[i:i + sync_chunk_size])
+                    table_sync.deleted_count += replica.deleteRows(table, key_sql)
+                    table_sync.pulled_count += replica.insertRows(table, fields,
+                                                                  source.readRows(table, fields, key_sql))
+
+    table_sync.seconds = time.perf_counter() - start
+
+    return table_sync
+
+
+def syncReplica(source, replica, tables=None):
+    """Sync the tables in replica_keys (or the listed tables) from the source backend (the national database) into the
+    replica backend, one table at a time. Yields a TableSync for each table as it is synced."""
+    for table in replica_keys:
+        if tables is None or table in tables:
+            yield syncTable(source, replica, table)
+
+
+def changedInputDatasetIds(table_syncs):
+    """Return the inputdatasetid values of the changed keys in a list of TableSync, to refresh the species summary
+    with (see KBASummary.refreshSummary)."""
+    return sorted(set(inputdatasetid for table_sync in table_syncs for inputdatasetid in table_sync.inputdatasetids
+                      if inputdatasetid is not None))
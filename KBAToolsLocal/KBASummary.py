@@ -0,0 +1,221 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBASummary.py
+#
+# Purpose:          Persistent species summary table used by the scripts in the KBAToolsLocal Toolbox.
+#                   The summary holds the number of features and the extent for each speciesid and inputdatasetid in
+#                   InputPoint, InputLine, InputPolygon and EO_Polygon, so that the tools can skip empty outputs and
+#                   label the output layers with record counts without querying the feature classes. The extents let
+#                   the tools zoom to their output layers without scanning the features behind the definition queries.
+#                   The summary is stored in a SQLite database in the KBAToolsCache folder. It is built and refreshed
+#                   by the "Build Species Index" tool, and each feature class is only used while its table stamp
+#                   matches the stamp recorded when it was summarized.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+import KBABackend
+import KBAIndexes
+
+# VARIABLES FOR KBASUMMARY
+
+# Name of the SQLite database (in the KBAToolsCache folder) that holds the summary table
+summary_file_name = "species_summary.sqlite"
+
+# Name of the InputDataset table in the map
+inputdataset_table = "InputDataset"
+
+# Fields used to group the features in each feature class, the same as KBAPlanner.count_fields
+# EO_Polygon features are not related to an InputDataset record, so they are only grouped by speciesid
+summary_fields = {"InputPoint": ["speciesid", "inputdatasetid"],
+                  "InputLine": ["speciesid", "inputdatasetid"],
+                  "InputPolygon": ["speciesid", "inputdatasetid"],
+                  "EO_Polygon": ["speciesid"]}
+
+# Maximum number of id values in the sql query used to read or refresh the summary
+summary_chunk_size = 1000
+
+# Tables in the summary database
+summary_schema = ["CREATE TABLE IF NOT EXISTS species_summary (ft_type TEXT, speciesid INTEGER, "
+                  "inputdatasetid INTEGER, datasetsourceid INTEGER, feature_count INTEGER, "
+                  "xmin REAL, ymin REAL, xmax REAL, ymax REAL)",
+                  "CREATE INDEX IF NOT EXISTS species_summary_speciesid ON species_summary (speciesid, ft_type)",
+                  "CREATE INDEX IF NOT EXISTS species_summary_inputdatasetid "
+                  "ON species_summary (ft_type, inputdatasetid)",
+                  "CREATE TABLE IF NOT EXISTS summary_stamp (ft_type TEXT PRIMARY KEY, stamp TEXT)"]
+
+# Table stamps of the feature classes, checked at most every KBAIndexes.stamp_check_interval seconds
+# Key : (summary path, feature class), val : [table stamp, time of the check]
+_stamps = {}
+
+
+# FUNCTIONS FOR KBASUMMARY
+def summaryPath():
+    """Return the path of the summary database in the KBAToolsCache folder."""
+    return os.path.join(KBAIndexes.cacheFolder(), summary_file_name)
+
+
+def _connect():
+    """Open the summary database, creating the summary tables if they don't exist."""
+    connection = sqlite3.connect(summaryPath())
+    for sql in summary_schema:
+        connection.execute(sql)
+
+    return connection
+
+
+def _readStamp(ft_type, check=False):
+    """Return the table stamp of a feature class as JSON, or None if changes to the feature class can't be detected.
+    The stamp is only re-read if it hasn't been checked in the last KBAIndexes.stamp_check_interval seconds, or if
+    check is True."""
+    stamp_key = (summaryPath(), ft_type)
+    stamp = _stamps.get(stamp_key)
+
+    if check or stamp is None or time.time() - stamp[1] >= KBAIndexes.stamp_check_interval:
+        table_stamp = KBABackend.getBackend().tableStamp(ft_type)
+        stamp = [json.dumps(table_stamp) if table_stamp is not None else None, time.time()]
+        _stamps[stamp_key] = stamp
+
+    return stamp[0]
+
+
+def _idQuery(field, id_values):
+    """Return the sql query that selects the rows for a list of id values (None selects the null values)."""
+    id_list = ", ".join(str(i) for i in id_values if i is not None)
+    null_sql = "{} IS NULL".format(field) if None in id_values else ""
+
+    if id_list and null_sql:
+        return "({} IN ({}) Or {})".format(field, id_list, null_sql)
+
+    return "{} IN ({})".format(field, id_list) if id_list else null_sql
+
+
+def _chunks(id_values):
+    """Split a list of id values into lists of at most summary_chunk_size values."""
+    id_values = list(id_values)
+    return [id_values[i:i + summary_chunk_size] for i in range(0, len(id_values), summary_chunk_size)]
+
+
+def _readDatasetSourceIds():
+    """Return a dictionary of inputdatasetid : datasetsourceid for every record in InputDataset."""
+    return dict(KBABackend.getBackend().readRows(inputdataset_table, ["inputdatasetid", "datasetsourceid"]))
+
+
+def _summarizeRows(connection, ft_type, where_clause, datasetsourceid_dict):
+    """Summarize the features that match the where clause and insert them in the summary table."""
+    group_fields = summary_fields[ft_type]
+    group_summaries = KBABackend.getBackend().summarizeGroups(ft_type, group_fields, where_clause)
+
+    summary_rows = []
+    for group, (feature_count, xmin, ymin, xmax, ymax) in group_summaries.items():
+        inputdatasetid = group[1] if len(group) > 1 else None
+        summary_rows.append((ft_type, group[0], inputdatasetid, datasetsourceid_dict.get(inputdatasetid),
+                             feature_count, xmin, ymin, xmax, ymax))
+
+    connection.executemany("INSERT INTO species_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", summary_rows)
+
+
+def _changedInputDatasetIds(connection, ft_type):
+    """Return the inputdatasetid values whose number of features for any speciesid in the feature class doesn't
+    match the summary, using a single grouped count of the feature class by speciesid and inputdatasetid. Features
+    that were moved to another speciesid or inputdatasetid are found too, as long as the row count is the same."""
+    table_counts = KBABackend.getBackend().countGroups(ft_type, summary_fields[ft_type])
+    summary_counts = {(speciesid, inputdatasetid): feature_count for speciesid, inputdatasetid, feature_count in
+                      connection.execute("SELECT speciesid, inputdatasetid, feature_count FROM species_summary "
+                                         "WHERE ft_type = ?", (ft_type,))}
+
+    return set(group[1] for group in set(table_counts) | set(summary_counts)
+               if table_counts.get(group) != summary_counts.get(group))
+
+
+def refreshSummary(inputdatasetids=None, rebuild=False):
+    """Build or refresh the summary table and return a dictionary of feature class : result, where the result is
+    "current", "rebuilt" or the number of inputdatasetid values that were refreshed.
+    A feature class is rebuilt if it has never been summarized (or if rebuild is True). Otherwise only the
+    inputdatasetid values that were passed in, or whose number of features has changed, are summarized again."""
+    datasetsourceid_dict = _readDatasetSourceIds()
+    refresh_results = {}
+
+    with closing(_connect()) as connection:
+        stamp_dict = dict(connection.execute("SELECT ft_type, stamp FROM summary_stamp"))
+
+        for ft_type in summary_fields:
+            stamp = _readStamp(ft_type, True)
+            stamp_changed = stamp_dict.get(ft_type) != stamp
+            by_inputdatasetid = len(summary_fields[ft_type]) > 1
+
+            # Each feature class is refreshed in its own transaction
+            with connection:
+                # A feature class whose changes can't be detected is always rebuilt, and its summary isn't read
+                if rebuild or stamp is None or ft_type not in stamp_dict or (stamp_changed and not by_inputdatasetid):
+                    connection.execute("DELETE FROM species_summary WHERE ft_type = ?", (ft_type,))
+                    _summarizeRows(connection, ft_type, None, datasetsourceid_dict)
+                    refresh_results[ft_type] = "rebuilt"
+
+                elif by_inputdatasetid and (stamp_changed or inputdatasetids):
+                    changed_ids = set(inputdatasetids or [])
+                    if stamp_changed:
+                        changed_ids.update(_changedInputDatasetIds(connection, ft_type))
+
+                    for id_chunk in _chunks(sorted(changed_ids, key=lambda i: (i is None, i))):
+                        connection.execute("DELETE FROM species_summary WHERE ft_type = ? And {}".format(
+                            _idQuery("inputdatasetid", id_chunk)), (ft_type,))
+                        _summarizeRows(connection, ft_type, _idQuery("inputdatasetid", id_chunk),
+                                       datasetsourceid_dict)
+
+                    refresh_results[ft_type] = len(changed_ids)
+
+                else:
+                    refresh_results[ft_type] = "current"
+
+                connection.execute("INSERT OR REPLACE INTO summary_stamp VALUES (?, ?)", (ft_type, stamp))
+
+    return refresh_results
+
+
+def _readSummaryMatrix(speciesids, value_fields):
+    """Return a dictionary of feature class : {speciesid : {inputdatasetid : value}} for the feature classes whose
+    summary is current, where the value is read from the value fields of the summary table (a tuple if there is more
+    than one field). Feature classes that haven't been summarized, or that have changed since, are left out."""
+    if not os.path.exists(summaryPath()):
+        return {}
+
+    summary_matrix = {}
+    value_sql = ", ".join(value_fields)
+
+    try:
+        with closing(_connect()) as connection:
+            stamp_dict = dict(connection.execute("SELECT ft_type, stamp FROM summary_stamp"))
+
+            for ft_type in summary_fields:
+                stamp = _readStamp(ft_type)
+                if stamp is None or ft_type not in stamp_dict or stamp_dict[ft_type] != stamp:
+                    continue
+
+                species_values = summary_matrix.setdefault(ft_type, {})
+                for id_chunk in _chunks(sorted(set(speciesids))):
+                    for row in connection.execute(
+                            "SELECT speciesid, inputdatasetid, {} FROM species_summary "
+                            "WHERE ft_type = ? And {}".format(value_sql, _idQuery("speciesid", id_chunk)), (ft_type,)):
+                        species_values.setdefault(row[0], {})[row[1]] = row[2] if len(row) == 3 else row[2:]
+
+    # A summary that can't be read is ignored, and the records are read from the feature classes
+    except sqlite3.Error:
+        return {}
+
+    return summary_matrix
+
+
+def readSummaryCountMatrix(speciesids):
+    """Return the count matrix (see KBAPlanner.readCountMatrix) for the feature classes whose summary is current.
+    Feature classes that haven't been summarized, or that have changed since, are left out of the matrix."""
+    return _readSummaryMatrix(speciesids, ["feature_count"])
+
+
+def readSummaryExtentMatrix(speciesids):
+    """Return the extent matrix (see KBAPlanner.readExtentMatrix) for the feature classes whose summary is current.
+    Feature classes that haven't been summarized, or that have changed since, are left out of the matrix."""
+    return _readSummaryMatrix(speciesids, ["xmin", "ymin", "xmax", "ymax"])
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBATemplates.py
+#
+# Purpose:          Group layer template shared by the tools in the KBAToolsLocal Toolbox.
+#                   The output group layers are copies of the SpeciesData group layer without its data layers. The
+#                   template is written once to a .lyrx file in the KBAToolsCache folder and reused by every run (and
+#                   every species in a batch) for as long as the SpeciesData layer definitions don't change. Only the
+#                   most recently used templates are kept in the folder.
+#                   The output data layers are made directly from the data layers in the SpeciesData group layer, so
+#                   no copies of the data layers need to be added to and then removed from each group layer.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import glob
+import hashlib
+import json
+import os
+import KBAIndexes
+
+# VARIABLES FOR KBATEMPLATES
+
+# Name of the group layer that holds the data layers in the map
+species_group_name = "SpeciesData"
+
+# Name of the template layer files in the KBAToolsCache folder, keyed by the SpeciesData definition hash
+template_file_name = "species_group_{}.lyrx"
+
+# Maximum number of template layer files kept in the KBAToolsCache folder, the least recently used are removed first
+max_template_files = 5
+
+# Group layer templates loaded in the current session, key : SpeciesData definition hash, val : arcpy.mp.LayerFile
+_templates = {}
+
+
+# FUNCTIONS FOR KBATEMPLATES
+def _layerDefinition(lyr):
+    """Return the properties of a layer that are copied into the output group layers and data layers. The visibility
+    is left out, because the tools set it on each layer after it is added (see KBAMapBuilder.addGroupLayer)."""
+    definition = {"name": lyr.name}
+
+    for property_name, supports_name in [("dataSource", "DATASOURCE"),
+                                         ("definitionQuery", "DEFINITIONQUERY"),
+                                         ("transparency", "TRANSPARENCY")]:
+        if lyr.supports(supports_name):
+            definition[property_name] = getattr(lyr, property_name)
+
+    return definition
+
+
+def templateKey(species_group_lyr):
+    """Return a hash of the definitions of the SpeciesData group layer and its data layers."""
+    definitions = [_layerDefinition(species_group_lyr)]
+    definitions.extend(_layerDefinition(lyr) for lyr in species_group_lyr.listLayers())
+
+    return hashlib.sha1(json.dumps(definitions, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _writeGroupTemplate(species_group_lyr, template_path):
+    """Write the SpeciesData group layer to a layer file and remove its data layers from the layer file."""
+    arcpy.SaveToLayerFile_management(species_group_lyr, template_path)
+
+    # Only keep the group layer definition, so the template is added to the map without any data layers
+    layer_file = arcpy.mp.LayerFile(template_path)
+    layer_document = layer_file.getDefinition("V3")
+    group_definition = [d for d in layer_document.layerDefinitions if d.name == species_group_lyr.name][0]
+    group_definition.layers = []
+    layer_document.layers = [group_definition.uRI]
+    layer_document.layerDefinitions = [group_definition]
+    layer_file.setDefinition(layer_document)
+    layer_file.save()
+
+
+def _pruneTemplates():
+    """Remove the least recently used template layer files over max_template_files from the KBAToolsCache folder."""
+    template_paths = sorted(glob.glob(os.path.join(KBAIndexes.cacheFolder(), template_file_name.format("*"))),
+                            key=os.path.getmtime, reverse=True)
+
+    for template_path in template_paths[max_template_files:]:
+        # A template that is still open in another session is removed by a later run
+        try:
+            os.remove(template_path)
+        except OSError:
+            pass
+
+
+def readGroupTemplate(species_group_lyr):
+    """Return the empty group layer template (arcpy.mp.LayerFile) for the SpeciesData group layer. The template is
+    only written again if the SpeciesData layer definitions have changed."""
+    template_key = templateKey(species_group_lyr)
+    template = _templates.get(template_key)
+    if template is not None:
+        return template
+
+    template_path = os.path.join(KBAIndexes.cacheFolder(), template_file_name.format(template_key))
+    if not os.path.exists(template_path):
+        _writeGroupTemplate(species_group_lyr, template_path)
+        _pruneTemplates()
+    else:
+        # Mark the template as recently used, so it isn't removed by _pruneTemplates
+        os.utime(template_path)
+
+    template = arcpy.mp.LayerFile(template_path)
+    _templates[template_key] = template
+
+    return template
+
+
+def readSourceLayer(m, ft_type):
+    """Return the data layer in the SpeciesData group layer that the output layers for a feature class are made from,
+    or None if it isn't in the map."""
+    for species_group_lyr in m.listLayers(species_group_name):
+        if species_group_lyr.isGroupLayer:
+            for lyr in species_group_lyr.listLayers(ft_type):
+                return lyr
+
+    return None
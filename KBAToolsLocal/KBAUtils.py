@@ -5,7 +5,12 @@
 # ----------------------------------------------------------------------------------------------------------------------
 
 # Import libraries
-import arcpy
+import bisect
+import heapq
+from array import array
+from collections import namedtuple
+import KBABackend
+import KBAIndexes
 
 # VARIABLES FOR KBATOOLSLOCAL
 
@@ -31,18 +36,288 @@ symbology_dict = {"ECCCRangeMaps":
                   "COSEWICEOOMaps":
                       ["COSEWIC EOO Map", "1121", {'RGB': [2, 172, 158, 30]}, {'RGB': [2, 172, 158, 100]}]}
 
+# Name of the InputDataset table in the map, used in the sql subquery for long lists of inputdatasetid values
+inputdataset_table = "InputDataset"
+
+# Feature class that the inputdatasetid sql queries are run on. The subquery names the InputDataset table as it is named
+# in the workspace of this feature class (see KBABackend.Backend.subqueryTableName)
+predicate_feature_class = "InputPolygon"
+
+# Smallest run of consecutive id values that is written as a BETWEEN clause instead of being listed
+between_min_length = 3
+
+# Largest number of terms (listed values + BETWEEN clauses) in an id predicate. Longer predicates select the
+# inputdatasetid values with a subquery on the datasetsourceid values instead, so the query stays the same length
+# however many datasets there are
+predicate_term_threshold = 250
+
+# Predicates built by inputDatasetPredicate, because the same filtered dataset lists are used for every species
+# Key : (inputdatasetid values, datasetsourceid values, exclude, InputDataset table name), val : sql query
+_predicate_cache = {}
+_predicate_cache_size = 64
+
+# Id sets of the filtered datasets, built from the InputDataset index
+# Key : datasetsourceid, val : [inputdatasetid list in the index, IdSet]
+_filtered_id_sets = {}
+
+# Unions of id sets built by unionIdSets, because the same filtered datasets are combined for every species
+# Key : tuple of IdSets, val : IdSet
+_union_cache = {}
+_union_cache_size = 16
+
+# Largest number of species records held at a time by bufferSpeciesRecords, e.g. the species in a batch that are
+# counted and planned together
+species_buffer_size = 500
+
+
+# CLASSES FOR KBATOOLSLOCAL
+class SpeciesRecord(namedtuple("SpeciesRecord", ["speciesid", "element_code", "s_level", "sci_name", "en_name",
+                                                 "fr_name"])):
+    """A Biotics record (values for KBAIndexes.biotics_fields) for a species or infraspecies. Records are immutable
+    tuples without an instance dictionary, so they can be unpacked like the search cursor rows they replace."""
+    __slots__ = ()
+
+    def isFullSpecies(self):
+        """Return True if the record is a full species (not an infraspecies)."""
+        return self.s_level == "Species"
+
+
+class IdSet:
+    """An immutable set of integer id values (e.g. speciesid or inputdatasetid values), held as a sorted array of
+    unique values. Null values are dropped, because they never match an id predicate.
+    An IdSet uses 8 bytes per id, membership tests are a binary search, and unions / differences with other id sets
+    are a single merge of the sorted arrays. Id sets are hashable, so they can be used as cache keys."""
+    __slots__ = ("_ids", "_hash")
+
+    def __init__(self, id_values=()):
+        if isinstance(id_values, IdSet):
+            # Id sets are never changed, so the array and its hash are shared
+            self._ids = id_values._ids
+            self._hash = id_values._hash
+        else:
+            self._ids = array("q", sorted(set(id_value for id_value in id_values if id_value is not None)))
+            self._hash = None
+
+    @classmethod
+    def _fromSorted(cls, sorted_ids):
+        """Return an id set from an array of sorted unique id values, without sorting them again."""
+        id_set = cls.__new__(cls)
+        id_set._ids = sorted_ids
+        id_set._hash = None
+        return id_set
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, id_value):
+        index = bisect.bisect_left(self._ids, id_value) if id_value is not None else len(self._ids)
+        return index < len(self._ids) and self._ids[index] == id_value
+
+    def __eq__(self, other):
+        return isinstance(other, IdSet) and self._ids == other._ids
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self._ids.tobytes())
+        return self._hash
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __repr__(self):
+        return "IdSet({} ids)".format(len(self._ids))
+
+    def union(self, *others):
+        """Return the id values that are in this set or any of the others."""
+        id_arrays = [self._ids] + [asIdSet(other)._ids for other in others]
+        union_ids = array("q")
+        for id_value in heapq.merge(*id_arrays):
+            if not union_ids or union_ids[-1] != id_value:
+                union_ids.append(id_value)
+
+        return IdSet._fromSorted(union_ids)
+
+    def difference(self, other):
+        """Return the id values that are in this set and not in the other."""
+        other_ids = asIdSet(other)._ids
+        difference_ids = array("q")
+        other_index = 0
+        for id_value in self._ids:
+            while other_index < len(other_ids) and other_ids[other_index] < id_value:
+                other_index += 1
+            if other_index == len(other_ids) or other_ids[other_index] != id_value:
+                difference_ids.append(id_value)
+
+        return IdSet._fromSorted(difference_ids)
+
+    def ranges(self):
+        """Return the id values as a sorted list of (first id, last id) runs of consecutive values."""
+        id_ranges = []
+        for id_value in self._ids:
+            if id_ranges and id_value == id_ranges[-1][1] + 1:
+                id_ranges[-1][1] = id_value
+            else:
+                id_ranges.append([id_value, id_value])
+
+        return [tuple(id_range) for id_range in id_ranges]
+
+    def sql(self, field, exclude=False):
+        """Return the sql query that selects (or excludes) the id values in a field (see idPredicate)."""
+        return idPredicate(field, self, exclude)
+
 
 # FUNCTIONS FOR KBATOOLSLOCAL
+def streamSpeciesRecords(species_values):
+    """Yield (species value, SpeciesRecord or None) for each national_scientific_name or speciesid value, in order.
+    Values that are whole numbers are speciesids. The records are looked up in the taxon hierarchy as they are read,
+    so the values can be any iterable (e.g. the rows of a CSV file) and no cursor is held open between records."""
+    taxon_hierarchy = KBAIndexes.readTaxonHierarchy()
+
+    for value in species_values:
+        speciesid = value if isinstance(value, int) or value.isdigit() else taxon_hierarchy["names"].get(value)
+        record = taxon_hierarchy["records"].get(str(speciesid))
+
+        yield value, SpeciesRecord._make(record) if record is not None else None
+
+
+def fullSpeciesRecords(value_records, skip_function=None):
+    """Yield the full species records from (species value, SpeciesRecord or None) pairs, without duplicates.
+    skip_function(species value, record) is called for the values that aren't in Biotics (record is None) or that
+    aren't full species, e.g. to warn that they will not be processed."""
+    yielded_ids = set()
+
+    for value, record in value_records:
+        if record is None or not record.isFullSpecies():
+            if skip_function is not None:
+                skip_function(value, record)
+
+        elif record.speciesid not in yielded_ids:
+            yielded_ids.add(record.speciesid)
+            yield record
+
+
+def bufferSpeciesRecords(records, buffer_size=None):
+    """Yield lists of at most buffer_size records (species_buffer_size by default), so that a long stream of species
+    can be counted and planned a buffer at a time."""
+    buffer_size = buffer_size or species_buffer_size
+    record_buffer = []
+
+    for record in records:
+        record_buffer.append(record)
+
+        if len(record_buffer) >= buffer_size:
+            yield record_buffer
+            record_buffer = []
+
+    if record_buffer:
+        yield record_buffer
+
+
+def asIdSet(id_values):
+    """Return the id values as an IdSet, without copying them if they already are one."""
+    return id_values if isinstance(id_values, IdSet) else IdSet(id_values)
+
+
 def readFilteredInputDatasetID(key_value):
-    """Return the inputdatasetid values based on the unique datasetsourceid value for each filtered dataset"""
-    datasetids = []
+    """Return the inputdatasetid values (IdSet) based on the unique datasetsourceid value for each filtered dataset"""
+
+    # Look up the unique datasetsourceid value (key_value) from the dictionary in the session-wide InputDataset index,
+    # which reads the InputDataset table once instead of once per filtered dataset and species
+    datasetids = KBAIndexes.readInputDatasetIndex().get(str(key_value), [])
 
-    # Call the search cursor based on the unique datasetsourceid value (key_value) from the dictionary
-    with arcpy.da.SearchCursor("InputDataset",
-                               ["inputdatasetid", "datasetsourceid"],
-                               "datasetsourceid = " + key_value) as inputdataset_cursor:
-        for inputdataset_record in inputdataset_cursor:
-            datasetids.append(inputdataset_record[0])  # Append inputdatasetid values to list
+    # The id set is only built again if the InputDataset index has been rebuilt since it was last read
+    filtered_id_set = _filtered_id_sets.get(str(key_value))
+    if filtered_id_set is None or filtered_id_set[0] is not datasetids:
+        filtered_id_set = [datasetids, IdSet(datasetids)]
+        _filtered_id_sets[str(key_value)] = filtered_id_set
 
     # return the inputdatasetid values for the called dataset
-    return datasetids
+    return filtered_id_set[1]
+
+
+def unionIdSets(id_sets):
+    """Return the union of a list of id sets, e.g. the inputdatasetid values of all the filtered datasets."""
+    cache_key = tuple(asIdSet(id_set) for id_set in id_sets)
+    union_set = _union_cache.get(cache_key)
+
+    if union_set is None:
+        union_set = IdSet().union(*cache_key)
+
+        if len(_union_cache) >= _union_cache_size:
+            _union_cache.clear()
+        _union_cache[cache_key] = union_set
+
+    return union_set
+
+
+def idRanges(id_values):
+    """Return the unique id values as a sorted list of (first id, last id) runs of consecutive values."""
+    return asIdSet(id_values).ranges()
+
+
+def idPredicate(field, id_values, exclude=False):
+    """Return the sql query that selects (or excludes) the id values in a field. Duplicate values are dropped and runs
+    of consecutive values are written as BETWEEN clauses, e.g. (inputdatasetid IN (3, 9) Or inputdatasetid BETWEEN 20
+    And 45)."""
+    listed_values = []
+    terms = []
+    for first_id, last_id in idRanges(id_values):
+        if last_id - first_id + 1 >= between_min_length:
+            terms.append("{} BETWEEN {} And {}".format(field, first_id, last_id))
+        else:
+            listed_values.extend(range(first_id, last_id + 1))
+
+    if len(listed_values) == 1:
+        terms.insert(0, "{} = {}".format(field, listed_values[0]))
+    elif listed_values:
+        terms.insert(0, "{} IN ({})".format(field, ", ".join(str(i) for i in listed_values)))
+
+    if not terms:
+        raise ValueError("No id values for the {} predicate.".format(field))
+
+    predicate = terms[0] if len(terms) == 1 else "({})".format(" Or ".join(terms))
+
+    # Null values are never selected, with or without exclude (the same as NOT IN)
+    return "NOT {}".format(predicate) if exclude else predicate
+
+
+def inputDatasetPredicate(inputdatasetid_list, datasetsourceid_list=None, exclude=False, subquery_table=None):
+    """Return the sql query that selects (or excludes) the features for a list of inputdatasetid values.
+    If the inputdatasetid values are all the InputDataset records for a list of datasetsourceid values, pass the
+    datasetsourceid values too: a long list of inputdatasetid values is then replaced with a subquery on the
+    InputDataset table. The subquery names the table as subquery_table, or by default as it is named in the workspace
+    of the InputPolygon data (e.g. kba.dbo.InputDataset). The values are listed if the name can't be resolved."""
+    if datasetsourceid_list and subquery_table is None:
+        subquery_table = KBABackend.getBackend().subqueryTableName(inputdataset_table, predicate_feature_class)
+
+    cache_key = (asIdSet(inputdatasetid_list), tuple(datasetsourceid_list or ()), exclude, subquery_table)
+    predicate = _predicate_cache.get(cache_key)
+
+    if predicate is None:
+        predicate = _buildInputDatasetPredicate(inputdatasetid_list, datasetsourceid_list, exclude, subquery_table)
+
+        if len(_predicate_cache) >= _predicate_cache_size:
+            _predicate_cache.clear()
+        _predicate_cache[cache_key] = predicate
+
+    return predicate
+
+
+def _buildInputDatasetPredicate(inputdatasetid_list, datasetsourceid_list, exclude, subquery_table):
+    """Build the sql query returned by inputDatasetPredicate."""
+    id_ranges = idRanges(inputdatasetid_list)
+    term_count = sum(1 if last_id - first_id + 1 >= between_min_length else last_id - first_id + 1
+                     for first_id, last_id in id_ranges)
+
+    if datasetsourceid_list and subquery_table and term_count > predicate_term_threshold:
+        return "inputdatasetid {}IN (SELECT inputdatasetid FROM {} WHERE datasetsourceid IN ({}))".format(
+            "NOT " if exclude else "", subquery_table, ", ".join(str(i) for i in sorted(set(
+                int(datasetsourceid) for datasetsourceid in datasetsourceid_list))))
+
+    return idPredicate("inputdatasetid", inputdatasetid_list, exclude)
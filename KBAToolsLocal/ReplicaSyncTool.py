@@ -0,0 +1,176 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      ReplicaSyncTool.py
+# Tool Location:    KBAToolsLocal Toolbox
+# Tool Name:        "Sync Local Replica"
+#
+# Script Created:   2026-10-17
+# Last Updated:     2026-10-17
+# Script Author:    Meg Southee
+# Credits:          © WCS Canada / Meg Southee 2026
+#
+# Purpose:          Keeps a local file geodatabase or GeoPackage replica of the national WCSC-KBA database up to date
+#                   (KBAReplica), so that the tools can be run against local data without downloading the whole
+#                   database again. The first sync copies each table that the tools read. Later syncs only pull the rows
+#                   of the inputdatasetid and speciesid values that have changed, one transaction per table (except for
+#                   GeoPackage replicas, which don't support edit sessions).
+#                   If the SpeciesData data layers in the map read from the replica, the species summary (KBASummary) is
+#                   then refreshed for the inputdatasetid values that were pulled.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import os
+import sys
+import traceback
+import KBABackend
+import KBAMapBuilder
+import KBAReplica
+import KBASummary
+import KBATemplates
+
+
+# Define class called Tool
+class Tool:
+    """Sync the local replica of the national WCSC-KBA database."""
+
+    # Instantiate the class
+    def __init__(self):
+        pass
+
+    """These functions are called from within the run_tool function."""
+
+    # Define a function to check whether the SpeciesData data layers in the current map read from the replica
+    def map_reads_replica(replica_workspace):
+        replica_path = os.path.normcase(os.path.abspath(replica_workspace))
+
+        for dataset in KBAMapBuilder.required_datasets:
+            lyr_path = "{}\\{}".format(KBATemplates.species_group_name, dataset)
+            if not arcpy.Exists(lyr_path):
+                return False
+
+            catalog_path = os.path.normcase(os.path.abspath(arcpy.Describe(lyr_path).catalogPath))
+            if not catalog_path.startswith(replica_path):
+                return False
+
+        return True
+
+    # Define a function to run the tool
+    def run_tool(self, parameters, messages):
+
+        # # SET VARIABLES FOR THE SCRIPT ...............................................................................
+
+        # Make variables from input parameters defined in .pyt
+        # Workspace (e.g. an enterprise geodatabase connection file) of the national WCSC-KBA database
+        param_source = parameters[0].valueAsText
+        arcpy.AddMessage("National Database: {}".format(param_source))
+
+        # File geodatabase or GeoPackage that holds the local replica
+        param_replica = parameters[1].valueAsText
+        arcpy.AddMessage("Local Replica: {}".format(param_replica))
+
+        # This is a boolean parameter, if the box is checked then the value is True, otherwise None
+        param_refresh_index = parameters[2].value
+        arcpy.AddMessage("Refresh Species Index: {}".format(param_refresh_index))
+
+        try:
+            # # START ERROR HANDLING ...................................................................................
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Error Handling Processes...")
+
+            # The replica can't be synced from itself
+            if os.path.normcase(os.path.abspath(param_source)) == os.path.normcase(os.path.abspath(param_replica)):
+                arcpy.AddError("The local replica can't be the national database.")
+                return
+
+            # # END ERROR HANDLING .....................................................................................
+
+            # # START DATA PROCESSING ..................................................................................
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Geoprocessing...")
+
+            source = KBABackend.ArcpyBackend(param_source)
+            replica = KBABackend.ArcpyBackend(param_replica)
+
+            # GeoPackage replicas don't support edit sessions, so a sync that fails part way is finished by the next one
+            if not replica.editSessions():
+                arcpy.AddMessage("The local replica doesn't support transactions, the changes are written as each "
+                                 "table is synced.")
+
+            # Sync one table at a time, each table is written to the replica in its own transaction
+            table_syncs = []
+            for table in KBAReplica.replica_keys:
+                arcpy.SetProgressorLabel("Syncing {}...".format(table))
+                table_sync = KBAReplica.syncTable(source, replica, table)
+                table_syncs.append(table_sync)
+
+                if table_sync.created:
+                    arcpy.AddMessage("{}: created in the replica, {} rows pulled ({:.1f} s).".format(
+                        table, table_sync.pulled_count, table_sync.seconds))
+
+                elif table_sync.changed_keys:
+                    arcpy.AddMessage("{}: {} changed keys, {} rows deleted and {} rows pulled ({:.1f} s).".format(
+                        table, table_sync.changed_keys, table_sync.deleted_count, table_sync.pulled_count,
+                        table_sync.seconds))
+
+                else:
+                    arcpy.AddMessage("{}: up to date ({:.1f} s).".format(table, table_sync.seconds))
+
+            arcpy.ResetProgressor()
+
+            # # REFRESH THE SPECIES INDEX ..............................................................................
+            inputdatasetids = KBAReplica.changedInputDatasetIds(table_syncs)
+
+            if param_refresh_index and any(table_sync.changed_keys for table_sync in table_syncs):
+                arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+
+                # The species summary is stamped with the data layers in the map, so it can only be refreshed from the
+                # replica if the map reads from it
+                if Tool.map_reads_replica(param_replica):
+                    arcpy.AddMessage("Refreshing the species index for {} inputdatasetid values...".format(
+                        len(inputdatasetids)))
+                    refresh_results = KBASummary.refreshSummary(inputdatasetids)
+
+                    for ft_type in refresh_results:
+                        if refresh_results[ft_type] == "rebuilt":
+                            arcpy.AddMessage("{}: summary rebuilt.".format(ft_type))
+
+                        elif refresh_results[ft_type] == "current":
+                            arcpy.AddMessage("{}: summary is up to date.".format(ft_type))
+
+                        else:
+                            arcpy.AddMessage("{}: summary refreshed for {} inputdatasetid values.".format(
+                                ft_type, refresh_results[ft_type]))
+
+                else:
+                    arcpy.AddWarning("The SpeciesData data layers in the map don't read from the local replica, so "
+                                     "the species index was not refreshed. Run the Build Species Index tool after the "
+                                     "data layers are pointed at the replica.")
+
+            arcpy.AddMessage("End of script.")
+
+        # Error handling if an error occurs while using a Geoprocessing Tool in the script
+        except arcpy.ExecuteError:
+            # Get the tool error messages
+            msgs = arcpy.GetMessages(2)
+
+            # Return tool error messages for use with a script tool
+            arcpy.AddError(msgs)
+
+            # Print tool error messages for use in Python
+            print(msgs)
+
+        # Error handling if the script fails for other unexplained reasons
+        except:
+            # Get the traceback object
+            tb = sys.exc_info()[2]
+            tbinfo = traceback.format_tb(tb)[0]
+
+            # Concatenate information together concerning the error into a message string
+            pymsg = "PYTHON ERRORS:\nTraceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+            msgs = "ArcPy ERRORS:\n" + arcpy.GetMessages(2) + "\n"
+
+            # Return Python error messages for use in script tool or Python window
+            arcpy.AddError(pymsg)
+            arcpy.AddError(msgs)
+
+# End of script
@@ -0,0 +1,234 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      SpeciesExportTool.py
+# Tool Location:    KBAToolsLocal Toolbox
+# Tool Name:        "Export Tool - Species Data Packages" [ONE GEOPACKAGE PER SPECIES]
+#
+# Script Created:   2026-10-17
+# Last Updated:     2026-10-17
+# Script Author:    Meg Southee
+# Credits:          © WCS Canada / Meg Southee 2026
+#
+# Purpose:          Exports a self-contained GeoPackage for each species in a list, for offline KBA review (e.g. at
+#                   assessment workshops). Species are selected from the dropdown and/or read from a CSV file of
+#                   national scientific names or speciesid values, as in the "Mapping Tool - Batch Species".
+#                   Each GeoPackage holds a table for each output layer that the "Mapping Tool - Species" would add to
+#                   the map for the species and its infraspecies: InputPoint, InputLine, EO_Polygon, the seven filtered
+#                   range / AOO / EOO / critical habitat datasets and the remaining InputPolygons. The tables are
+#                   planned with the same sql queries and plan cache (KBAPlanner, KBAPlanCache) as the mapping tools.
+#                   The GeoPackages are written by a pool of worker processes (KBAExport), started once for the run,
+#                   and the features are copied one at a time, so large species don't need to fit in memory. The
+#                   species are read as a stream of records (KBAUtils) and planned and exported a buffer at a time, so
+#                   long lists of species don't either.
+#                   Each run is timed by KBAProfiler and writes a JSON timing report to the scratch folder.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import arcpy
+import itertools
+import os
+import sys
+import traceback
+import BatchSpeciesMappingTool
+import KBAExceptions
+import KBAExport
+import KBAMapBuilder
+import KBAPlanner
+import KBAProfiler
+import KBAUtils
+
+
+# Define class called Tool
+class Tool:
+    """Export a GeoPackage of the output datasets for each full species (and its infraspecies) in a list of species."""
+
+    # Instantiate the class
+    def __init__(self):
+        pass
+
+    """These functions are called from within the run_tool function."""
+
+    # Define a function to warn about a species value that will not be exported (see KBAUtils.fullSpeciesRecords)
+    def skip_species(value, row):
+        if row is None:
+            arcpy.AddWarning("{} is not in the Biotics table and will not be processed.".format(value))
+
+        else:
+            arcpy.AddWarning("{} is not a full species and will not be processed.".format(row.sci_name))
+
+    # Define a function to run the tool
+    def run_tool(self, parameters, messages):
+
+        # Time the phases of the run (see KBAProfiler)
+        KBAProfiler.startRun("Export Tool - Species Data Packages", arcpy)
+        KBAProfiler.startPhase("setup")
+
+        # # SET VARIABLES FOR THE SCRIPT ...............................................................................
+
+        # Make variables from input parameters defined in .pyt (the last parameter is the search string, which only
+        # fills the species dropdown)
+        # Multivalue list of species from the dropdown menu in tool dialog
+        param_species = parameters[0].values or []
+        arcpy.AddMessage("Species: {}".format("; ".join(param_species)))
+
+        # CSV file of species names or speciesid values
+        param_species_csv = parameters[1].valueAsText
+        arcpy.AddMessage("Species CSV: {}".format(param_species_csv))
+
+        # Folder that the GeoPackages are written to
+        param_output_folder = parameters[2].valueAsText
+        arcpy.AddMessage("Output Folder: {}".format(param_output_folder))
+
+        # Number of worker processes, the default is set in KBAExport
+        param_workers = parameters[3].value or KBAExport.export_workers
+        arcpy.AddMessage("Worker Processes: {}".format(param_workers))
+
+        try:
+            # Current ArcPro Project
+            aprx = arcpy.mp.ArcGISProject("CURRENT")
+
+            # Current Active Map in ArcPro Project
+            m = aprx.activeMap
+
+            # # START ERROR HANDLING TO CHECK THAT THE MAP CONTAINS THE NECESSARY TABLES AND DATA LAYERS ...............
+            KBAProfiler.startPhase("validation")
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Error Handling Processes...")
+
+            # Check that the map contains the SpeciesData group layer and the required data layers and tables without
+            # active definition queries (the worker processes read the data sources directly, so a definition query
+            # would be ignored)
+            KBAMapBuilder.validateMap(m)
+
+            # # END ERROR HANDLING .....................................................................................
+
+            # # START DATA PROCESSING ..................................................................................
+            KBAProfiler.startPhase("species resolution")
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("Start Geoprocessing...")
+
+            # Stream the species from the dropdown and the CSV file as a single sequence of names / speciesid values
+            if not param_species and not param_species_csv:
+                raise KBAExceptions.BatchInputError
+
+            species_values = [value.strip() for value in param_species if value.strip()]
+            if param_species_csv:
+                species_values = itertools.chain(species_values,
+                                                 BatchSpeciesMappingTool.Tool.read_species_csv(param_species_csv))
+
+            # Look up the Biotics records for the species in the taxon hierarchy as they are read, and keep the full
+            # species records in the order they were requested, without duplicates
+            biotics_records = KBAUtils.fullSpeciesRecords(KBAUtils.streamSpeciesRecords(species_values),
+                                                          Tool.skip_species)
+
+            # The worker processes have no map, so they read the data sources of the SpeciesData data layers
+            source_paths = {ft_type: source_lyr.dataSource
+                            for ft_type, source_lyr in KBAMapBuilder.readSourceLayers(m).items()}
+
+            # # PLAN AND WRITE THE DATA PACKAGES, A BUFFER OF SPECIES AT A TIME ........................................
+            # Only the export jobs for the species in the buffer (KBAUtils.species_buffer_size) are held in memory
+            KBAProfiler.startPhase("export")
+            species_count = 0
+            exported_count = 0
+            # The worker processes are started once, for the first buffer that needs them, and write the packages of
+            # every buffer
+            with KBAExport.ExportPool(param_workers) as export_pool:
+                for record_buffer in KBAUtils.bufferSpeciesRecords(biotics_records):
+                    species_count += len(record_buffer)
+
+                    # Get the infraspecies for the species from the taxon hierarchy,
+                    # key : element_code, val : speciesids
+                    speciesid_dict = KBAPlanner.readInfraspeciesIdDict(record_buffer)
+
+                    # Plan the output tables that have records for each species, from the plan cache shared with the
+                    # mapping tools (KBAPlanCache), then leave out the species that have no spatial data
+                    with KBAProfiler.section("record counts"):
+                        planned_jobs = KBAExport.planExportJobs(param_output_folder, source_paths,
+                                                                [(speciesid_dict[row.element_code], row.sci_name)
+                                                                 for row in record_buffer])
+
+                    export_jobs = []
+                    for export_job in planned_jobs:
+                        if export_job.output_tables:
+                            export_jobs.append(export_job)
+                        else:
+                            arcpy.AddWarning("There is no spatial data for {}.".format(export_job.name))
+
+                    arcpy.SetProgressorLabel("Exporting {} species...".format(len(export_jobs)))
+
+                    for export_job, table_counts, error_messages in export_pool.exportPackages(export_jobs):
+                        if error_messages is None:
+                            exported_count += 1
+                            arcpy.AddMessage("{}: {} ({}).".format(
+                                export_job.name, os.path.basename(export_job.package_path),
+                                ", ".join("{} {}".format(table_name, row_count)
+                                          for table_name, row_count in table_counts)))
+
+                        else:
+                            # Keep exporting the rest of the species if a geoprocessing tool fails for one of them
+                            arcpy.AddWarning("{} was not exported.\n{}".format(export_job.name, error_messages))
+
+            arcpy.ResetProgressor()
+
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            arcpy.AddMessage("{} of {} species exported to {}.".format(exported_count, species_count,
+                                                                      param_output_folder))
+            arcpy.AddMessage("End of script.")
+
+        # Error handling for custom error related to required data layers in the map
+        except KBAExceptions.NoDataError as error:
+            arcpy.AddError("{} Layer does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to required data tables in the map
+        except KBAExceptions.NoTableError as error:
+            arcpy.AddError("{} Table does not exist. "
+                           "Re-load {} from WCSC-KBA Map Template.".format(error.args[0], error.args[0]))
+
+        # Error handling for custom error related to active definition queries on required layers
+        except KBAExceptions.DefQueryError as error:
+            arcpy.AddError("{} has an active definition query. "
+                           "Turn off all active definition queries on {} to run the tool.".format(error.args[0],
+                                                                                                  error.args[0]))
+
+        # Error handling for custom error related to SpeciesData group layer not existing
+        except KBAExceptions.SpeciesDataError:
+            arcpy.AddError("SpeciesData (Group Layer) does not exist. "
+                           "Re-load original SpeciesData from WCSC-KBA Map Template.")
+
+        # Error handling for custom error related to no species being given to the tool
+        except KBAExceptions.BatchInputError:
+            arcpy.AddError("No species to process. "
+                           "Select species from the dropdown or provide a CSV file of species names or speciesids.")
+
+        # Error handling if an error occurs while using a Geoprocessing Tool in the script
+        except arcpy.ExecuteError:
+            # Get the tool error messages
+            msgs = arcpy.GetMessages(2)
+
+            # Return tool error messages for use with a script tool
+            arcpy.AddError(msgs)
+
+            # Print tool error messages for use in Python
+            print(msgs)
+
+        # Error handling if the script fails for other unexplained reasons
+        except:
+            # Get the traceback object
+            tb = sys.exc_info()[2]
+            tbinfo = traceback.format_tb(tb)[0]
+
+            # Concatenate information together concerning the error into a message string
+            pymsg = "PYTHON ERRORS:\nTraceback info:\n" + tbinfo + "\nError Info:\n" + str(sys.exc_info()[1])
+            msgs = "ArcPy ERRORS:\n" + arcpy.GetMessages(2) + "\n"
+
+            # Return Python error messages for use in script tool or Python window
+            arcpy.AddError(pymsg)
+            arcpy.AddError(msgs)
+
+        finally:
+            # Print the timing summary and write the timing report to the scratch folder
+            arcpy.AddMessage(u"\u200B")  # Unicode literal to create new line
+            for timing_message in KBAProfiler.endRun(arcpy.env.scratchFolder):
+                arcpy.AddMessage(timing_message)
+
+# End of script
@@ -0,0 +1,434 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      KBABenchmark.py
+#
+# Script Created:   2026-10-17
+# Script Author:    Meg Southee
+# Credits:          © WCS Canada / Meg Southee 2026
+#
+# Purpose:          Benchmark for the species search, species resolution, sql query and output layer planning logic used
+#                   by the FullSpeciesMappingTool, FullSpeciesScopingTool and InfraspeciesTool scripts, and for the
+#                   local replica sync (KBAReplica).
+#                   Generates synthetic Biotics / Species / InputDataset tables and feature classes (speciesid and
+#                   inputdatasetid only) in a SQLite database at national scale, runs the KBAToolsLocal modules
+#                   against it through KBABackend.SQLiteBackend and prints a table of timings.
+#                   Results can be saved to a JSON file and compared with a saved baseline, so that regressions are
+#                   caught before a release. ArcGIS Pro is not needed to run the benchmark.
+#
+# Usage:            python benchmarks/KBABenchmark.py
+#                   python benchmarks/KBABenchmark.py --quick --output results.json
+#                   python benchmarks/KBABenchmark.py --baseline results.json --max-regression 25
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+# The KBAToolsLocal modules are imported from the toolbox folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "KBAToolsLocal"))
+
+import KBABackend  # noqa: E402
+import KBAIndexes  # noqa: E402
+import KBAPlanner  # noqa: E402
+import KBAReplica  # noqa: E402
+import KBASummary  # noqa: E402
+import KBAUtils  # noqa: E402
+
+# VARIABLES FOR KBABENCHMARK
+
+# Default size of the synthetic data (national scale) and of the --quick run
+national_scale = {"elements": 30000, "features": 3000000, "datasets": 2000, "samples": 2000}
+quick_scale = {"elements": 3000, "features": 200000, "datasets": 300, "samples": 300}
+
+# Share of the features in each feature class
+feature_share = {"InputPoint": 0.55, "InputLine": 0.05, "InputPolygon": 0.3, "EO_Polygon": 0.1}
+
+# Share of the full species that have infraspecies, and the most infraspecies for a single species
+infraspecies_share = 0.15
+max_infraspecies = 25
+
+# Infraspecies levels in ca_nname_level
+infraspecies_levels = ["Subspecies", "Variety", "Population"]
+
+# Share of the InputDataset records that belong to the filtered datasets in KBAUtils.symbology_dict
+filtered_dataset_share = 0.1
+
+# Number of rows inserted per executemany call
+insert_chunk_size = 50000
+
+# Seconds added to each grouped count to simulate a file geodatabase on a network share
+network_latency = 0.01
+
+
+# CLASSES FOR KBABENCHMARK
+class LatencyBackend(KBABackend.SQLiteBackend):
+    """SQLiteBackend that waits network_latency seconds before each grouped count, to compare serial and concurrent
+    record counts when most of the time is spent waiting for I/O."""
+
+    def countGroups(self, table, group_fields, where_clause=None):
+        time.sleep(network_latency)
+        return super().countGroups(table, group_fields, where_clause)
+
+
+# FUNCTIONS FOR KBABENCHMARK
+def _insertRows(connection, table, rows):
+    """Insert the rows in chunks so the generated rows are never all held in memory."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == insert_chunk_size:
+            connection.executemany("INSERT INTO {} VALUES ({})".format(table, ", ".join("?" * len(row))), chunk)
+            chunk = []
+
+    if chunk:
+        connection.executemany("INSERT INTO {} VALUES ({})".format(table, ", ".join("?" * len(chunk[0]))), chunk)
+
+
+def generateDatabase(database, elements, features, datasets, seed, indexes=True):
+    """Write synthetic WCSC-KBA tables to a SQLite database and return the number of species and infraspecies."""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(database)
+
+    connection.executescript("""
+        CREATE TABLE BIOTICS_ELEMENT_NATIONAL (speciesid INTEGER, element_code TEXT, ca_nname_level TEXT,
+                                               national_scientific_name TEXT, national_engl_name TEXT,
+                                               national_fr_name TEXT);
+        CREATE TABLE Species (speciesid INTEGER, fullspecies_elementcode TEXT);
+        CREATE TABLE InputDataset (inputdatasetid INTEGER, datasetsourceid INTEGER);
+        CREATE TABLE InputPoint (speciesid INTEGER, inputdatasetid INTEGER);
+        CREATE TABLE InputLine (speciesid INTEGER, inputdatasetid INTEGER);
+        CREATE TABLE InputPolygon (speciesid INTEGER, inputdatasetid INTEGER);
+        CREATE TABLE EO_Polygon (speciesid INTEGER);
+    """)
+
+    # Full species first, then the infraspecies of a share of the full species
+    biotics_rows = []
+    species_rows = []
+    speciesid = 100000
+    while len(biotics_rows) < elements:
+        speciesid += 1
+        element_code = "A{:09d}".format(speciesid)
+        genus = "Genus{}".format(speciesid // 7)
+        sci_name = "{} species{}".format(genus, speciesid)
+        biotics_rows.append((speciesid, element_code, "Species", sci_name, "Common {}".format(speciesid),
+                             "Nom {}".format(speciesid) if rng.random() < 0.8 else None))
+        species_rows.append((speciesid, element_code))
+
+        if rng.random() < infraspecies_share:
+            parent_code = element_code
+            # Most species have a few infraspecies, some have many
+            for i in range(min(int(rng.paretovariate(1.2)), max_infraspecies)):
+                speciesid += 1
+                biotics_rows.append((speciesid, "A{:09d}".format(speciesid), rng.choice(infraspecies_levels),
+                                     "{} ssp. {}".format(sci_name, i + 1), "Common {}".format(speciesid),
+                                     None))
+                species_rows.append((speciesid, parent_code))
+
+    _insertRows(connection, "BIOTICS_ELEMENT_NATIONAL", biotics_rows)
+    _insertRows(connection, "Species", species_rows)
+
+    # InputDataset records, a share of them from the filtered datasets (range maps, critical habitat etc.)
+    filtered_sources = [int(KBAUtils.symbology_dict[key][1]) for key in KBAUtils.symbology_dict]
+    inputdataset_rows = [(inputdatasetid, rng.choice(filtered_sources) if rng.random() < filtered_dataset_share
+                          else rng.randint(2000, 9000)) for inputdatasetid in range(1, datasets + 1)]
+    _insertRows(connection, "InputDataset", inputdataset_rows)
+
+    # Feature counts follow a long-tailed distribution: a few species have most of the features
+    speciesids = [row[0] for row in biotics_rows]
+    species_weights = [rng.paretovariate(1.1) for _ in speciesids]
+    dataset_weights = [rng.paretovariate(1.3) for _ in inputdataset_rows]
+    inputdatasetids = [row[0] for row in inputdataset_rows]
+
+    for ft_type, share in feature_share.items():
+        ft_count = int(features * share)
+        ft_speciesids = rng.choices(speciesids, species_weights, k=ft_count)
+
+        if ft_type == "EO_Polygon":
+            _insertRows(connection, ft_type, ((s,) for s in ft_speciesids))
+        else:
+            ft_datasetids = rng.choices(inputdatasetids, dataset_weights, k=ft_count)
+            _insertRows(connection, ft_type, zip(ft_speciesids, ft_datasetids))
+
+    if indexes:
+        for ft_type in feature_share:
+            connection.execute("CREATE INDEX {0}_speciesid ON {0} (speciesid)".format(ft_type))
+
+    connection.commit()
+    connection.close()
+
+    return sum(1 for row in biotics_rows if row[2] == "Species"), sum(1 for row in biotics_rows if row[2] != "Species")
+
+
+def _timeRuns(function, repeat):
+    """Run a function repeat times and return the timings in seconds and the result of the last run."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+
+    return timings, result
+
+
+def _coldIndex(function):
+    """Return a function that drops the KBAIndexes indexes and their cache files before calling function."""
+    def cold_function():
+        KBAIndexes.invalidateIndex()
+        shutil.rmtree(KBAIndexes.cacheFolder(), ignore_errors=True)
+        return function()
+
+    return cold_function
+
+
+def _withBackend(backend, function):
+    """Return a function that calls function with a different KBABackend backend, without the species index."""
+    def backend_function():
+        default_backend = KBABackend.getBackend()
+        KBABackend.setBackend(backend)
+        try:
+            return function()
+        finally:
+            KBABackend.setBackend(default_backend)
+
+    return backend_function
+
+
+def runBenchmarks(samples, repeat, seed):
+    """Run the benchmarks and return a list of [benchmark name, operations per run, [seconds for each run]]."""
+    rng = random.Random(seed)
+    hierarchy = KBAIndexes.readTaxonHierarchy()
+
+    species_records = [tuple(r) for r in hierarchy["records"].values() if r[2] == "Species"]
+    infraspecies_records = [tuple(r) for r in hierarchy["records"].values() if r[2] != "Species"]
+    parent_codes = set(code for code, ids in hierarchy["infraspecies"].items() if len(ids) > 1)
+
+    sample_species = rng.sample(species_records, min(samples, len(species_records)))
+    sample_parents = [r for r in species_records if r[1] in parent_codes][:samples]
+    sample_infraspecies = rng.sample(infraspecies_records, min(samples, len(infraspecies_records)))
+    filtered_id_dict = KBAPlanner.readFilteredIdDict()
+    filtered_ids = KBAUtils.unionIdSets([filtered_id_dict[key] for key in KBAUtils.symbology_dict])
+
+    # Search strings as typed in the search parameter of the tool dialogs: the start of a common name, and the start of
+    # a scientific name with a typing error in the first word
+    prefix_searches = [r[4][:len(r[4]) - 2] for r in sample_species]
+    similar_searches = ["{}x{} {}".format(r[3][:3], r[3][4:r[3].index(" ")], r[3].split()[1][:6])
+                        for r in sample_species]
+
+    # Speciesid lists as used by each tool
+    mapping_ids = [[r[0]] + KBAPlanner.readInfraspeciesIds(r[1], r[0]) for r in sample_species + sample_parents]
+    scoping_ids = [[speciesid] for ids in mapping_ids for speciesid in ids]
+    infraspecies_ids = [[r[0], hierarchy["elements"][hierarchy["full_species"][str(r[0])]]]
+                        for r in sample_infraspecies]
+
+    # Backends with simulated network latency, reading the feature classes one at a time or concurrently
+    database = KBABackend.getBackend().database
+    serial_backend = LatencyBackend(database)
+    concurrent_backend = LatencyBackend(database, concurrent_reads=True)
+
+    # Local replica of the benchmark database, synced from it once before the benchmarks
+    replica_folder = tempfile.mkdtemp(prefix="kba_replica_")
+    replica_backend = KBABackend.SQLiteBackend(os.path.join(replica_folder, "kba_replica.sqlite"))
+    list(KBAReplica.syncReplica(KBABackend.getBackend(), replica_backend))
+
+    benchmarks = [
+        ("name index (cold)", 1, _coldIndex(KBAIndexes.readSpeciesNames)),
+        ("taxon hierarchy (cold)", 1, _coldIndex(KBAIndexes.readTaxonHierarchy)),
+        ("taxon hierarchy (disk cache)", 1, lambda: (KBAIndexes.invalidateIndex(),
+                                                     KBAIndexes.readTaxonHierarchy())),
+        ("species search index (cold)", 1, lambda: (KBAIndexes.invalidateIndex("species_search"),
+                                                    KBAIndexes.readSpeciesSearchIndex())),
+        ("species search: prefix", len(prefix_searches),
+         lambda: [KBAIndexes.searchSpecies(search_string, True) for search_string in prefix_searches]),
+        ("species search: similar words", len(similar_searches),
+         lambda: [KBAIndexes.searchSpecies(search_string, True) for search_string in similar_searches]),
+        ("species lookup by name", len(sample_species),
+         lambda: [KBAPlanner.readBioticsRecord(r[3]) for r in sample_species]),
+        ("species lookup by speciesid", len(sample_species),
+         lambda: [KBAPlanner.readBioticsRecordById(r[0]) for r in sample_species]),
+        ("infraspecies resolution (species)", len(mapping_ids),
+         lambda: [KBAPlanner.readInfraspeciesIds(r[1], r[0]) for r in sample_species + sample_parents]),
+        ("parent resolution (infraspecies)", len(sample_infraspecies),
+         lambda: [KBAPlanner.readBioticsRecordByElementCode(KBAPlanner.readFullSpeciesElementCode(r[0]))
+                  for r in sample_infraspecies]),
+        ("sql query: species", len(mapping_ids),
+         lambda: [KBAPlanner.speciesQuery(ids) for ids in mapping_ids]),
+        ("sql query: InputPolygon w/out filtered", len(mapping_ids),
+         lambda: [KBAPlanner.planPolyLayer(ids, filtered_ids) for ids in mapping_ids]),
+        ("plan layers: mapping tool", len(mapping_ids),
+         lambda: [KBAPlanner.planSpeciesLayers(ids, filtered_id_dict) for ids in mapping_ids]),
+        ("plan layers: scoping tool", len(scoping_ids),
+         lambda: [KBAPlanner.planSpeciesLayers(ids, filtered_id_dict) for ids in scoping_ids]),
+        ("plan layers: infraspecies tool", len(infraspecies_ids),
+         lambda: [KBAPlanner.planSpeciesLayers([speciesid], filtered_id_dict)
+                  for ids in infraspecies_ids for speciesid in ids]),
+        ("record counts: per species", min(len(mapping_ids), 50),
+         lambda: [KBAPlanner.readCountMatrix(ids) for ids in mapping_ids[:50]]),
+        ("record counts: batch", 1,
+         lambda: KBAPlanner.readCountMatrix([speciesid for ids in mapping_ids for speciesid in ids])),
+        ("record counts: network, serial", min(len(mapping_ids), 10),
+         _withBackend(serial_backend, lambda: [KBAPlanner.readCountMatrix(ids) for ids in mapping_ids[:10]])),
+        ("record counts: network, concurrent", min(len(mapping_ids), 10),
+         _withBackend(concurrent_backend, lambda: [KBAPlanner.readCountMatrix(ids) for ids in mapping_ids[:10]])),
+        ("species index build", 1, lambda: KBASummary.refreshSummary(rebuild=True)),
+        ("record counts: species index", len(mapping_ids),
+         lambda: [KBAPlanner.readCountMatrix(ids) for ids in mapping_ids]),
+        ("replica sync: no changes", len(KBAReplica.replica_keys),
+         lambda: list(KBAReplica.syncReplica(KBABackend.getBackend(), replica_backend))),
+    ]
+
+    results = []
+    for name, operations, function in benchmarks:
+        timings, _ = _timeRuns(function, repeat)
+        results.append([name, operations, timings])
+        print("  {}: {:.3f} s".format(name, statistics.median(timings)), file=sys.stderr)
+
+    # Check that a species can be found from its scientific name with a typing error
+    if sample_species[0][0] not in [speciesid for speciesid, _ in KBAIndexes.searchSpecies(similar_searches[0], True)]:
+        raise AssertionError("Species search doesn't find {}.".format(similar_searches[0]))
+
+    # Check that the record counts from the species index match the grouped counts from the feature classes
+    count_matrix = KBAPlanner.readCountMatrix(mapping_ids[0])
+    os.remove(KBASummary.summaryPath())
+    if count_matrix != KBAPlanner.readCountMatrix(mapping_ids[0]):
+        raise AssertionError("Record counts from the species index don't match the feature classes.")
+
+    # Check that the concurrent record counts match the serial record counts
+    if _withBackend(concurrent_backend, lambda: KBAPlanner.readCountMatrix(mapping_ids[0]))() != count_matrix:
+        raise AssertionError("Concurrent record counts don't match the serial record counts.")
+
+    # Check that a sync pulls the rows that were deleted from the replica again, and only those
+    deleted_count = replica_backend.deleteRows("InputPoint", "inputdatasetid = 1")
+    replica_backend.connection.commit()
+    table_syncs = list(KBAReplica.syncReplica(KBABackend.getBackend(), replica_backend, ["InputPoint"]))
+    if table_syncs[0].pulled_count != deleted_count or table_syncs[0].deleted_count or \
+            replica_backend.countGroups("InputPoint", ["inputdatasetid", "speciesid"]) != \
+            KBABackend.getBackend().countGroups("InputPoint", ["inputdatasetid", "speciesid"]):
+        raise AssertionError("Replica sync doesn't match the InputPoint feature class.")
+
+    serial_backend.close()
+    concurrent_backend.close()
+    replica_backend.close()
+    shutil.rmtree(replica_folder, ignore_errors=True)
+
+    return results
+
+
+def printTable(results, baseline=None):
+    """Print the results (median of the runs) as a table, with the change from the baseline if there is one.
+    Returns the largest slowdown from the baseline as a percentage."""
+    baseline = baseline or {}
+    max_change = 0.0
+
+    header = "{:<42} {:>8} {:>11} {:>12} {:>12} {:>9}".format("Benchmark", "Ops", "Median (s)", "Per op (us)",
+                                                               "Baseline", "Change")
+    print(header)
+    print("-" * len(header))
+
+    for name, operations, timings in results:
+        median = statistics.median(timings)
+        per_op = median / operations * 1000000
+
+        baseline_per_op = baseline.get(name, {}).get("per_op_us")
+        if baseline_per_op:
+            change = (per_op - baseline_per_op) / baseline_per_op * 100
+            max_change = max(max_change, change)
+            baseline_text, change_text = "{:.2f}".format(baseline_per_op), "{:+.1f}%".format(change)
+        else:
+            baseline_text, change_text = "-", "-"
+
+        print("{:<42} {:>8} {:>11.4f} {:>12.2f} {:>12} {:>9}".format(name, operations, median, per_op,
+                                                                     baseline_text, change_text))
+
+    return max_change
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the KBAToolsLocal species resolution and layer "
+                                                 "planning logic against synthetic national-scale data.")
+    parser.add_argument("--quick", action="store_true", help="use a small data set (for a quick check)")
+    parser.add_argument("--elements", type=int, help="number of Biotics elements")
+    parser.add_argument("--features", type=int, help="number of features across all the feature classes")
+    parser.add_argument("--datasets", type=int, help="number of InputDataset records")
+    parser.add_argument("--samples", type=int, help="number of species looked up / planned per benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs of each benchmark (median is used)")
+    parser.add_argument("--seed", type=int, default=2026, help="seed for the synthetic data")
+    parser.add_argument("--no-indexes", action="store_true", help="don't index speciesid in the feature classes")
+    parser.add_argument("--database", help="SQLite database to reuse (generated if it doesn't exist)")
+    parser.add_argument("--output", help="write the results to a JSON file (to use as a baseline)")
+    parser.add_argument("--baseline", help="JSON results file to compare with")
+    parser.add_argument("--max-regression", type=float,
+                        help="exit with an error if a benchmark is this many percent slower than the baseline")
+    args = parser.parse_args()
+
+    scale = dict(quick_scale if args.quick else national_scale)
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    work_folder = None
+    backend = None
+    database = args.database
+    if database is None:
+        work_folder = tempfile.mkdtemp(prefix="kba_benchmark_")
+        database = os.path.join(work_folder, "kba_benchmark.sqlite")
+
+    try:
+        if not os.path.exists(database):
+            print("Generating {elements} elements, {features} features, {datasets} datasets...".format(**scale),
+                  file=sys.stderr)
+            start = time.perf_counter()
+            species_count, infraspecies_count = generateDatabase(database, scale["elements"], scale["features"],
+                                                                 scale["datasets"], args.seed,
+                                                                 not args.no_indexes)
+            print("Generated {} species and {} infraspecies in {:.1f} s.".format(
+                species_count, infraspecies_count, time.perf_counter() - start), file=sys.stderr)
+
+        backend = KBABackend.SQLiteBackend(database)
+        KBABackend.setBackend(backend)
+
+        print("Running benchmarks...", file=sys.stderr)
+        results = runBenchmarks(scale["samples"], args.repeat, args.seed)
+
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)["results"]
+
+        max_change = printTable(results, baseline)
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as output_file:
+                json.dump({"scale": scale,
+                           "repeat": args.repeat,
+                           "python": sys.version.split()[0],
+                           "results": {name: {"operations": operations,
+                                              "median_s": statistics.median(timings),
+                                              "per_op_us": statistics.median(timings) / operations * 1000000,
+                                              "runs_s": timings}
+                                       for name, operations, timings in results}}, output_file, indent=2)
+
+        if args.max_regression is not None and baseline and max_change > args.max_regression:
+            print("Slowest regression is {:+.1f}%, more than the allowed {}%.".format(max_change,
+                                                                                       args.max_regression),
+                  file=sys.stderr)
+            return 1
+
+        return 0
+
+    finally:
+        if backend is not None:
+            backend.close()
+        if work_folder is not None:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
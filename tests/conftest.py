@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      conftest.py
+#
+# Purpose:          Shared fixtures for the tests of the KBAToolsLocal modules that run without ArcGIS Pro.
+#                   Each test gets a small WCSC-KBA database in SQLite, read through KBABackend.SQLiteBackend, with the
+#                   KBAToolsCache folder next to it, so the session indexes, plan cache and species summary are
+#                   built from scratch for every test.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import os
+import sqlite3
+import sys
+import pytest
+
+# The KBAToolsLocal modules are imported from the toolbox folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "KBAToolsLocal"))
+
+import KBABackend  # noqa: E402
+import KBAIndexes  # noqa: E402
+
+# VARIABLES FOR THE TESTS
+
+# Biotics records: speciesid, element_code, ca_nname_level, national_scientific_name, national_engl_name,
+# national_fr_name. Alpha one has two infraspecies, the other species have none
+biotics_rows = [(1, "A1", "Species", "Alpha one", "Common Alpha", "Alpha commun"),
+                (2, "A2", "Subspecies", "Alpha one ssp. a", "Northern Alpha", None),
+                (3, "A3", "Variety", "Alpha one var. b", "Southern Alpha", None),
+                (4, "B4", "Species", "Beta two", "Common Beta", None),
+                (5, "G5", "Species", "Gamma three", "Common Gamma", "Gamma commun")]
+
+# Species records: speciesid, fullspecies_elementcode
+species_rows = [(1, "A1"), (2, "A1"), (3, "A1"), (4, "B4"), (5, "G5")]
+
+# InputDataset records: inputdatasetid, datasetsourceid. 1 to 5 are ECCC range maps (994), 6 is ECCC critical habitat
+# (19) and the rest are other datasets
+inputdataset_rows = [(1, 994), (2, 994), (3, 994), (4, 994), (5, 994), (6, 19),
+                     (7, 5001), (8, 5001), (9, 5002), (10, 5002), (11, 5003), (12, 5003)]
+
+# Features: speciesid, inputdatasetid (EO_Polygon only has speciesid), with the extent of each feature
+feature_rows = {"InputPoint": [(1, 7, 0, 0, 10, 10), (1, 7, 5, 5, 6, 6), (2, 8, 20, 20, 21, 21),
+                               (4, 9, 100, 100, 101, 101)],
+                "InputLine": [(1, 8, 0, 0, 50, 5)],
+                "InputPolygon": [(1, 1, -10, -10, 0, 0), (1, 2, 0, 0, 30, 30), (2, 6, 10, 10, 12, 12),
+                                 (1, 10, 40, 40, 45, 45), (4, 11, 90, 90, 95, 95), (1, None, 0, 0, 1, 1)],
+                "EO_Polygon": [(1, 0, 0, 2, 2), (3, 60, 60, 70, 70)]}
+
+
+# FUNCTIONS FOR THE TESTS
+def writeDatabase(database):
+    """Write the test tables to a SQLite database. The feature extents are held in GeoPackage style R*Tree spatial
+    indexes, so the species summary has extents to read."""
+    connection = sqlite3.connect(database)
+    connection.executescript("""
+        CREATE TABLE BIOTICS_ELEMENT_NATIONAL (speciesid INTEGER, element_code TEXT, ca_nname_level TEXT,
+                                               national_scientific_name TEXT, national_engl_name TEXT,
+                                               national_fr_name TEXT);
+        CREATE TABLE Species (speciesid INTEGER, fullspecies_elementcode TEXT);
+        CREATE TABLE InputDataset (inputdatasetid INTEGER, datasetsourceid INTEGER);
+        CREATE TABLE gpkg_geometry_columns (table_name TEXT, column_name TEXT);
+    """)
+    connection.executemany("INSERT INTO BIOTICS_ELEMENT_NATIONAL VALUES (?, ?, ?, ?, ?, ?)", biotics_rows)
+    connection.executemany("INSERT INTO Species VALUES (?, ?)", species_rows)
+    connection.executemany("INSERT INTO InputDataset VALUES (?, ?)", inputdataset_rows)
+
+    for ft_type, rows in feature_rows.items():
+        key_fields = ["speciesid"] if ft_type == "EO_Polygon" else ["speciesid", "inputdatasetid"]
+        connection.execute("CREATE TABLE {} ({})".format(ft_type, ", ".join(field + " INTEGER"
+                                                                             for field in key_fields)))
+        connection.execute("CREATE VIRTUAL TABLE rtree_{}_shape USING rtree(id, minx, maxx, miny, maxy)".format(
+            ft_type))
+        connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'shape')", (ft_type,))
+
+        for row in rows:
+            rowid = connection.execute("INSERT INTO {} VALUES ({})".format(
+                ft_type, ", ".join("?" * len(key_fields))), row[:len(key_fields)]).lastrowid
+            xmin, ymin, xmax, ymax = row[len(key_fields):]
+            connection.execute("INSERT INTO rtree_{}_shape VALUES (?, ?, ?, ?, ?)".format(ft_type),
+                               (rowid, xmin, xmax, ymin, ymax))
+
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Return the path of a new test database."""
+    database = str(tmp_path / "kba.sqlite")
+    writeDatabase(database)
+
+    return database
+
+
+@pytest.fixture
+def backend(database, monkeypatch):
+    """Set a SQLiteBackend on the test database as the backend of the scripts. The table stamps are checked on every
+    call, so changes made by a test are seen straight away."""
+    monkeypatch.setattr(KBAIndexes, "stamp_check_interval", 0)
+    KBAIndexes.invalidateIndex()
+
+    sqlite_backend = KBABackend.SQLiteBackend(database)
+    KBABackend.setBackend(sqlite_backend)
+
+    yield sqlite_backend
+
+    KBABackend.setBackend(None)
+    KBAIndexes.invalidateIndex()
+    sqlite_backend.close()
+
+
+def editDatabase(backend, sql, parameters=()):
+    """Run an sql statement that changes the test database. The modified time of the database is moved on, so the
+    table stamps see the edit even if it is made in the same millisecond as the last one."""
+    with backend.connection:
+        backend.connection.execute(sql, parameters)
+
+    modified = os.path.getmtime(backend.database) + 1
+    os.utime(backend.database, (modified, modified))
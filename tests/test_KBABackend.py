@@ -0,0 +1,46 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBABackend.py
+#
+# Purpose:          Tests for the table stamps of the backends in KBABackend.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import os
+import KBABackend
+from conftest import editDatabase
+
+
+# FUNCTIONS FOR THE TESTS
+def touchFile(path, modified):
+    """Write a file with a modified time."""
+    with open(path, "w"):
+        pass
+    os.utime(path, (modified, modified))
+
+
+# TESTS FOR THE TABLE STAMPS
+def test_file_geodatabase_stamp_only_reads_the_table_files(tmp_path):
+    gdb_path = str(tmp_path / "kba.gdb")
+    os.makedirs(gdb_path)
+    touchFile(os.path.join(gdb_path, "a0000000b.gdbtable"), 1000)
+    touchFile(os.path.join(gdb_path, "a0000000b.gdbtablx"), 2000)
+    touchFile(os.path.join(gdb_path, "a0000000c.gdbtable"), 3000)
+    touchFile(os.path.join(gdb_path, "a0000000b.MACHINE.1234.5678.sr.lock"), 4000)
+    touchFile(os.path.join(gdb_path, "_gdb.MACHINE.1234.5678.sr.lock"), 5000)
+
+    # Edits to the other tables and the locks written when the data is opened don't change the stamp
+    assert KBABackend.fileGeodatabaseModified(gdb_path, 11) == 2000
+    assert KBABackend.fileGeodatabaseModified(gdb_path) == 3000
+
+    os.makedirs(str(tmp_path / "empty.gdb"))
+    assert KBABackend.fileGeodatabaseModified(str(tmp_path / "empty.gdb")) == 0.0
+
+
+def test_sqlite_stamp(backend):
+    stamp = backend.tableStamp("InputLine")
+    assert backend.tableStamp("InputLine") == stamp
+
+    # An edit that keeps the row count changes the stamp
+    editDatabase(backend, "UPDATE InputLine SET inputdatasetid = 9")
+    assert backend.tableStamp("InputLine")[0] == stamp[0]
+    assert backend.tableStamp("InputLine") != stamp
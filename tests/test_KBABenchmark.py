@@ -0,0 +1,37 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBABenchmark.py
+#
+# Purpose:          Smoke test for benchmarks/KBABenchmark.py: a run on a very small synthetic database, which also runs
+#                   the checks the benchmark makes on the species search, record counts and replica sync.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import json
+import os
+import subprocess
+import sys
+
+# VARIABLES FOR THE TESTS
+
+# Path of the benchmark script
+benchmark_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "benchmarks", "KBABenchmark.py")
+
+# Size of the synthetic data for the smoke test
+smoke_scale = ["--elements", "200", "--features", "5000", "--datasets", "40", "--samples", "20", "--repeat", "1"]
+
+
+# TESTS FOR KBABENCHMARK
+def test_benchmark_runs(tmp_path):
+    output_path = str(tmp_path / "results.json")
+    run_args = [sys.executable, benchmark_script] + smoke_scale + ["--database", str(tmp_path / "kba.sqlite")]
+
+    subprocess.run(run_args + ["--output", output_path], check=True, capture_output=True)
+
+    with open(output_path, "r", encoding="utf-8") as output_file:
+        results = json.load(output_file)
+    assert results["scale"]["elements"] == 200
+    assert all(result["runs_s"] for result in results["results"].values())
+
+    # A second run reuses the database and compares itself with the first run
+    benchmark_run = subprocess.run(run_args + ["--baseline", output_path], check=True, capture_output=True, text=True)
+    assert "Baseline" in benchmark_run.stdout
@@ -0,0 +1,52 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBAEngine.py
+#
+# Purpose:          Tests for the group layers compiled from plan requests by KBAEngine.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import pytest
+import KBAEngine
+
+
+# FUNCTIONS FOR THE TESTS
+def compileGroups(*plan_requests):
+    """Return the [group layer name, speciesid values] of each group compiled from the plan requests."""
+    output_plan = KBAEngine.compilePlan(KBAEngine.resolveRequests(list(plan_requests)))
+    return [[output_group.name, output_group.speciesids] for output_group in output_plan.groups]
+
+
+# TESTS FOR KBAENGINE
+def test_single_grouping(backend):
+    assert compileGroups(KBAEngine.PlanRequest("Alpha one"), KBAEngine.PlanRequest("Beta two")) == \
+        [["Common Alpha (Alpha one) including data identified to infraspecies", [1, 2, 3]],
+         ["Common Beta (Beta two)", [4]]]
+
+
+def test_separate_grouping(backend):
+    assert compileGroups(KBAEngine.PlanRequest("Alpha one", "separate", french_names=True)) == \
+        [["Alpha commun (Alpha one) data not identified to infraspecies", [1]],
+         ["Northern Alpha (Alpha one ssp. a)", [2]],
+         ["Southern Alpha (Alpha one var. b)", [3]]]
+
+
+def test_include_parent(backend):
+    # The infraspecies has no French name, so the English names are used for both groups
+    assert compileGroups(KBAEngine.PlanRequest("Alpha one var. b", include_parent=True, french_names=True)) == \
+        [["Southern Alpha (Alpha one var. b)", [3]],
+         ["Common Alpha (Alpha one) data not identified to infraspecies", [1]]]
+
+
+def test_compiled_layers_and_empty_groups(backend):
+    output_plan = KBAEngine.compilePlan(KBAEngine.resolveRequests([KBAEngine.PlanRequest("Beta two"),
+                                                                   KBAEngine.PlanRequest("Gamma three")]))
+
+    assert [output_lyr.name for output_lyr in output_plan.groups[0].output_lyrs] == ["InputPoint 4 (1 record)",
+                                                                                     "InputPolygon 4 (1 record)"]
+    assert [output_group.empty_warning for output_group in output_plan.emptyGroups()] == \
+        ["There is no spatial data for Gamma three."]
+
+
+def test_unknown_grouping():
+    with pytest.raises(ValueError):
+        KBAEngine.PlanRequest("Alpha one", "merged")
@@ -0,0 +1,87 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBAGeneralize.py
+#
+# Purpose:          Tests for the tolerances and map scales of the generalized polygons chosen by KBAGeneralize.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import json
+import os
+import KBAEngine
+import KBAGeneralize
+from conftest import editDatabase
+
+
+# FUNCTIONS FOR THE TESTS
+def writeGeneralizedStamp(tolerances, meters_per_unit=1.0):
+    """Write the stamp of generalized polygons built from the current data, as buildGeneralized does, with the
+    tolerances in metres."""
+    os.makedirs(KBAGeneralize.generalizedWorkspace(), exist_ok=True)
+    with open(KBAGeneralize._stampPath(), "w", encoding="utf-8") as stamp_file:
+        json.dump({"stamp": KBAGeneralize._sourceStamp(), "tolerances": tolerances,
+                   "meters_per_unit": meters_per_unit}, stamp_file)
+
+
+# TESTS FOR KBAGENERALIZE
+def test_choose_tolerance():
+    tolerances = [50, 500, 5000]
+
+    assert KBAGeneralize.chooseTolerance([0, 0, 2000000, 10], tolerances) == 500
+    assert KBAGeneralize.chooseTolerance([0, 0, 10, 20000000], tolerances) == 5000
+    assert KBAGeneralize.chooseTolerance([0, 0, 100000, 100000], tolerances) == 50
+    assert KBAGeneralize.chooseTolerance([0, 0, 99999, 99999], tolerances) is None
+    assert KBAGeneralize.chooseTolerance([None] * 4, tolerances) is None
+    assert KBAGeneralize.chooseTolerance(None, tolerances) is None
+
+    # The tolerances are in metres and the extent in the unit of the coordinate system, e.g. kilometres
+    assert KBAGeneralize.chooseTolerance([0, 0, 2000, 10], tolerances, 1000) == 500
+
+
+def test_display_scale():
+    assert round(KBAGeneralize.displayScale(500)) == 1785714
+
+
+def test_plan_is_left_at_full_resolution_without_generalized_polygons(backend):
+    output_plan = KBAEngine.compilePlan(KBAEngine.resolveRequests([KBAEngine.PlanRequest("Alpha one")]))
+
+    assert KBAGeneralize.readGeneralizedStamp() is None
+    assert KBAGeneralize.generalizePlan(output_plan) is None
+    assert all(output_lyr.generalized_path is None for output_lyr in output_plan.groups[0].output_lyrs)
+
+
+def test_generalized_layers(backend):
+    # The Alpha one features are 80 units (80 km) across, which only suits the finest tolerance
+    writeGeneralizedStamp([10, 1000], 1000)
+    output_plan = KBAEngine.compilePlan(KBAEngine.resolveRequests([KBAEngine.PlanRequest("Alpha one")]))
+    generalized_lyrs = KBAGeneralize.generalizePlan(output_plan)
+
+    assert [output_lyr.dataset_key for output_lyr in generalized_lyrs] == ["ECCCRangeMaps", "ECCCCriticalHabitatMaps"]
+    assert generalized_lyrs[0].generalized_path == KBAGeneralize.generalizedPath(10)
+    assert generalized_lyrs[0].generalized_name == "ECCC Range Map 1+ (2 records) [generalized 10]"
+    assert round(generalized_lyrs[0].generalized_scale) == round(KBAGeneralize.displayScale(10))
+
+    # The sql query of the generalized layer selects the same features from the copy, which has the InputDataset table
+    assert backend.countRows("InputPolygon", generalized_lyrs[0].generalized_sql) == 2
+    assert backend.countRows("InputPolygon", generalized_lyrs[1].generalized_sql) == 1
+
+    # The output layers keep their names and sources
+    assert generalized_lyrs[0].name == "ECCC Range Map 1+ (2 records)"
+    assert generalized_lyrs[0].ft_type == "InputPolygon"
+
+
+def test_generalized_polygons_are_dropped_when_the_data_changes(backend):
+    writeGeneralizedStamp([50])
+    assert KBAGeneralize.readGeneralizedStamp()["tolerances"] == [50]
+
+    editDatabase(backend, "DELETE FROM InputPolygon WHERE inputdatasetid = 11")
+
+    assert KBAGeneralize.readGeneralizedStamp() is None
+
+
+def test_generalized_polygons_of_an_earlier_version_are_dropped(backend, monkeypatch):
+    # The copies written with the tolerances in the unit of the coordinate system are built again
+    monkeypatch.setattr(KBAGeneralize, "generalized_version", 1)
+    writeGeneralizedStamp([0.01])
+    monkeypatch.undo()
+
+    assert KBAGeneralize.readGeneralizedStamp() is None
@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBAIndexes.py
+#
+# Purpose:          Tests for the background warm-up of the index cache files in KBAIndexes.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import os
+import pytest
+import KBABackend
+import KBAIndexes
+from conftest import editDatabase
+
+
+# CLASSES FOR THE TESTS
+class NoBackend:
+    """A backend that fails the test if it is used."""
+
+    def __getattr__(self, name):
+        raise AssertionError("The warm-up used the backend ({}).".format(name))
+
+
+# FIXTURES FOR THE TESTS
+@pytest.fixture
+def warm_up(backend, monkeypatch):
+    """Reset the warm-up, so it can be started by the test."""
+    monkeypatch.delenv(KBAIndexes.no_warm_up_variable, raising=False)
+    monkeypatch.setattr(KBAIndexes, "_warm_up_thread", None)
+    monkeypatch.setattr(KBAIndexes, "_warm_up_contents", {})
+    monkeypatch.setattr(KBAIndexes, "_warm_up_errors", [])
+
+
+# TESTS FOR THE WARM-UP
+def test_warm_up_only_reads_the_cache_files(warm_up):
+    KBAIndexes.readTaxonHierarchy()
+    folder = KBAIndexes.cacheFolder()
+
+    # The background thread doesn't touch the backend (arcpy in ArcGIS Pro)
+    KBABackend.setBackend(NoBackend())
+    KBAIndexes._warmUp(folder)
+
+    assert sorted(KBAIndexes._warm_up_contents) == [os.path.join(folder, "taxon_hierarchy.json")]
+    assert KBAIndexes._warm_up_errors == []
+
+
+def test_warm_up_contents_are_used_once(warm_up):
+    taxon_hierarchy = KBAIndexes.readTaxonHierarchy()
+    KBAIndexes.invalidateIndex()
+
+    assert KBAIndexes.startWarmUp()
+    assert not KBAIndexes.startWarmUp()
+    KBAIndexes._warm_up_thread.join()
+    assert KBAIndexes.readWarmUpStatus() == "finished"
+
+    assert KBAIndexes.readTaxonHierarchy() == taxon_hierarchy
+    assert KBAIndexes._warm_up_contents == {}
+
+
+def test_warm_up_contents_are_checked_against_the_tables(warm_up, backend):
+    KBAIndexes.readTaxonHierarchy()
+    KBAIndexes.invalidateIndex()
+    KBAIndexes.startWarmUp()
+    KBAIndexes._warm_up_thread.join()
+
+    # The file read by the warm-up is out of date, so the tool rebuilds the index
+    editDatabase(backend, "UPDATE BIOTICS_ELEMENT_NATIONAL SET national_engl_name = 'Alpha' WHERE speciesid = 1")
+    assert KBAIndexes.readTaxonHierarchy()["records"]["1"][4] == "Alpha"
+
+
+def test_warm_up_reports_unreadable_files(warm_up):
+    folder = KBAIndexes.cacheFolder()
+    with open(os.path.join(folder, "species_names.json"), "w", encoding="utf-8") as cache_file:
+        cache_file.write("{")
+
+    KBAIndexes._warmUp(folder)
+
+    assert [file_name for file_name, _ in KBAIndexes._warm_up_errors] == ["species_names.json"]
+    assert KBAIndexes.readSpeciesNames() == ["Alpha one", "Beta two", "Gamma three"]
@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBAPlanCache.py
+#
+# Purpose:          Tests for the output layers kept in the plan cache by KBAPlanCache.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import os
+import KBAPlanCache
+import KBAPlanner
+from conftest import editDatabase
+
+
+# FUNCTIONS FOR THE TESTS
+def layerValues(group_lyrs):
+    """Return the name, sql query and filtered dataset of the output layers of each group."""
+    return [[(output_lyr.name, output_lyr.sql, output_lyr.dataset_key) for output_lyr in output_lyrs]
+            for output_lyrs in group_lyrs]
+
+
+def groupExtents(group_lyrs):
+    """Return the extent of each group of output layers, read from the extent matrix."""
+    output_plan = KBAPlanner.OutputPlan()
+    for output_lyrs in group_lyrs:
+        output_plan.addGroup("", output_lyrs[0].speciesids, output_lyrs, "")
+
+    KBAPlanner.planGroupExtents(output_plan)
+    return [output_group.extent for output_group in output_plan.groups]
+
+
+# TESTS FOR KBAPLANCACHE
+def test_cached_layers_match_the_planned_layers(backend):
+    speciesid_groups = [[1, 2, 3], [4], [5]]
+    planned_lyrs = KBAPlanCache.planGroupLayers("test", speciesid_groups)
+
+    assert os.path.exists(KBAPlanCache.cachePath())
+    assert sorted(KBAPlanCache.readCachedLayers("test", speciesid_groups)) == [0, 1, 2]
+    assert layerValues(KBAPlanCache.planGroupLayers("test", speciesid_groups)) == layerValues(planned_lyrs)
+
+    # The entries are kept for each tool
+    assert KBAPlanCache.readCachedLayers("other", speciesid_groups) == {}
+
+
+def test_cached_layers_have_the_same_extents(backend):
+    # A feature without an inputdatasetid far from the other features of the species, which none of the InputPolygon
+    # output layers select
+    with backend.connection:
+        rowid = backend.connection.execute("INSERT INTO InputPolygon VALUES (4, NULL)").lastrowid
+        backend.connection.execute("INSERT INTO rtree_InputPolygon_shape VALUES (?, 500, 600, 500, 600)", (rowid,))
+
+    speciesid_groups = [[1, 2, 3], [4]]
+    planned_extents = groupExtents(KBAPlanCache.planGroupLayers("test", speciesid_groups))
+    assert sorted(KBAPlanCache.readCachedLayers("test", speciesid_groups)) == [0, 1]
+
+    assert planned_extents[1] == [90, 90, 101, 101]
+    assert groupExtents(KBAPlanCache.planGroupLayers("test", speciesid_groups)) == planned_extents
+
+
+def test_cache_is_dropped_when_the_data_changes(backend):
+    KBAPlanCache.planGroupLayers("test", [[4]])
+    editDatabase(backend, "INSERT INTO InputLine VALUES (4, 12)")
+
+    assert KBAPlanCache.readCachedLayers("test", [[4]]) == {}
+    assert [output_lyr.name for output_lyr in KBAPlanCache.planGroupLayers("test", [[4]])[0]] == \
+        ["InputPoint 4 (1 record)", "InputLine 4 (1 record)", "InputPolygon 4 (1 record)"]
+
+
+def test_cache_is_off_without_table_stamps(backend, monkeypatch):
+    KBAPlanCache.planGroupLayers("test", [[4]])
+
+    # Changes to a table without a stamp can't be detected, so the cached layers are never used for it
+    monkeypatch.setattr(backend, "tableStamp", lambda table: None)
+
+    assert KBAPlanCache.snapshotVersion(True) is None
+    assert KBAPlanCache.readCachedLayers("test", [[4]]) == {}
+    assert len(KBAPlanCache.planGroupLayers("test", [[4]])[0]) == 2
+
+
+def test_clear_cache(backend):
+    KBAPlanCache.planGroupLayers("test", [[1]])
+    KBAPlanCache.clearCache()
+
+    assert KBAPlanCache.readCachedLayers("test", [[1]]) == {}
@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBAPlanner.py
+#
+# Purpose:          Tests for the Biotics lookups and the output layers planned by KBAPlanner.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import pytest
+import KBAExceptions
+import KBAPlanner
+
+
+# TESTS FOR THE BIOTICS LOOKUPS
+def test_biotics_records(backend):
+    record = KBAPlanner.readBioticsRecord("Alpha one")
+
+    assert record.speciesid == 1
+    assert record.isFullSpecies()
+    assert KBAPlanner.readBioticsRecordById(4).sci_name == "Beta two"
+    assert KBAPlanner.readBioticsRecordByElementCode("A3").speciesid == 3
+
+    with pytest.raises(KBAExceptions.BioticsError):
+        KBAPlanner.readBioticsRecord("Unknown")
+
+
+def test_infraspecies_and_parent(backend):
+    assert KBAPlanner.readInfraspeciesIds("A1", 1) == [2, 3]
+    assert KBAPlanner.readInfraspeciesIds("B4", 4) == []
+    assert KBAPlanner.readFullSpeciesElementCode(3) == "A1"
+    assert KBAPlanner.readInfraspeciesIdDict([KBAPlanner.readBioticsRecordById(1)]) == {"A1": [1, 2, 3]}
+
+
+# TESTS FOR THE OUTPUT LAYERS
+def test_layer_names_and_queries():
+    assert KBAPlanner.layerName("InputPoint", [1]) == "InputPoint 1"
+    assert KBAPlanner.layerName("InputPoint", [1, 2]) == "InputPoint 1+"
+    assert KBAPlanner.speciesQuery([1]) == "speciesid = 1"
+    assert KBAPlanner.speciesQuery([1, 2]) == "speciesid IN (1, 2)"
+
+
+def test_matrix_counts_match_the_queries(backend):
+    # Every planned layer is counted the same from the count matrix as by running its sql query
+    filtered_id_dict = KBAPlanner.readFilteredIdDict()
+    count_matrix = KBAPlanner.readCountMatrix([1, 2, 3, 4, 5])
+
+    for speciesids in [[1, 2, 3], [1], [2], [4], [5]]:
+        for output_lyr in KBAPlanner.planSpeciesLayers(speciesids, filtered_id_dict):
+            assert KBAPlanner.matrixOutputRows(count_matrix, output_lyr) == KBAPlanner.countOutputRows(output_lyr)
+
+
+def test_counted_layers(backend):
+    output_lyrs = KBAPlanner.planCountedLayers([1, 2, 3], KBAPlanner.readFilteredIdDict(),
+                                               KBAPlanner.readCountMatrix([1, 2, 3]))
+
+    # The filtered datasets without InputDataset records aren't planned, and the empty layers are left out
+    assert [output_lyr.name for output_lyr in output_lyrs] == ["InputPoint 1+ (3 records)",
+                                                               "InputLine 1+ (1 record)",
+                                                               "EO_Polygon 1+ (2 records)",
+                                                               "ECCC Range Map 1+ (2 records)",
+                                                               "ECCC Critical Habitat 1+ (1 record)",
+                                                               "InputPolygon 1+ (1 record)"]
+    assert [output_lyr.dataset_key for output_lyr in output_lyrs][3:] == ["ECCCRangeMaps", "ECCCCriticalHabitatMaps",
+                                                                          None]
+    assert KBAPlanner.planCountedLayers([5], KBAPlanner.readFilteredIdDict(), KBAPlanner.readCountMatrix([5])) == []
+
+
+def test_group_extents(backend):
+    output_plan = KBAPlanner.OutputPlan()
+    for speciesids in [[4], [5]]:
+        output_plan.addGroup(str(speciesids), speciesids, KBAPlanner.planCountedLayers(
+            speciesids, KBAPlanner.readFilteredIdDict(), KBAPlanner.readCountMatrix(speciesids)), "")
+
+    assert KBAPlanner.planGroupExtents(output_plan) == [90, 90, 101, 101]
+    assert [output_group.extent for output_group in output_plan.groups] == [[90, 90, 101, 101], None]
+    assert output_plan.emptyGroups() == [output_plan.groups[1]]
+    assert output_plan.layerCount() == 2
+
+
+def test_union_extent():
+    assert KBAPlanner.unionExtent([None, [0, 0, 1, 1], [None] * 4, [-1, 0.5, 0.5, 3]]) == [-1, 0, 1, 3]
+    assert KBAPlanner.unionExtent([None]) is None
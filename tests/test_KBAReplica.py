@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBAReplica.py
+#
+# Purpose:          Tests for the changed keys found by KBAReplica and for syncing a SQLite replica, including a replica
+#                   that stores the change timestamps at a different precision.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import datetime
+import struct
+import pytest
+import KBABackend
+import KBAIndexes
+import KBAReplica
+from conftest import editDatabase
+
+
+# FIXTURES FOR THE TESTS
+@pytest.fixture
+def replica(tmp_path):
+    """Return a SQLiteBackend on an empty replica database."""
+    replica_backend = KBABackend.SQLiteBackend(str(tmp_path / "replica.sqlite"))
+    yield replica_backend
+    replica_backend.close()
+
+
+# FUNCTIONS FOR THE TESTS
+def tableRows(backend, table):
+    """Return the sorted rows of a table."""
+    return sorted(backend.readRows(table, backend.fieldNames(table)), key=lambda row: [(v is None, v) for v in row])
+
+
+# TESTS FOR KBAREPLICA
+def test_key_query():
+    assert KBAReplica.keyQuery(["speciesid"], [(1,), (2,)]) == "speciesid IN (1, 2)"
+    assert KBAReplica.keyQuery(["speciesid"], [(None,)]) == "speciesid IS NULL"
+    assert KBAReplica.keyQuery(["inputdatasetid", "speciesid"], [(12, 1), (12, 2), (None, 3)]) == \
+        "(inputdatasetid IN (12) And speciesid IN (1, 2)) Or (inputdatasetid IS NULL And speciesid IN (3))"
+
+
+def test_changed_keys():
+    source_signatures = {(1,): (1, 10), (2,): (2, 20), (None,): (1, 30)}
+    replica_signatures = {(1,): (1, 10), (2,): (2, 21), (3,): (1, 40)}
+
+    # Edited, deleted and new keys are changed, with the null values last
+    assert KBAReplica.changedKeys(source_signatures, replica_signatures) == [(2,), (3,), (None,)]
+    assert KBAReplica.changedKeys(source_signatures, source_signatures) == []
+
+
+def test_sync_table(backend, replica):
+    table_sync = KBAReplica.syncTable(backend, replica, "InputPolygon")
+
+    assert table_sync.created
+    assert table_sync.pulled_count == len(tableRows(backend, "InputPolygon"))
+    assert tableRows(replica, "InputPolygon") == tableRows(backend, "InputPolygon")
+    assert KBAReplica.syncTable(backend, replica, "InputPolygon").changed_keys == 0
+
+
+def test_sync_changed_keys(backend, replica):
+    list(KBAReplica.syncReplica(backend, replica))
+
+    # A feature moved to another species changes two keys, and a deleted feature one
+    editDatabase(backend, "UPDATE InputPolygon SET speciesid = 5 WHERE inputdatasetid = 11")
+    editDatabase(backend, "DELETE FROM InputPolygon WHERE inputdatasetid = 2")
+
+    table_syncs = list(KBAReplica.syncReplica(backend, replica, ["InputPolygon", "EO_Polygon"]))
+    assert [table_sync.changed_keys for table_sync in table_syncs] == [3, 0]
+    assert table_syncs[0].deleted_count == 2
+    assert table_syncs[0].pulled_count == 1
+    assert KBAReplica.changedInputDatasetIds(table_syncs) == [2, 11]
+    assert tableRows(replica, "InputPolygon") == tableRows(backend, "InputPolygon")
+
+
+def test_sync_attribute_edit(backend, replica):
+    KBAReplica.syncTable(backend, replica, KBAIndexes.biotics_table)
+
+    # An edit that keeps the keys and the row count is found from the checksum of the attribute values
+    editDatabase(backend, "UPDATE BIOTICS_ELEMENT_NATIONAL SET national_fr_name = 'Bêta' WHERE speciesid = 4")
+
+    table_sync = KBAReplica.syncTable(backend, replica, KBAIndexes.biotics_table)
+    assert table_sync.changed_keys == 1
+    assert tableRows(replica, KBAIndexes.biotics_table) == tableRows(backend, KBAIndexes.biotics_table)
+
+
+def test_signature_values():
+    assert KBAReplica._signatureValue("2026-05-01 10:00:00.723456") == \
+        KBAReplica._signatureValue(datetime.datetime(2026, 5, 1, 10, 0, 0, 723000)) == \
+        KBAReplica._signatureValue("2026-05-01T10:00:01Z") == datetime.datetime(2026, 5, 1, 10, 0, 1)
+    # A double written to a single precision field
+    assert KBAReplica._signatureValue(struct.unpack("f", struct.pack("f", 0.1))[0]) == KBAReplica._signatureValue(0.1)
+    assert KBAReplica._signatureValue("2026-05-01 Alpha") == "2026-05-01 Alpha"
+
+
+def test_sync_dates_stored_at_another_precision(backend, replica):
+    editDatabase(backend, "ALTER TABLE InputPolygon ADD COLUMN last_edited_date TEXT")
+    editDatabase(backend, "UPDATE InputPolygon SET last_edited_date = "
+                          "'2026-05-01 10:00:0' || (rowid % 10) || '.' || printf('%06d', rowid * 123457 % 1000000)")
+    KBAReplica.syncTable(backend, replica, "InputPolygon")
+
+    # The replica stores the dates to the millisecond as ISO 8601 text, like a GeoPackage
+    replica.connection.execute("UPDATE InputPolygon SET last_edited_date = "
+                               "replace(substr(last_edited_date, 1, 23), ' ', 'T') || 'Z'")
+    replica.connection.commit()
+    assert KBAReplica.syncTable(backend, replica, "InputPolygon").changed_keys == 0
+
+    # An edit is still found
+    editDatabase(backend, "UPDATE InputPolygon SET last_edited_date = '2026-06-01 08:00:00' WHERE inputdatasetid = 11")
+    assert KBAReplica.syncTable(backend, replica, "InputPolygon").changed_keys == 1
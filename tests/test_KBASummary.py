@@ -0,0 +1,66 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBASummary.py
+#
+# Purpose:          Tests for the species summary table built and refreshed by KBASummary.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import KBAPlanner
+import KBASummary
+from conftest import editDatabase
+
+
+# FUNCTIONS FOR THE TESTS
+def backendCountMatrix(backend, speciesids):
+    """Return the count matrix of the speciesid values counted directly from the feature classes."""
+    count_matrix = {}
+    for ft_type, group_fields in KBASummary.summary_fields.items():
+        species_counts = count_matrix.setdefault(ft_type, {})
+        for group, row_count in backend.countGroups(ft_type, group_fields,
+                                                    KBAPlanner.speciesQuery(speciesids)).items():
+            species_counts.setdefault(group[0], {})[group[1] if len(group) > 1 else None] = row_count
+
+    return count_matrix
+
+
+# TESTS FOR KBASUMMARY
+def test_summary_matches_the_feature_classes(backend):
+    assert KBASummary.readSummaryCountMatrix([1]) == {}
+    assert set(KBASummary.refreshSummary().values()) == {"rebuilt"}
+    assert set(KBASummary.refreshSummary().values()) == {"current"}
+
+    speciesids = [1, 2, 3, 4, 5]
+    assert KBASummary.readSummaryCountMatrix(speciesids) == backendCountMatrix(backend, speciesids)
+    assert KBASummary.readSummaryExtentMatrix([2])["InputPoint"] == {2: {8: (20, 20, 21, 21)}}
+
+
+def test_incremental_refresh(backend):
+    KBASummary.refreshSummary()
+
+    # A feature moved to another species keeps the row count of the feature class, and is still found
+    editDatabase(backend, "UPDATE InputPoint SET speciesid = 5 WHERE inputdatasetid = 9")
+
+    # The changed feature class isn't read from the summary until it is refreshed
+    assert "InputPoint" not in KBASummary.readSummaryCountMatrix([4, 5])
+
+    refresh_results = KBASummary.refreshSummary()
+    assert refresh_results["InputPoint"] == 1
+    assert refresh_results["EO_Polygon"] == "rebuilt"
+
+    speciesids = [1, 2, 3, 4, 5]
+    assert KBASummary.readSummaryCountMatrix(speciesids) == backendCountMatrix(backend, speciesids)
+
+
+def test_refresh_listed_input_datasets(backend):
+    KBASummary.refreshSummary()
+
+    assert KBASummary.refreshSummary([7, 8])["InputPoint"] == 2
+    assert KBASummary.refreshSummary(rebuild=True)["InputLine"] == "rebuilt"
+
+
+def test_summary_is_rebuilt_without_table_stamps(backend, monkeypatch):
+    KBASummary.refreshSummary()
+    monkeypatch.setattr(backend, "tableStamp", lambda table: None)
+
+    assert set(KBASummary.refreshSummary().values()) == {"rebuilt"}
+    assert KBASummary.readSummaryCountMatrix([1]) == {}
@@ -0,0 +1,137 @@
+# ----------------------------------------------------------------------------------------------------------------------
+# Script Name:      test_KBAUtils.py
+#
+# Purpose:          Tests for the id sets, sql predicates and species records in KBAUtils.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import libraries
+import sqlite3
+import pytest
+import KBABackend
+import KBAUtils
+
+
+# FIXTURES FOR THE TESTS
+@pytest.fixture
+def qualified_backend(database, backend):
+    """Set a SQLiteBackend on a copy of the test database whose InputDataset table has an owner-qualified name, as in
+    an enterprise geodatabase (kba.InputDataset)."""
+    with sqlite3.connect(database) as connection:
+        connection.execute('ALTER TABLE InputDataset RENAME TO "kba.InputDataset"')
+
+    qualified_backend = KBABackend.SQLiteBackend(database)
+    qualified_backend.table_names = dict(qualified_backend.table_names, InputDataset="kba.InputDataset")
+    KBABackend.setBackend(qualified_backend)
+
+    yield qualified_backend
+
+    KBABackend.setBackend(backend)
+    qualified_backend.close()
+
+
+# TESTS FOR IDSET
+def test_id_set_drops_duplicates_and_nulls():
+    id_set = KBAUtils.IdSet([5, 3, None, 5, 1])
+
+    assert list(id_set) == [1, 3, 5]
+    assert len(id_set) == 3
+    assert 3 in id_set
+    assert 4 not in id_set
+    assert None not in id_set
+
+
+def test_id_set_union_and_difference():
+    id_set = KBAUtils.IdSet([1, 2, 3, 10])
+
+    assert list(id_set.union([3, 4], KBAUtils.IdSet([20]))) == [1, 2, 3, 4, 10, 20]
+    assert list(id_set | [0]) == [0, 1, 2, 3, 10]
+    assert list(id_set.difference([2, 10, 99])) == [1, 3]
+    assert list(id_set - id_set) == []
+
+
+def test_id_set_equality_and_hash():
+    assert KBAUtils.IdSet([2, 1]) == KBAUtils.IdSet([1, 2, 2])
+    assert hash(KBAUtils.IdSet([2, 1])) == hash(KBAUtils.IdSet([1, 2]))
+    assert KBAUtils.IdSet([1]) != [1]
+    assert KBAUtils.asIdSet(KBAUtils.IdSet([1])) == KBAUtils.IdSet([1])
+
+
+def test_id_set_ranges():
+    assert KBAUtils.IdSet([1, 2, 3, 7, 9, 10]).ranges() == [(1, 3), (7, 7), (9, 10)]
+    assert KBAUtils.IdSet().ranges() == []
+
+
+# TESTS FOR THE PREDICATES
+def test_id_predicate():
+    assert KBAUtils.idPredicate("speciesid", [4]) == "speciesid = 4"
+    assert KBAUtils.idPredicate("speciesid", [9, 3, 3]) == "speciesid IN (3, 9)"
+    assert KBAUtils.idPredicate("speciesid", [1, 2, 3]) == "speciesid BETWEEN 1 And 3"
+    assert KBAUtils.idPredicate("inputdatasetid", [3, 9, 20, 21, 22]) == \
+        "(inputdatasetid IN (3, 9) Or inputdatasetid BETWEEN 20 And 22)"
+    assert KBAUtils.idPredicate("speciesid", [1, 2], True) == "NOT speciesid IN (1, 2)"
+
+
+def test_id_predicate_without_ids():
+    with pytest.raises(ValueError):
+        KBAUtils.idPredicate("speciesid", [None])
+
+
+def test_input_dataset_predicate_uses_subquery_for_long_lists(monkeypatch):
+    monkeypatch.setattr(KBAUtils, "_predicate_cache", {})
+
+    # One more listed id than the threshold
+    inputdatasetids = range(1, 2 * KBAUtils.predicate_term_threshold + 3, 2)
+
+    assert KBAUtils.inputDatasetPredicate(inputdatasetids, ["994", "19"], True, "InputDataset") == \
+        "inputdatasetid NOT IN (SELECT inputdatasetid FROM InputDataset WHERE datasetsourceid IN (19, 994))"
+
+    # Without the datasetsourceid values the ids are listed, and short lists are always listed
+    assert KBAUtils.inputDatasetPredicate(inputdatasetids).startswith("inputdatasetid IN (1, 3, 5")
+    assert KBAUtils.inputDatasetPredicate([1, 2, 3, 4], ["994"], subquery_table="InputDataset") == \
+        "inputdatasetid BETWEEN 1 And 4"
+
+
+def test_predicates_select_the_same_rows(backend, monkeypatch):
+    monkeypatch.setattr(KBAUtils, "predicate_term_threshold", 0)
+
+    # The listed ids and the subquery select the same features
+    listed_sql = KBAUtils.idPredicate("inputdatasetid", [1, 2, 3, 4, 5, 6], True)
+    subquery_sql = KBAUtils.inputDatasetPredicate([1, 2, 3, 4, 5, 6], ["994", "19"], True)
+
+    assert "SELECT" in subquery_sql
+    assert backend.countRows("InputPolygon", listed_sql) == backend.countRows("InputPolygon", subquery_sql) == 2
+
+
+def test_subquery_uses_the_qualified_table_name(qualified_backend, monkeypatch):
+    monkeypatch.setattr(KBAUtils, "predicate_term_threshold", 0)
+    subquery_sql = KBAUtils.inputDatasetPredicate([1, 2, 3, 4, 5, 6], ["994", "19"], True)
+
+    assert 'FROM "kba.InputDataset"' in subquery_sql
+    assert qualified_backend.countRows("InputPolygon", subquery_sql) == 2
+
+
+def test_ids_are_listed_if_the_table_name_is_not_resolved(backend, monkeypatch):
+    monkeypatch.setattr(KBAUtils, "predicate_term_threshold", 0)
+    monkeypatch.setattr(backend, "subqueryTableName", lambda table, query_table: None)
+
+    assert KBAUtils.inputDatasetPredicate([1, 2, 3, 4, 5, 6], ["994", "19"], True) == \
+        "NOT inputdatasetid BETWEEN 1 And 6"
+
+
+def test_filtered_input_dataset_ids(backend):
+    assert list(KBAUtils.readFilteredInputDatasetID("994")) == [1, 2, 3, 4, 5]
+    assert list(KBAUtils.readFilteredInputDatasetID("996")) == []
+    assert list(KBAUtils.unionIdSets([KBAUtils.readFilteredInputDatasetID("994"),
+                                      KBAUtils.readFilteredInputDatasetID("19")])) == [1, 2, 3, 4, 5, 6]
+
+
+# TESTS FOR THE SPECIES RECORDS
+def test_species_records(backend):
+    skipped_values = []
+    records = list(KBAUtils.fullSpeciesRecords(
+        KBAUtils.streamSpeciesRecords(["Alpha one", "4", "Alpha one ssp. a", "Unknown", 1]),
+        lambda value, record: skipped_values.append(value)))
+
+    assert [record.speciesid for record in records] == [1, 4]
+    assert skipped_values == ["Alpha one ssp. a", "Unknown"]
+    assert [len(buffer) for buffer in KBAUtils.bufferSpeciesRecords(range(5), 2)] == [2, 2, 1]